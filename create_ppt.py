@@ -1,15 +1,40 @@
 """
 Create PowerPoint presentation for Taobao Maternity Analysis
+Every number comes from the pipeline outputs (overview, RFM, category, trend
+and profile tables) and the generated figures are embedded, so the deck is
+rebuilt rather than re-edited when the data changes.
+
+    python create_ppt.py                          # main deck
+    python create_ppt.py --by segment             # one deck per RFM segment
+    python create_ppt.py --by category            # one deck per product category
+    python create_ppt.py --template brand.pptx --output-dir reports/
+
+Batch runs load the metrics and the template once and reuse them for every
+deck; nothing is recomputed from trade rows (category decks read the cube).
 """
+import argparse
+import sys
+from io import BytesIO
+from pathlib import Path
+
 from pptx import Presentation
 from pptx.util import Inches, Pt
-from pptx.enum.text import PP_ALIGN
-from pptx.dml.color import RGBColor
 
-# Create presentation
-prs = Presentation()
-prs.slide_width = Inches(13.333)
-prs.slide_height = Inches(7.5)
+PROJECT_DIR = Path(__file__).parent
+sys.path.insert(0, str(PROJECT_DIR / "src"))
+
+REPORT_NAME = "Taobao_Maternity_Analysis_Report.pptx"
+SEGMENT_LABELS = {
+    'Champions': '冠军客户',
+    'Loyal Customers': '重要保持客户',
+    'At Risk': '重要挽留客户',
+    'New Customers': '重要发展客户',
+    'Cannot Lose Them': '不可失去客户',
+    'Others': '一般客户',
+}
+AGE_LABELS = {'0-6m': '0-6个月', '6-12m': '6-12个月', '1-2y': '1-2岁', '2-3y': '2-3岁', '3y+': '3岁以上'}
+GENDER_LABELS = {'Female': '女婴', 'Male': '男婴', 'Unknown': '未知性别'}
+
 
 # Helper functions
 def add_title_slide(prs, title, subtitle):
@@ -23,10 +48,10 @@ def add_content_slide(prs, title, content_list):
     slide_layout = prs.slide_layouts[1]  # Title and content
     slide = prs.slides.add_slide(slide_layout)
     slide.shapes.title.text = title
-    
+
     body_shape = slide.placeholders[1]
     tf = body_shape.text_frame
-    
+
     for i, text in enumerate(content_list):
         if i == 0:
             tf.text = text
@@ -36,75 +61,313 @@ def add_content_slide(prs, title, content_list):
             p.level = 0
     return slide
 
-# Slide 1: Title
-add_title_slide(prs, 
-    "淘宝母婴购物数据分析",
-    "Taobao Maternity Shopping Data Analysis\\n\\n基于阿里云天池数据集\\n2026年2月")
-
-# Slide 2: Project Overview
-add_content_slide(prs, "项目概述", [
-    "分析目标：洞察母婴电商平台用户行为和商品偏好",
-    "数据规模：1,000位用户，15,000条交易记录",
-    "时间跨度：2012-2015年",
-    "核心指标：用户画像、商品分析、时间趋势、RFM价值分析",
-    "数据来源：阿里云天池数据集 #45"
-])
-
-# Slide 3: Key Findings
-add_content_slide(prs, "核心发现", [
-    "冠军客户占比14.5%，是平台核心收入来源",
-    "18.7%客户存在流失风险，需立即召回",
-    "1-2岁是购买高峰期，占比49.4%",
-    "品类销量相对均衡，差异<5%",
-    "平台年增长率稳定在2-3%"
-])
-
-# Slide 4: User Profile
-add_content_slide(prs, "用户画像分析", [
-    "性别分布：男女婴比例均衡（46% vs 44%）",
-    "黄金年龄段：1-2岁是核心购买期",
-    "年龄与频次：3岁以上用户购买频次最高（6.45次/人）",
-    "增长潜力：0-12个月是潜力培育期"
-])
-
-# Slide 5: Product Analysis
-add_content_slide(prs, "商品品类分析", [
-    "品类均衡：Top 5品类销量差异<5%",
-    "广泛覆盖：各品类覆盖约95%用户",
-    "订单结构：85%订单≤5件，中小订单为主",
-    "热销品类：50014815略领先，但优势不明显"
-])
-
-# Slide 6: Time Trend
-add_content_slide(prs, "时间趋势分析", [
-    "年度增长：年增长率2-3%，增长稳定",
-    "用户粘性：用户基数稳定在970-980人",
-    "无季节性：全年销售均匀分布",
-    "复购率高：平台处于稳定增长期"
-])
-
-# Slide 7: RFM Analysis
-add_content_slide(prs, "RFM客户价值分析", [
-    "冠军客户（14.5%）：高活跃+高频次+高消费",
-    "重要保持客户（18.0%）：购买频次稳定",
-    "重要挽留客户（18.7%）：曾经活跃但近期未购买",
-    "重要发展客户（11.3%）：新客户，潜力待挖掘",
-    "不可失去客户（5.9%）：曾经高价值，近期沉默"
-])
-
-# Slide 8: Business Recommendations
-add_content_slide(prs, "业务建议", [
-    "P0 - 冠军客户VIP专属服务：145位核心客户",
-    "P0 - 流失客户召回活动：187位风险客户",
-    "P1 - 忠诚客户升单计划：180位忠诚客户",
-    "P1 - 新客户培育计划：113位新客户",
-    "P2 - 1-2岁用户专项运营：核心年龄段"
-])
-
-# Slide 9: Thank you
-add_title_slide(prs, "谢谢观看", "Thank You\\n\\n数据分析驱动业务增长")
-
-# Save presentation
-output_path = "Taobao_Maternity_Analysis_Report.pptx"
-prs.save(output_path)
-print(f"PPT报告已生成: {output_path}")
+def add_picture_slide(prs, title, image):
+    slide_layout = prs.slide_layouts[5]  # Title only
+    slide = prs.slides.add_slide(slide_layout)
+    slide.shapes.title.text = title
+    top = Inches(1.4)
+    height = prs.slide_height - top - Inches(0.3)
+    picture = slide.shapes.add_picture(BytesIO(image), 0, top, height=height)
+    picture.left = int((prs.slide_width - picture.width) / 2)
+    return slide
+
+
+def pct(part, total):
+    return f"{part / total * 100:.1f}%" if total else "0.0%"
+
+
+# ============================================
+# Template and metrics (loaded once per batch)
+# ============================================
+class DeckTemplate:
+    """A template read once and cloned in memory for every deck"""
+
+    def __init__(self, path=None):
+        if path is None:
+            buffer = BytesIO()
+            Presentation().save(buffer)
+            self.data = buffer.getvalue()
+        else:
+            self.data = Path(path).read_bytes()
+        self.custom = path is not None
+
+    def new_deck(self):
+        prs = Presentation(BytesIO(self.data))
+        if not self.custom:
+            prs.slide_width = Inches(13.333)
+            prs.slide_height = Inches(7.5)
+        return prs
+
+
+class ReportData:
+    """Pipeline outputs used by the decks, each loaded at most once"""
+
+    FIGURES = ['user_profile_analysis.png', 'product_analysis.png',
+               'time_trend_analysis.png', 'rfm_analysis.png']
+
+    def __init__(self, store):
+        self.store = store
+        self._cache = {}
+
+    def __getitem__(self, name):
+        if name not in self._cache:
+            if not self.store.exists(name):
+                raise SystemExit(f"Missing pipeline output '{name}'. Build it first: python src/analyze.py rfm charts")
+            self._cache[name] = self.store.load(name)
+        return self._cache[name]
+
+    def figure(self, name):
+        """PNG bytes of a generated figure, or None if it was not rendered"""
+        key = ('figure', name)
+        if key not in self._cache:
+            path = self.store.path(name)
+            self._cache[key] = path.read_bytes() if path.exists() else None
+        return self._cache[key]
+
+    def cube(self):
+        if 'cube' not in self._cache:
+            from analysis import PROFILE_PARAMS
+            from cube import SalesCube
+            self._cache['cube'] = SalesCube.load(self.store, age_labels=PROFILE_PARAMS['age_labels'])
+        return self._cache['cube']
+
+
+def summary(data):
+    """Headline metrics shared by the main deck and the batch decks"""
+    overview = data['overview.json']
+    rfm = data['rfm_analysis']
+    segments = rfm['segment'].value_counts()
+    categories = data['category_stats']
+    yearly = data['yearly_stats']
+    ages = data['age_group_stats']
+    gender = data['chart_profile.json']['gender']
+
+    top5 = categories.head(5)['purchase_count']
+    growth = yearly['purchase_count'].pct_change().dropna() * 100
+    top_age = ages['purchase_count'].idxmax()
+    per_user = (ages['purchase_count'] / ages['unique_users']).dropna()
+    return {
+        'overview': overview,
+        'users': len(rfm),
+        'segments': segments,
+        'years': f"{overview['date_min'][:4]}-{overview['date_max'][:4]}",
+        'gender': gender,
+        'top_age': top_age,
+        'top_age_share': pct(ages.loc[top_age, 'purchase_count'], ages['purchase_count'].sum()),
+        'frequent_age': per_user.idxmax(),
+        'frequent_age_rate': per_user.max(),
+        'top_category': categories.index[0],
+        'top5_spread': pct(top5.max() - top5.min(), top5.max()),
+        'coverage': pct(categories['unique_users'].mean(), overview['total_users']),
+        'growth': (growth.min(), growth.max()),
+        'yearly_users': (int(yearly['unique_users'].min()), int(yearly['unique_users'].max())),
+    }
+
+
+# ============================================
+# Decks
+# ============================================
+def build_main_deck(prs, data, date_label):
+    s = summary(data)
+    overview, segments, users = s['overview'], s['segments'], s['users']
+    share = {name: pct(segments.get(name, 0), users) for name in SEGMENT_LABELS}
+    count = {name: int(segments.get(name, 0)) for name in SEGMENT_LABELS}
+    gender_total = sum(s['gender'].values())
+    age = AGE_LABELS.get(s['top_age'], s['top_age'])
+
+    # Slide 1: Title
+    add_title_slide(prs,
+        "淘宝母婴购物数据分析",
+        f"Taobao Maternity Shopping Data Analysis\n\n基于阿里云天池数据集\n{date_label}")
+
+    # Slide 2: Project Overview
+    add_content_slide(prs, "项目概述", [
+        "分析目标：洞察母婴电商平台用户行为和商品偏好",
+        f"数据规模：{overview['total_users']:,}位用户，{overview['total_transactions']:,}条交易记录",
+        f"时间跨度：{s['years']}年",
+        "核心指标：用户画像、商品分析、时间趋势、RFM价值分析",
+        "数据来源：阿里云天池数据集 #45"
+    ])
+
+    # Slide 3: Key Findings
+    add_content_slide(prs, "核心发现", [
+        f"冠军客户占比{share['Champions']}，是平台核心收入来源",
+        f"{share['At Risk']}客户存在流失风险，需立即召回",
+        f"{age}是购买高峰期，占比{s['top_age_share']}",
+        f"Top 5品类销量差异{s['top5_spread']}",
+        f"平台年增长率{s['growth'][0]:.1f}%~{s['growth'][1]:.1f}%"
+    ])
+
+    # Slide 4: User Profile
+    add_content_slide(prs, "用户画像分析", [
+        f"性别分布：男女婴比例 {pct(s['gender'].get('Male', 0), gender_total)} vs "
+        f"{pct(s['gender'].get('Female', 0), gender_total)}",
+        f"黄金年龄段：{age}是核心购买期",
+        f"年龄与频次：{AGE_LABELS.get(s['frequent_age'], s['frequent_age'])}用户购买频次最高"
+        f"（{s['frequent_age_rate']:.2f}次/人）",
+    ])
+    add_figure(prs, data, "用户画像分析", 'user_profile_analysis.png')
+
+    # Slide 5: Product Analysis
+    add_content_slide(prs, "商品品类分析", [
+        f"品类集中度：Top 5品类销量差异{s['top5_spread']}",
+        f"用户覆盖：各品类平均覆盖{s['coverage']}用户",
+        f"订单结构：平均每单{overview['avg_quantity']:.2f}件",
+        f"热销品类：{s['top_category']}"
+    ])
+    add_figure(prs, data, "商品品类分析", 'product_analysis.png')
+
+    # Slide 6: Time Trend
+    add_content_slide(prs, "时间趋势分析", [
+        f"年度增长：年增长率{s['growth'][0]:.1f}%~{s['growth'][1]:.1f}%",
+        f"用户粘性：年活跃用户{s['yearly_users'][0]:,}-{s['yearly_users'][1]:,}人",
+    ])
+    add_figure(prs, data, "时间趋势分析", 'time_trend_analysis.png')
+
+    # Slide 7: RFM Analysis
+    add_content_slide(prs, "RFM客户价值分析", [
+        f"{SEGMENT_LABELS[name]}（{share[name]}）：{count[name]:,}位"
+        for name in segments.index if name in SEGMENT_LABELS and name != 'Others'
+    ])
+    add_figure(prs, data, "RFM客户价值分析", 'rfm_analysis.png')
+
+    # Slide 8: Business Recommendations
+    add_content_slide(prs, "业务建议", [
+        f"P0 - 冠军客户VIP专属服务：{count['Champions']:,}位核心客户",
+        f"P0 - 流失客户召回活动：{count['At Risk']:,}位风险客户",
+        f"P1 - 忠诚客户升单计划：{count['Loyal Customers']:,}位忠诚客户",
+        f"P1 - 新客户培育计划：{count['New Customers']:,}位新客户",
+        f"P2 - {age}用户专项运营：核心年龄段"
+    ])
+
+    # Slide 8b: Cross-sell rules, when the associations phase has run
+    if data.store.exists('category_rules'):
+        rules = data['category_rules'].sort_values('lift', ascending=False).head(5)
+        add_content_slide(prs, "升单推荐", [
+            f"买{row.antecedent} → {int(row.within_days)}天内买{row.consequent}："
+            f"置信度{row.confidence:.1%}，提升度{row.lift:.2f}"
+            if row.within_days >= 0 else
+            f"买{row.antecedent} → 也买{row.consequent}：置信度{row.confidence:.1%}，提升度{row.lift:.2f}"
+            for row in rules.itertuples()
+        ])
+
+    # Slide 9: Thank you
+    add_title_slide(prs, "谢谢观看", "Thank You\n\n数据分析驱动业务增长")
+    return prs
+
+
+def add_figure(prs, data, title, name):
+    image = data.figure(name)
+    if image is not None:
+        add_picture_slide(prs, title, image)
+
+
+def build_segment_deck(prs, data, segment, date_label):
+    rfm = data['rfm_analysis']
+    members = rfm[rfm['segment'] == segment]
+    label = SEGMENT_LABELS.get(segment, segment)
+
+    add_title_slide(prs, f"客户分层报告：{label}", f"{segment}\n\n{date_label}")
+    add_content_slide(prs, "分层概况", [
+        f"客户数：{len(members):,}位（占全部客户{pct(len(members), len(rfm))}）",
+        f"平均最近购买间隔：{members['recency'].mean():.0f}天（全体{rfm['recency'].mean():.0f}天）",
+        f"平均购买次数：{members['frequency'].mean():.1f}次（全体{rfm['frequency'].mean():.1f}次）",
+        f"平均购买件数：{members['monetary'].mean():.1f}件（全体{rfm['monetary'].mean():.1f}件）",
+        f"贡献购买件数：{pct(members['monetary'].sum(), rfm['monetary'].sum())}",
+    ])
+    scores = members['rfm_score'].value_counts().head(5)
+    add_content_slide(prs, "主要RFM得分组合", [
+        f"{score}：{n:,}位（{pct(n, len(members))}）" for score, n in scores.items()
+    ])
+    add_figure(prs, data, "全体客户RFM分布", 'rfm_analysis.png')
+    return prs
+
+
+def build_category_deck(prs, data, category, date_label):
+    cube = data.cube().slice(category=category)
+    total = data['overview.json']['total_transactions']
+    overall = cube.rollup([]).iloc[0]
+    yearly = cube.rollup('year')
+    ages = cube.rollup('age_group').dropna(subset=['age_group'])
+    genders = cube.rollup('gender_label').dropna(subset=['gender_label'])
+
+    add_title_slide(prs, f"品类报告：{category}", f"Category {category}\n\n{date_label}")
+    add_content_slide(prs, "品类概况", [
+        f"购买次数：{int(overall['purchase_count']):,}次（占全部交易{pct(overall['purchase_count'], total)}）",
+        f"购买件数：{int(overall['total_quantity']):,}件，平均每单{overall['avg_quantity']:.2f}件",
+        f"购买用户：约{int(overall['unique_users']):,}人",
+    ])
+    add_content_slide(prs, "年度趋势", [
+        f"{row.year}年：{int(row.purchase_count):,}次购买，约{int(row.unique_users):,}位用户"
+        for row in yearly.itertuples()
+    ])
+    add_content_slide(prs, "用户构成", [
+        f"{AGE_LABELS.get(row.age_group, row.age_group)}：{pct(row.purchase_count, ages['purchase_count'].sum())}的购买"
+        for row in ages.itertuples()
+    ] + [
+        f"{GENDER_LABELS.get(row.gender_label, row.gender_label)}：{pct(row.purchase_count, genders['purchase_count'].sum())}的购买"
+        for row in genders.itertuples()
+    ])
+    return prs
+
+
+def safe_name(value):
+    return "".join(c if c.isalnum() else "_" for c in str(value)).strip("_")
+
+
+def generate(store, by=None, template=None, output_dir=Path("."), date_label=None):
+    """Build the main deck, or one deck per segment / category; returns the saved paths"""
+    from datetime import date
+
+    data = ReportData(store)
+    deck_template = DeckTemplate(template)
+    date_label = date_label or f"{date.today():%Y年%m月}"
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    if by is None:
+        jobs = [(REPORT_NAME, lambda prs: build_main_deck(prs, data, date_label))]
+    elif by == 'segment':
+        jobs = [(f"Taobao_Maternity_Segment_{safe_name(segment)}.pptx",
+                 lambda prs, segment=segment: build_segment_deck(prs, data, segment, date_label))
+                for segment in data['rfm_analysis']['segment'].value_counts().index]
+    else:
+        jobs = [(f"Taobao_Maternity_Category_{safe_name(category)}.pptx",
+                 lambda prs, category=category: build_category_deck(prs, data, category, date_label))
+                for category in data['category_stats'].index]
+
+    paths = []
+    for name, build in jobs:
+        path = output_dir / name
+        build(deck_template.new_deck()).save(path)
+        paths.append(path)
+    return paths
+
+
+def parse_args(argv=None):
+    from analysis import DATA_OUTPUT, DATA_PROCESSED
+    from storage import FORMATS
+
+    parser = argparse.ArgumentParser(description="Build PowerPoint decks from the pipeline outputs")
+    parser.add_argument('--by', choices=['segment', 'category'],
+                        help="one deck per RFM segment or per product category instead of the main deck")
+    parser.add_argument('--template', type=Path, help="base .pptx whose layouts and theme are used")
+    parser.add_argument('--output-dir', type=Path, default=Path("."), help="where the decks are written")
+    parser.add_argument('--processed-dir', type=Path, default=DATA_PROCESSED)
+    parser.add_argument('--figures-dir', type=Path, default=DATA_OUTPUT)
+    parser.add_argument('--format', choices=FORMATS, default=None)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    from analysis import DATA_RAW
+    from storage import ArtifactStore
+
+    args = parse_args(argv)
+    store = ArtifactStore(DATA_RAW, args.processed_dir, args.figures_dir, fmt=args.format)
+    for path in generate(store, args.by, args.template, args.output_dir):
+        print(f"PPT报告已生成: {path}")
+
+
+if __name__ == "__main__":
+    main()
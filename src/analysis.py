@@ -1,23 +1,46 @@
 """
 Taobao Maternity Shopping Data Analysis
 Complete analysis pipeline
+
+Each phase is a function with declared inputs and outputs, run by the cached
+DAG runner in pipeline.py. Only phases whose code, parameters or upstream data
+changed are executed:
+
+    python src/analysis.py              # build everything that is stale
+    python src/analysis.py rfm          # build RFM (and anything it needs)
+    python src/analysis.py rfm --force  # re-run RFM even if it is up to date
+    python src/analysis.py --no-charts  # headless: data artifacts only
+    python src/analysis.py --metrics run.jsonl --openmetrics run.prom  # timings, rows, memory
 """
+import argparse
+import json
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
 from datetime import datetime, timedelta
 from pathlib import Path
 import warnings
 warnings.filterwarnings('ignore')
 
-# Setup matplotlib for Chinese characters
-plt.rcParams['font.sans-serif'] = ['SimHei', 'Microsoft YaHei', 'Arial Unicode MS', 'DejaVu Sans']
-plt.rcParams['axes.unicode_minus'] = False
-
-# Set style
-sns.set_style("whitegrid")
-plt.style.use('seaborn-v0_8-darkgrid')
+from cube import build_cube
+from encoding import DICTIONARY_FILE, build_dictionary, encode
+from parallel import group_stats, user_rfm
+import instrument
+from instrument import count, span
+from pipeline import Phase, Pipeline
+from associations import ASSOCIATION_PARAMS, association_rules, associations_phase, mine, pair_users
+from cohorts import (COHORT_PARAMS, cohorts_phase, interval_distribution, purchase_gaps, retention,
+                     sort_trades, summarize)
+from hierarchy import build_hierarchy, hierarchy_phase, rollup, top_k_per_parent
+from lifecycle import (LIFECYCLE_META, LIFECYCLE_PARAMS, age_months, build_lifecycle_index, lifecycle_phase,
+                       lifecycle_stages)
+from lookup import USER_INDEX, build_user_index, lookup_phase
+from properties import build_index, parse_properties, properties_phase
+from sketches import GroupedHLL, boundary_drift, sketch_quantiles
+from storage import ArtifactStore, FORMATS, read_raw
+from timeseries import TIMESERIES_PARAMS, active_users, add_rolling, build_daily, rolling_sum, timeseries_phase
+from timeseries import rollup as daily_rollup
+from validation import QUARANTINE, VALIDATION_PARAMS, split, validate_baby, validate_trades
+from validation import summarize as summarize_quarantine
 
 # Project paths
 PROJECT_DIR = Path(__file__).parent.parent
@@ -25,343 +48,665 @@ DATA_RAW = PROJECT_DIR / "data" / "raw"
 DATA_PROCESSED = PROJECT_DIR / "data" / "processed"
 DATA_OUTPUT = PROJECT_DIR / "data" / "output"
 
-# Create directories
-DATA_PROCESSED.mkdir(parents=True, exist_ok=True)
-DATA_OUTPUT.mkdir(parents=True, exist_ok=True)
+BABY_RAW = "raw:tianchi_mum_baby.csv"
+TRADE_RAW = "raw:tianchi_mum_baby_trade_history.csv"
+GENDER_LABELS = {0: 'Female', 1: 'Male', 2: 'Unknown'}
+
+# Default phase parameters (override per phase with --config)
+# `quantiles` selects exact percentiles or merged KLL sketches ('sketch'),
+# whose normalized rank error is bounded by `sketch_epsilon`. The validation
+# keys (id patterns, date range, ...) are described in validation.py.
+CLEAN_PARAMS = {'outlier_quantile': 0.99, 'max_buy_mount': 100,
+                'quantiles': 'exact', 'sketch_epsilon': 0.001, **VALIDATION_PARAMS}
+PROFILE_PARAMS = {'age_bins': [0, 6, 12, 24, 36, 72],
+                  'age_labels': ['0-6m', '6-12m', '1-2y', '2-3y', '3y+']}
+PRODUCT_PARAMS = {'top_products': 20}
+PRODUCT_CHART_PARAMS = {'top_categories': 10}
+HIERARCHY_PARAMS = {'top_subcategories': 10}
+# Distinct users per group: exact nunique, or HyperLogLog sketches ('hll') with
+# 2**hll_precision registers (p=14: ~0.8% standard error, mergeable).
+DISTINCT_PARAMS = {'distinct': 'exact', 'hll_precision': 14}
+# Sales cube: per-cell user sketches use a lower precision than the group stats
+# (p=10: ~3% standard error, 1 KB per cell) to keep the cube small.
+CUBE_PARAMS = {'hll_precision': 10}
+# RFM scoring: `bins` quantile buckets per metric, then the first matching
+# segment rule wins. Rules bound the scores with r/f/m _min and _max keys.
+RFM_PARAMS = {
+    'bins': 5,
+    'segments': [
+        {'name': 'Champions', 'r_min': 4, 'f_min': 4, 'm_min': 4},
+        {'name': 'Loyal Customers', 'r_min': 3, 'f_min': 3, 'm_min': 3},
+        {'name': 'New Customers', 'r_min': 4, 'f_max': 2},
+        {'name': 'At Risk', 'r_max': 2, 'f_min': 3},
+        {'name': 'Cannot Lose Them', 'r_max': 2, 'f_max': 2, 'm_min': 3},
+    ],
+    'default_segment': 'Others',
+    'quantiles': 'exact',
+    'sketch_epsilon': 0.01,
+    'drift_sample': 100_000,
+}
+RFM_METRICS = ['recency', 'frequency', 'monetary']
+SEGMENT_RULE_KEYS = {'name', 'r_min', 'r_max', 'f_min', 'f_max', 'm_min', 'm_max'}
+
+
+def histogram(values, bins):
+    """Counts and bin edges of `values`, as plain lists for a chart data file"""
+    counts, edges = np.histogram(np.asarray(values, dtype=float), bins=bins)
+    return {'counts': counts.tolist(), 'edges': edges.tolist()}
 
-print("=" * 70)
-print("Taobao Maternity Shopping Data Analysis")
-print("=" * 70)
 
 # ============================================
 # Phase 1: Data Loading & Cleaning
 # ============================================
-print("\n[Phase 1/4] Data Loading & Cleaning")
-print("-" * 70)
-
-# Load data
-print("Loading raw data...")
-baby_df = pd.read_csv(DATA_RAW / "tianchi_mum_baby.csv")
-trade_df = pd.read_csv(DATA_RAW / "tianchi_mum_baby_trade_history.csv")
-
-print(f"  Baby info: {len(baby_df):,} records")
-print(f"  Trade history: {len(trade_df):,} records")
-
-# Clean baby data
-print("\nCleaning baby data...")
-baby_df['birthday'] = pd.to_datetime(baby_df['birthday'], format='%Y%m%d')
-baby_df['gender_label'] = baby_df['gender'].map({0: 'Female', 1: 'Male', 2: 'Unknown'})
-print(f"  Date range: {baby_df['birthday'].min()} to {baby_df['birthday'].max()}")
-
-# Clean trade data
-print("\nCleaning trade data...")
-trade_df['day'] = pd.to_datetime(trade_df['day'], format='%Y%m%d')
-trade_df['year'] = trade_df['day'].dt.year
-trade_df['month'] = trade_df['day'].dt.month
-trade_df['year_month'] = trade_df['day'].dt.to_period('M')
-print(f"  Date range: {trade_df['day'].min()} to {trade_df['day'].max()}")
-
-# Check for outliers in buy_mount
-print("\nChecking for outliers...")
-q99 = trade_df['buy_mount'].quantile(0.99)
-outliers = trade_df[trade_df['buy_mount'] > q99]
-print(f"  99th percentile: {q99}")
-print(f"  Outliers (>99th percentile): {len(outliers)} records")
-
-# Remove extreme outliers (likely data errors)
-trade_clean = trade_df[trade_df['buy_mount'] <= 100].copy()
-print(f"  Records after cleaning: {len(trade_clean):,}")
-
-# Merge datasets
-print("\nMerging datasets...")
-merged_df = trade_clean.merge(baby_df, on='user_id', how='left')
-merged_df['baby_age_days'] = (merged_df['day'] - merged_df['birthday']).dt.days
-merged_df['baby_age_months'] = (merged_df['baby_age_days'] / 30).astype(int)
-print(f"  Merged records: {len(merged_df):,}")
-
-# Save processed data
-merged_df.to_csv(DATA_PROCESSED / "merged_data.csv", index=False)
-baby_df.to_csv(DATA_PROCESSED / "baby_clean.csv", index=False)
-trade_clean.to_csv(DATA_PROCESSED / "trade_clean.csv", index=False)
-print(f"\nSaved processed data to: {DATA_PROCESSED}")
+def clean_baby(baby_df):
+    if not pd.api.types.is_datetime64_any_dtype(baby_df['birthday']):  # already parsed by validation
+        baby_df['birthday'] = pd.to_datetime(baby_df['birthday'], format='%Y%m%d')
+    baby_df['gender_label'] = pd.Categorical(baby_df['gender'].map(GENDER_LABELS),
+                                             categories=list(GENDER_LABELS.values()))
+    return baby_df
+
+
+def clean_trades(trade_df):
+    if not pd.api.types.is_datetime64_any_dtype(trade_df['day']):
+        trade_df['day'] = pd.to_datetime(trade_df['day'], format='%Y%m%d')
+    trade_df['year'] = trade_df['day'].dt.year
+    trade_df['month'] = trade_df['day'].dt.month
+    trade_df['year_month'] = trade_df['day'].dt.to_period('M')
+    return trade_df
+
+
+def outlier_threshold(buy_mount, params):
+    """buy_mount value at the outlier quantile (exact or sketched)"""
+    q = params['outlier_quantile']
+    if params['quantiles'] != 'sketch':
+        return buy_mount.quantile(q)
+    q_approx = sketch_quantiles(buy_mount.to_numpy(), [q], params['sketch_epsilon'])
+    drift = boundary_drift(buy_mount.to_numpy(), [q], q_approx)
+    print(f"  Sketch drift at q={q}: approx {q_approx[0]} vs sample exact "
+          f"{drift['exact_on_sample'].iloc[0]} (rank error {drift['rank_error'].iloc[0]:+.4f})")
+    return q_approx[0]
+
+
+def merge_baby(trade_clean, baby_df):
+    merged_df = trade_clean.merge(baby_df, on='user_id', how='left')
+    merged_df['baby_age_days'] = (merged_df['day'] - merged_df['birthday']).dt.days
+    # Floored like the lifecycle index: a purchase days before birth is month -1
+    merged_df['baby_age_months'] = age_months(merged_df['baby_age_days'],
+                                              LIFECYCLE_PARAMS['days_per_month']).astype(int)
+    return merged_df
+
+
+def clean(inputs, params):
+    print("\n[Phase 1/4] Data Loading & Cleaning")
+    print("-" * 70)
+
+    # Load data
+    print("Loading raw data...")
+    with span('load'):
+        baby_df = read_raw(inputs[BABY_RAW])
+        trade_df = read_raw(inputs[TRADE_RAW])
+        # Row number in the raw file: a stable trade id across phases and reloads
+        trade_df['trade_idx'] = np.arange(len(trade_df), dtype=np.int64)
+        count('baby_rows', len(baby_df))
+        count('trade_rows', len(trade_df))
+
+    print(f"  Baby info: {len(baby_df):,} records")
+    print(f"  Trade history: {len(trade_df):,} records")
+
+    # Validate before anything else: bad rows go to quarantine, they neither
+    # abort the load nor reach the analysis
+    print("\nValidating...")
+    with span('validate'):
+        baby_df, baby_bad = validate_baby(baby_df, params)
+        trade_df, trade_bad = validate_trades(trade_df, params, users=baby_df['user_id'])
+        quarantine = pd.concat([baby_bad, trade_bad], ignore_index=True)
+        count('quarantined', len(quarantine))
+    if len(quarantine):
+        print(f"  Quarantined: {len(baby_bad):,} baby and {len(trade_bad):,} trade records")
+        print(summarize_quarantine(quarantine).to_string(index=False))
+    else:
+        print("  All records valid")
+
+    # Encode the id columns against one shared dictionary, so the merge and
+    # the groupbys downstream work on integer codes
+    dictionary = build_dictionary([baby_df, trade_df])
+    baby_df = encode(baby_df, dictionary)
+    trade_df = encode(trade_df, dictionary)
+    print("  Encoded: " + ", ".join(f"{col} ({len(values):,} values)" for col, values in dictionary.items()))
+
+    # Clean baby data
+    print("\nCleaning baby data...")
+    baby_df = clean_baby(baby_df)
+    print(f"  Date range: {baby_df['birthday'].min()} to {baby_df['birthday'].max()}")
+
+    # Clean trade data
+    print("\nCleaning trade data...")
+    trade_df = clean_trades(trade_df)
+    print(f"  Date range: {trade_df['day'].min()} to {trade_df['day'].max()}")
+
+    # Check for outliers in buy_mount
+    print("\nChecking for outliers...")
+    q99 = outlier_threshold(trade_df['buy_mount'], params)
+    outliers = trade_df[trade_df['buy_mount'] > q99]
+    print(f"  99th percentile: {q99}")
+    print(f"  Outliers (>99th percentile): {len(outliers)} records")
+
+    # Remove extreme outliers (likely data errors)
+    trade_clean = trade_df[trade_df['buy_mount'] <= params['max_buy_mount']].copy()
+    print(f"  Records after cleaning: {len(trade_clean):,}")
+    count('outliers', len(outliers))
+    count('dropped_outliers', len(trade_df) - len(trade_clean))
+
+    # Merge datasets
+    print("\nMerging datasets...")
+    with span('merge'):
+        merged_df = merge_baby(trade_clean, baby_df)
+        count('rows_in', len(trade_clean))
+        count('rows_out', len(merged_df))
+        count('without_baby', merged_df['birthday'].isna().sum())
+    print(f"  Merged records: {len(merged_df):,}")
+
+    overview = {
+        'total_users': int(baby_df['user_id'].nunique()),
+        'total_transactions': int(len(trade_clean)),
+        'total_quantity': int(trade_clean['buy_mount'].sum()),
+        'avg_quantity': float(trade_clean['buy_mount'].mean()),
+        'date_min': str(trade_clean['day'].min().date()),
+        'date_max': str(trade_clean['day'].max().date()),
+        'outlier_threshold': float(q99),
+        'outlier_count': int(len(outliers)),
+    }
+    return {
+        'baby_clean': baby_df,
+        'trade_clean': trade_clean,
+        'merged_data': merged_df,
+        'overview.json': overview,
+        DICTIONARY_FILE: dictionary,
+        QUARANTINE: quarantine,
+    }
+
 
 # ============================================
 # Phase 2: User Profile Analysis
 # ============================================
-print("\n[Phase 2/4] User Profile Analysis")
-print("-" * 70)
-
-# Gender distribution
-print("\nAnalyzing gender distribution...")
-gender_dist = baby_df['gender_label'].value_counts()
-print(gender_dist)
-
-fig, axes = plt.subplots(1, 2, figsize=(14, 5))
-
-# Gender pie chart
-colors = ['#FF9999', '#66B2FF', '#99FF99']
-axes[0].pie(gender_dist.values, labels=gender_dist.index, autopct='%1.1f%%', 
-            colors=colors, startangle=90)
-axes[0].set_title('Baby Gender Distribution', fontsize=14, fontweight='bold')
-
-# Baby age distribution at time of purchase
-baby_age_purchases = merged_df[merged_df['baby_age_months'] >= 0]['baby_age_months']
-axes[1].hist(baby_age_purchases, bins=30, color='skyblue', edgecolor='black', alpha=0.7)
-axes[1].set_xlabel('Baby Age (Months)')
-axes[1].set_ylabel('Number of Purchases')
-axes[1].set_title('Purchase Distribution by Baby Age', fontsize=14, fontweight='bold')
-axes[1].axvline(baby_age_purchases.median(), color='red', linestyle='--', 
-                label=f'Median: {baby_age_purchases.median():.1f} months')
-axes[1].legend()
-
-plt.tight_layout()
-plt.savefig(DATA_OUTPUT / "user_profile_analysis.png", dpi=150, bbox_inches='tight')
-print(f"  Saved: user_profile_analysis.png")
-plt.close()
-
-# Age group analysis
-print("\nAnalyzing age groups...")
-age_bins = [0, 6, 12, 24, 36, 72]
-age_labels = ['0-6m', '6-12m', '1-2y', '2-3y', '3y+']
-merged_df['age_group'] = pd.cut(merged_df['baby_age_months'], bins=age_bins, 
-                                 labels=age_labels, right=False)
-age_group_stats = merged_df.groupby('age_group').agg({
-    'buy_mount': ['count', 'sum', 'mean'],
-    'user_id': 'nunique'
-}).round(2)
-print(age_group_stats)
+def user_profile(inputs, params):
+    print("\n[Phase 2/4] User Profile Analysis")
+    print("-" * 70)
+    baby_df = inputs['baby_clean']
+    merged_df = inputs['merged_data']
+
+    # Gender distribution
+    print("\nAnalyzing gender distribution...")
+    gender_dist = baby_df['gender_label'].value_counts()
+    print(gender_dist)
+
+    # Baby age distribution at time of purchase; purchases before birth (negative
+    # months, the lifecycle phase's prenatal stage) get a bar of their own
+    prenatal = merged_df['baby_age_months'] < 0
+    baby_age_purchases = merged_df.loc[~prenatal, 'baby_age_months']
+    print(f"\n  Purchases before birth: {prenatal.sum():,}")
+    chart_data = {
+        'gender': {str(label): int(count) for label, count in gender_dist.items()},
+        'baby_age': histogram(baby_age_purchases, bins=30),
+        'baby_age_prenatal': int(prenatal.sum()),
+        'baby_age_median': float(baby_age_purchases.median()),
+    }
+
+    # Age group analysis
+    print("\nAnalyzing age groups...")
+    age_group = pd.cut(merged_df['baby_age_months'], bins=params['age_bins'],
+                       labels=params['age_labels'], right=False)
+    frame = merged_df[['user_id', 'buy_mount']].assign(age_group=age_group)
+    age_group_stats = group_stats(frame, ['age_group'], params.get('workers', 1),
+                                  distinct=params['distinct'],
+                                  precision=params['hll_precision'])['age_group']
+    age_group_stats.insert(2, 'avg_quantity',
+                           age_group_stats['total_quantity'] / age_group_stats['purchase_count'])
+    age_group_stats = age_group_stats.round(2)
+    print(age_group_stats)
+
+    return {
+        'age_group_stats': age_group_stats,
+        'chart_profile.json': chart_data,
+    }
+
 
 # ============================================
 # Phase 3: Product Analysis
 # ============================================
-print("\n[Phase 3/4] Product Analysis")
-print("-" * 70)
-
-# Category analysis
-print("\nAnalyzing product categories...")
-category_stats = merged_df.groupby('category').agg({
-    'buy_mount': ['count', 'sum'],
-    'user_id': 'nunique'
-}).round(2)
-category_stats.columns = ['purchase_count', 'total_quantity', 'unique_users']
-category_stats = category_stats.sort_values('purchase_count', ascending=False)
-print(category_stats.head(10))
-
-fig, axes = plt.subplots(2, 2, figsize=(16, 12))
-
-# Top categories by purchase count
-top_categories = category_stats.head(10)
-axes[0, 0].barh(range(len(top_categories)), top_categories['purchase_count'], color='steelblue')
-axes[0, 0].set_yticks(range(len(top_categories)))
-axes[0, 0].set_yticklabels(top_categories.index)
-axes[0, 0].set_xlabel('Purchase Count')
-axes[0, 0].set_title('Top 10 Categories by Purchase Count', fontsize=12, fontweight='bold')
-axes[0, 0].invert_yaxis()
-
-# Category by quantity sold
-axes[0, 1].barh(range(len(top_categories)), top_categories['total_quantity'], color='coral')
-axes[0, 1].set_yticks(range(len(top_categories)))
-axes[0, 1].set_yticklabels(top_categories.index)
-axes[0, 1].set_xlabel('Total Quantity Sold')
-axes[0, 1].set_title('Top 10 Categories by Quantity', fontsize=12, fontweight='bold')
-axes[0, 1].invert_yaxis()
-
-# Purchase quantity distribution
-axes[1, 0].hist(merged_df['buy_mount'], bins=20, color='lightgreen', edgecolor='black', alpha=0.7)
-axes[1, 0].set_xlabel('Purchase Quantity')
-axes[1, 0].set_ylabel('Frequency')
-axes[1, 0].set_title('Distribution of Purchase Quantities', fontsize=12, fontweight='bold')
-
-# Top products
-print("\nTop 20 products by purchase count...")
-top_products = merged_df.groupby('auction_id').agg({
-    'buy_mount': ['count', 'sum'],
-    'user_id': 'nunique'
-}).round(2)
-top_products.columns = ['purchase_count', 'total_quantity', 'unique_users']
-top_products = top_products.sort_values('purchase_count', ascending=False).head(20)
-
-axes[1, 1].barh(range(len(top_products)), top_products['purchase_count'], color='mediumpurple')
-axes[1, 1].set_yticks(range(len(top_products)))
-axes[1, 1].set_yticklabels([f"Product {i+1}" for i in range(len(top_products))], fontsize=8)
-axes[1, 1].set_xlabel('Purchase Count')
-axes[1, 1].set_title('Top 20 Products', fontsize=12, fontweight='bold')
-axes[1, 1].invert_yaxis()
-
-plt.tight_layout()
-plt.savefig(DATA_OUTPUT / "product_analysis.png", dpi=150, bbox_inches='tight')
-print(f"  Saved: product_analysis.png")
-plt.close()
+def product(inputs, params):
+    print("\n[Phase 3/4] Product Analysis")
+    print("-" * 70)
+    merged_df = inputs['merged_data']
+
+    # Category analysis
+    print("\nAnalyzing product categories...")
+    category_stats = group_stats(merged_df, ['category'], params.get('workers', 1),
+                                 distinct=params['distinct'],
+                                 precision=params['hll_precision'])['category']
+    category_stats = category_stats.sort_values('purchase_count', ascending=False)
+    print(category_stats.head(10))
+
+    # Purchase quantity distribution
+    chart_data = {'buy_mount': histogram(merged_df['buy_mount'], bins=20)}
+
+    # Top products
+    print("\nTop 20 products by purchase count...")
+    top_products = group_stats(merged_df, ['auction_id'], params.get('workers', 1),
+                               partition_key='auction_id', observed=True)['auction_id']
+    top_products = top_products.sort_values('purchase_count', ascending=False).head(params['top_products'])
+
+    return {
+        'category_stats': category_stats,
+        'top_products': top_products,
+        'chart_product.json': chart_data,
+    }
+
 
 # ============================================
 # Phase 4: Time Trend Analysis
 # ============================================
-print("\n[Phase 4/4] Time Trend Analysis")
-print("-" * 70)
-
-# Monthly trend
-print("\nAnalyzing monthly trends...")
-monthly_sales = merged_df.groupby('year_month').agg({
-    'buy_mount': ['count', 'sum'],
-    'user_id': 'nunique'
-}).reset_index()
-monthly_sales.columns = ['year_month', 'purchase_count', 'total_quantity', 'unique_users']
-
-fig, axes = plt.subplots(3, 1, figsize=(16, 12))
-
-# Purchase count trend
-axes[0].plot(range(len(monthly_sales)), monthly_sales['purchase_count'], 
-             marker='o', linewidth=2, markersize=4, color='steelblue')
-axes[0].set_ylabel('Purchase Count')
-axes[0].set_title('Monthly Purchase Count Trend', fontsize=12, fontweight='bold')
-axes[0].grid(True, alpha=0.3)
-
-# Quantity trend
-axes[1].plot(range(len(monthly_sales)), monthly_sales['total_quantity'], 
-             marker='s', linewidth=2, markersize=4, color='coral')
-axes[1].set_ylabel('Total Quantity')
-axes[1].set_title('Monthly Total Quantity Trend', fontsize=12, fontweight='bold')
-axes[1].grid(True, alpha=0.3)
-
-# Unique users trend
-axes[2].plot(range(len(monthly_sales)), monthly_sales['unique_users'], 
-             marker='^', linewidth=2, markersize=4, color='green')
-axes[2].set_ylabel('Unique Users')
-axes[2].set_xlabel('Time Period')
-axes[2].set_title('Monthly Unique Users Trend', fontsize=12, fontweight='bold')
-axes[2].grid(True, alpha=0.3)
-
-# Set x-axis labels (every 6 months)
-tick_positions = range(0, len(monthly_sales), 6)
-tick_labels = [str(monthly_sales.iloc[i]['year_month']) for i in tick_positions]
-for ax in axes:
-    ax.set_xticks(tick_positions)
-    ax.set_xticklabels(tick_labels, rotation=45, ha='right')
-
-plt.tight_layout()
-plt.savefig(DATA_OUTPUT / "time_trend_analysis.png", dpi=150, bbox_inches='tight')
-print(f"  Saved: time_trend_analysis.png")
-plt.close()
-
-# Year-over-year comparison
-print("\nYear-over-year analysis...")
-yearly_stats = merged_df.groupby('year').agg({
-    'buy_mount': ['count', 'sum'],
-    'user_id': 'nunique'
-}).round(2)
-yearly_stats.columns = ['purchase_count', 'total_quantity', 'unique_users']
-print(yearly_stats)
+def period_users(merged_df, params):
+    """(monthly, yearly) distinct users and the monthly user sketches
+
+    With distinct='hll' the sketches are built over the trades and the counts
+    estimated from them, the yearly ones as a rollup of the monthly sketches.
+    With 'exact' the counts come from the distinct (month, user) and
+    (year, user) code pairs, and the sketches are built from one trade per
+    distinct (month, user) pair only: repeats never change a register, so
+    they are the same sketches for a fraction of the hashing.
+    """
+    months, users = merged_df['year_month'], merged_df['user_id']
+    sketches = GroupedHLL(params['hll_precision'])
+    if params['distinct'] == 'hll':
+        sketches.update(months, users)
+        return sketches.counts(), sketches.rollup(lambda p: p.year).counts(), sketches
+    user_codes = users.cat.codes.to_numpy().astype(np.int64) if isinstance(users.dtype, pd.CategoricalDtype) \
+        else pd.factorize(users)[0].astype(np.int64)
+    base = user_codes.max() + 1
+    counts = []
+    for key in [months, merged_df['year']]:
+        codes, periods = pd.factorize(key, sort=True)
+        pairs, first = np.unique(codes * base + user_codes, return_index=True)
+        counts.append(pd.Series(np.bincount(pairs // base, minlength=len(periods)), index=periods))
+        if key is months:
+            sketches.update(months.iloc[first], users.iloc[first])
+    return counts[0], counts[1], sketches
+
+
+def time_trend(inputs, params):
+    print("\n[Phase 4/4] Time Trend Analysis")
+    print("-" * 70)
+
+    # Purchase counts and quantities are additive, so months and years are
+    # rollups of the dense daily series; only distinct users need the trades.
+    # The monthly user sketches are kept so quarterly / rolling uniques can be
+    # derived later without rescanning them.
+    daily = inputs['daily_sales']
+    monthly_users, yearly_users, sketches = period_users(inputs['merged_data'], params)
+    monthly_user_sketches = sketches.to_frame('year_month').sort_values('year_month', ignore_index=True)
+
+    # Monthly trend
+    print("\nAnalyzing monthly trends...")
+    monthly_sales = daily_rollup(daily, 'M').rename(columns={'period': 'year_month'})
+    monthly_sales = monthly_sales[monthly_sales['purchase_count'] > 0].drop(columns='days').reset_index(drop=True)
+    monthly_sales['unique_users'] = monthly_users.reindex(monthly_sales['year_month']).to_numpy()
+
+    # Year-over-year comparison
+    print("\nYear-over-year analysis...")
+    yearly_stats = daily_rollup(daily, 'Y')
+    yearly_stats = yearly_stats[yearly_stats['purchase_count'] > 0]
+    yearly_stats = yearly_stats.set_index(pd.Index(yearly_stats['period'].dt.year.to_numpy(), name='year'))
+    yearly_stats = yearly_stats[['purchase_count', 'total_quantity']]
+    yearly_stats['unique_users'] = yearly_users.reindex(yearly_stats.index).to_numpy()
+    print(yearly_stats)
+
+    return {
+        'monthly_sales': monthly_sales,
+        'yearly_stats': yearly_stats,
+        'monthly_user_sketches': monthly_user_sketches,
+    }
+
+
+# ============================================
+# Sales Cube (dashboards and reports)
+# ============================================
+def sales_cube(inputs, params):
+    print("\n[Cube] Materializing Sales Cube")
+    print("-" * 70)
+    cube = build_cube(inputs['merged_data'], params['age_bins'], params['age_labels'],
+                      params['hll_precision'])
+    print(f"  {len(cube):,} cells over year_month x category x age_group x gender_label")
+    return {'sales_cube': cube}
+
 
 # ============================================
 # Phase 5: RFM Analysis
 # ============================================
-print("\n[Bonus] RFM Customer Value Analysis")
-print("-" * 70)
-
-# Calculate RFM metrics
-reference_date = merged_df['day'].max() + timedelta(days=1)
-print(f"\nReference date: {reference_date.date()}")
-
-rfm = merged_df.groupby('user_id').agg({
-    'day': lambda x: (reference_date - x.max()).days,  # Recency
-    'auction_id': 'count',  # Frequency
-    'buy_mount': 'sum'  # Monetary
-}).reset_index()
-rfm.columns = ['user_id', 'recency', 'frequency', 'monetary']
-
-print(f"\nRFM metrics calculated for {len(rfm)} users")
-print(rfm.describe())
-
-# RFM scoring (1-5 scale)
-rfm['r_score'] = pd.qcut(rfm['recency'], 5, labels=[5,4,3,2,1])  # Lower recency = higher score
-rfm['f_score'] = pd.qcut(rfm['frequency'].rank(method='first'), 5, labels=[1,2,3,4,5])
-rfm['m_score'] = pd.qcut(rfm['monetary'], 5, labels=[1,2,3,4,5])
-
-# Convert to numeric
-rfm['r_score'] = rfm['r_score'].astype(int)
-rfm['f_score'] = rfm['f_score'].astype(int)
-rfm['m_score'] = rfm['m_score'].astype(int)
-
-# RFM segment
-rfm['rfm_score'] = rfm['r_score'].astype(str) + rfm['f_score'].astype(str) + rfm['m_score'].astype(str)
-
-# Simple segmentation
-def segment_customer(row):
-    if row['r_score'] >= 4 and row['f_score'] >= 4 and row['m_score'] >= 4:
-        return 'Champions'
-    elif row['r_score'] >= 3 and row['f_score'] >= 3 and row['m_score'] >= 3:
-        return 'Loyal Customers'
-    elif row['r_score'] >= 4 and row['f_score'] <= 2:
-        return 'New Customers'
-    elif row['r_score'] <= 2 and row['f_score'] >= 3:
-        return 'At Risk'
-    elif row['r_score'] <= 2 and row['f_score'] <= 2 and row['m_score'] >= 3:
-        return 'Cannot Lose Them'
+def segment_masks(rfm, rules):
+    """Boolean mask per segment rule; rules bound r/f/m scores with *_min/*_max"""
+    masks = []
+    for rule in rules:
+        unknown = set(rule) - SEGMENT_RULE_KEYS
+        if unknown:
+            raise ValueError(f"Unknown keys {sorted(unknown)} in segment rule {rule}")
+        mask = np.ones(len(rfm), dtype=bool)
+        for score in ('r', 'f', 'm'):
+            values = rfm[f'{score}_score'].to_numpy()
+            if f'{score}_min' in rule:
+                mask &= values >= rule[f'{score}_min']
+            if f'{score}_max' in rule:
+                mask &= values <= rule[f'{score}_max']
+        masks.append(mask)
+    return masks
+
+
+def rfm_metrics(merged_df, workers=1):
+    """Per-user recency, frequency and monetary values"""
+    reference_date = merged_df['day'].max() + timedelta(days=1)
+    print(f"\nReference date: {reference_date.date()}")
+
+    rfm = user_rfm(merged_df, workers).reset_index()
+    rfm.insert(1, 'recency', (reference_date - rfm.pop('last_day')).dt.days)
+    return rfm
+
+
+def rfm_cut_points(rfm, params):
+    """Inner score boundaries per RFM metric, exact or from merged sketches"""
+    qs = np.linspace(0, 1, params['bins'] + 1)[1:-1]
+    if params['quantiles'] == 'sketch':
+        return {m: sketch_quantiles(rfm[m].to_numpy(), qs, params['sketch_epsilon']) for m in RFM_METRICS}
+    return {m: rfm[m].quantile(qs).to_numpy() for m in RFM_METRICS}
+
+
+def rfm_boundaries(rfm, cut_points, params):
+    """Cut points per metric with their drift against exact values on a sample"""
+    qs = np.linspace(0, 1, params['bins'] + 1)[1:-1]
+    tables = []
+    for metric in RFM_METRICS:
+        drift = boundary_drift(rfm[metric].to_numpy(), qs, cut_points[metric], params['drift_sample'])
+        tables.append(drift.assign(metric=metric, method=params['quantiles']))
+    return pd.concat(tables, ignore_index=True)[
+        ['metric', 'method', 'quantile', 'approx', 'exact_on_sample', 'rank_error']]
+
+
+def score_rfm(rfm, params, cut_points=None):
+    """Add R/F/M scores and the customer segment to an RFM metrics table
+
+    With exact quantiles the scores are qcut buckets (frequency is ranked
+    first to break ties). With sketched quantiles each value is bucketed
+    against the approximate cut points, so no global sort is needed.
+    Segments come from the ordered rule table in `params['segments']`; the
+    first matching rule wins, as in an if/elif chain.
+    """
+    bins = params['bins']
+    if params['quantiles'] == 'sketch':
+        cut_points = cut_points or rfm_cut_points(rfm, params)
+        codes = {m: np.searchsorted(cut_points[m], rfm[m].to_numpy(), side='left') for m in RFM_METRICS}
+        rfm['r_score'] = bins - codes['recency']
+        rfm['f_score'] = codes['frequency'] + 1
+        rfm['m_score'] = codes['monetary'] + 1
     else:
-        return 'Others'
+        # Lower recency = higher score
+        rfm['r_score'] = bins - pd.qcut(rfm['recency'], bins, labels=False).astype(int)
+        rfm['f_score'] = pd.qcut(rfm['frequency'].rank(method='first'), bins, labels=False).astype(int) + 1
+        rfm['m_score'] = pd.qcut(rfm['monetary'], bins, labels=False).astype(int) + 1
+
+    # RFM segment
+    rfm['rfm_score'] = (rfm['r_score'] * 100 + rfm['f_score'] * 10 + rfm['m_score']).astype(str)
+    rules = params['segments']
+    rfm['segment'] = np.select(segment_masks(rfm, rules), [rule['name'] for rule in rules],
+                               default=params['default_segment'])
+    return rfm
+
+
+def rfm_analysis(inputs, params):
+    print("\n[Bonus] RFM Customer Value Analysis")
+    print("-" * 70)
+    return report_rfm(rfm_metrics(inputs['merged_data'], params.get('workers', 1)), params)
 
-rfm['segment'] = rfm.apply(segment_customer, axis=1)
 
-# Segment distribution
-print("\nCustomer Segments:")
-segment_dist = rfm['segment'].value_counts()
-print(segment_dist)
+def rfm_scoring(inputs, params):
+    """RFM phase of the streaming pipeline, fed by pre-aggregated metrics"""
+    print("\n[Bonus] RFM Customer Value Analysis")
+    print("-" * 70)
+    return report_rfm(inputs['rfm_metrics'].copy(), params)
 
-# Save RFM results
-rfm.to_csv(DATA_PROCESSED / "rfm_analysis.csv", index=False)
-print(f"\nSaved RFM analysis to: {DATA_PROCESSED / 'rfm_analysis.csv'}")
 
-# Visualize RFM
-fig, axes = plt.subplots(2, 2, figsize=(16, 12))
+def report_rfm(rfm, params):
+    print(f"\nRFM metrics calculated for {len(rfm)} users")
+    print(rfm.describe())
 
-# RFM distributions
-axes[0, 0].hist(rfm['recency'], bins=30, color='skyblue', edgecolor='black', alpha=0.7)
-axes[0, 0].set_xlabel('Recency (Days)')
-axes[0, 0].set_ylabel('Count')
-axes[0, 0].set_title('Recency Distribution', fontweight='bold')
+    cut_points = rfm_cut_points(rfm, params)
+    rfm = score_rfm(rfm, params, cut_points)
+    boundaries = rfm_boundaries(rfm, cut_points, params)
+    if params['quantiles'] == 'sketch':
+        print("\nSketch boundary drift (vs exact on sample):")
+        print(boundaries.round(4).to_string(index=False))
 
-axes[0, 1].hist(rfm['frequency'], bins=30, color='lightgreen', edgecolor='black', alpha=0.7)
-axes[0, 1].set_xlabel('Frequency (Purchases)')
-axes[0, 1].set_ylabel('Count')
-axes[0, 1].set_title('Frequency Distribution', fontweight='bold')
+    # Segment distribution
+    print("\nCustomer Segments:")
+    segment_dist = rfm['segment'].value_counts()
+    print(segment_dist)
 
-axes[1, 0].hist(rfm['monetary'], bins=30, color='coral', edgecolor='black', alpha=0.7)
-axes[1, 0].set_xlabel('Monetary (Quantity)')
-axes[1, 0].set_ylabel('Count')
-axes[1, 0].set_title('Monetary Distribution', fontweight='bold')
+    chart_data = {metric: histogram(rfm[metric], bins=30) for metric in RFM_METRICS}
+    chart_data['segments'] = {segment: int(count) for segment, count in segment_dist.items()}
 
-# Segment distribution
-segment_colors = plt.cm.Set3(range(len(segment_dist)))
-axes[1, 1].pie(segment_dist.values, labels=segment_dist.index, autopct='%1.1f%%',
-               colors=segment_colors, startangle=90)
-axes[1, 1].set_title('Customer Segment Distribution', fontweight='bold')
+    return {
+        'rfm_analysis': rfm,
+        'rfm_boundaries': boundaries,
+        'chart_rfm.json': chart_data,
+    }
+
+
+# ============================================
+# Pipeline definition
+# ============================================
+PHASES = [
+    Phase('clean', clean,
+          inputs=[BABY_RAW, TRADE_RAW],
+          outputs=['baby_clean', 'trade_clean', 'merged_data', 'overview.json', DICTIONARY_FILE, QUARANTINE],
+          params=CLEAN_PARAMS,
+          code=[validate_baby, validate_trades, split, clean_baby, clean_trades, merge_baby, age_months,
+                build_dictionary, encode]),
+    Phase('profile', user_profile,
+          inputs=['baby_clean', 'merged_data'],
+          outputs=['age_group_stats', 'chart_profile.json'],
+          params={**PROFILE_PARAMS, **DISTINCT_PARAMS},
+          code=[group_stats]),
+    Phase('product', product,
+          inputs=['merged_data'],
+          outputs=['category_stats', 'top_products', 'chart_product.json'],
+          params={**PRODUCT_PARAMS, **DISTINCT_PARAMS},
+          code=[group_stats]),
+    Phase('trend', time_trend,
+          inputs=['merged_data', 'daily_sales'],
+          outputs=['monthly_sales', 'yearly_stats', 'monthly_user_sketches'],
+          params=DISTINCT_PARAMS,
+          code=[period_users, daily_rollup]),
+    Phase('timeseries', timeseries_phase,
+          inputs=['trade_clean'],
+          outputs=['daily_sales', 'daily_user_state'],
+          params=TIMESERIES_PARAMS,
+          code=[build_daily, active_users, add_rolling, rolling_sum]),
+    Phase('cube', sales_cube,
+          inputs=['merged_data'],
+          outputs=['sales_cube'],
+          params={**PROFILE_PARAMS, **CUBE_PARAMS},
+          code=[build_cube]),
+    Phase('lifecycle', lifecycle_phase,
+          inputs=['merged_data'],
+          outputs=['lifecycle_index', 'lifecycle_stages', LIFECYCLE_META],
+          params={**PROFILE_PARAMS, **LIFECYCLE_PARAMS},
+          code=[build_lifecycle_index, lifecycle_stages]),
+    Phase('cohorts', cohorts_phase,
+          inputs=['trade_clean'],
+          outputs=['cohort_retention', 'repurchase_intervals', 'repurchase_summary.json'],
+          params=COHORT_PARAMS,
+          code=[sort_trades, retention, purchase_gaps, interval_distribution, summarize]),
+    Phase('associations', associations_phase,
+          inputs=['trade_clean'],
+          outputs=['category_rules', 'product_rules'],
+          params=ASSOCIATION_PARAMS,
+          code=[mine, pair_users, association_rules]),
+    Phase('hierarchy', hierarchy_phase,
+          inputs=['trade_clean'],
+          outputs=['cat_hierarchy', 'category_rollup', 'subcategory_stats', 'top_subcategories'],
+          params=HIERARCHY_PARAMS,
+          code=[build_hierarchy, rollup, top_k_per_parent]),
+    Phase('properties', properties_phase,
+          inputs=['trade_clean'],
+          outputs=['trade_properties', 'property_attributes'],
+          code=[build_index, parse_properties]),
+    Phase('rfm', rfm_analysis,
+          inputs=['merged_data'],
+          outputs=['rfm_analysis', 'rfm_boundaries', 'chart_rfm.json'],
+          params=RFM_PARAMS,
+          code=[rfm_metrics, user_rfm, report_rfm, score_rfm, rfm_cut_points, rfm_boundaries, segment_masks]),
+    Phase('lookup', lookup_phase,
+          inputs=['merged_data', 'baby_clean', 'rfm_analysis'],
+          outputs=[USER_INDEX],
+          code=[build_user_index]),
+]
+
+# Figures are drawn from the small aggregates above; stale ones are rendered
+# together in a process pool after the data phases (see Pipeline.run). They
+# are referenced by name so matplotlib is only imported when a chart is drawn.
+TREND_CHART = Phase('trend_chart', 'charts:time_trend_chart', inputs=['monthly_sales'],
+                    outputs=['time_trend_analysis.png'])
+RFM_CHART = Phase('rfm_chart', 'charts:rfm_chart', inputs=['chart_rfm.json'], outputs=['rfm_analysis.png'])
+PHASES += [
+    Phase('profile_chart', 'charts:user_profile_chart', inputs=['chart_profile.json'],
+          outputs=['user_profile_analysis.png']),
+    Phase('product_chart', 'charts:product_chart', inputs=['category_stats', 'top_products', 'chart_product.json'],
+          outputs=['product_analysis.png'], params=PRODUCT_CHART_PARAMS),
+    TREND_CHART,
+    RFM_CHART,
+]
+
+
+def streaming_phases():
+    """Phases for --streaming: chunked ingestion feeding incremental aggregators"""
+    from streaming import stream_aggregate, iter_trade_chunks, GroupAccumulator, RFMAccumulator
+
+    params = {**CLEAN_PARAMS, **PROFILE_PARAMS, **DISTINCT_PARAMS, 'chunksize': 1_000_000}
+    return [
+        Phase('stream', stream_aggregate,
+              inputs=[BABY_RAW, TRADE_RAW],
+              outputs=['overview.json', 'age_group_stats', 'category_stats',
+                       'monthly_sales', 'yearly_stats', 'rfm_metrics', QUARANTINE],
+              params=params,
+              code=[iter_trade_chunks, GroupAccumulator, RFMAccumulator,
+                    validate_baby, validate_trades, split, clean_baby, clean_trades, merge_baby, age_months]),
+        Phase('rfm', rfm_scoring,
+              inputs=['rfm_metrics'],
+              outputs=['rfm_analysis', 'rfm_boundaries', 'chart_rfm.json'],
+              params=RFM_PARAMS,
+              code=[report_rfm, score_rfm, rfm_cut_points, rfm_boundaries, segment_masks]),
+        TREND_CHART,
+        RFM_CHART,
+    ]
+
+
+def build_pipeline(raw_dir=DATA_RAW, processed_dir=DATA_PROCESSED, output_dir=DATA_OUTPUT, fmt=None,
+                   streaming=False):
+    store = ArtifactStore(raw_dir, processed_dir, output_dir, fmt=fmt)
+    phases = streaming_phases() if streaming else PHASES
+    return Pipeline(phases, store, Path(processed_dir) / "pipeline_manifest.json")
 
-plt.tight_layout()
-plt.savefig(DATA_OUTPUT / "rfm_analysis.png", dpi=150, bbox_inches='tight')
-print(f"  Saved: rfm_analysis.png")
-plt.close()
 
 # ============================================
 # Summary Report
 # ============================================
-print("\n" + "=" * 70)
-print("Analysis Complete!")
-print("=" * 70)
-
-print("\n[Key Findings]:")
-print(f"  - Total users: {baby_df['user_id'].nunique():,}")
-print(f"  - Total transactions: {len(trade_clean):,}")
-print(f"  - Total quantity sold: {trade_clean['buy_mount'].sum():,}")
-print(f"  - Average purchase quantity: {trade_clean['buy_mount'].mean():.2f}")
-print(f"  - Date range: {trade_clean['day'].min().date()} to {trade_clean['day'].max().date()}")
-
-print(f"\n[Top Category]: {category_stats.index[0]} ({category_stats.iloc[0]['purchase_count']} purchases)")
-print(f"[Champions]: {segment_dist.get('Champions', 0)} customers ({segment_dist.get('Champions', 0)/len(rfm)*100:.1f}%)")
-
-print("\n[Output Files]:")
-print(f"  Processed data: {DATA_PROCESSED}")
-print(f"  Visualizations: {DATA_OUTPUT}")
-for f in DATA_OUTPUT.glob("*.png"):
-    print(f"    - {f.name}")
-
-print("\n" + "=" * 70)
+def print_summary(pipeline):
+    overview = pipeline.load('overview.json')
+    category_stats = pipeline.load('category_stats')
+    rfm = pipeline.load('rfm_analysis')
+    segment_dist = rfm['segment'].value_counts()
+    output_dir = pipeline.store.output_dir
+
+    print("\n" + "=" * 70)
+    print("Analysis Complete!")
+    print("=" * 70)
+
+    print("\n[Key Findings]:")
+    print(f"  - Total users: {overview['total_users']:,}")
+    print(f"  - Total transactions: {overview['total_transactions']:,}")
+    print(f"  - Total quantity sold: {overview['total_quantity']:,}")
+    print(f"  - Average purchase quantity: {overview['avg_quantity']:.2f}")
+    print(f"  - Date range: {overview['date_min']} to {overview['date_max']}")
+
+    print(f"\n[Top Category]: {category_stats.index[0]} ({category_stats.iloc[0]['purchase_count']} purchases)")
+    print(f"[Champions]: {segment_dist.get('Champions', 0)} customers ({segment_dist.get('Champions', 0)/len(rfm)*100:.1f}%)")
+
+    print("\n[Output Files]:")
+    print(f"  Processed data: {pipeline.store.processed_dir}")
+    print(f"  Visualizations: {output_dir}")
+    for f in output_dir.glob("*.png"):
+        print(f"    - {f.name}")
+
+    print("\n" + "=" * 70)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Taobao maternity analysis pipeline")
+    parser.add_argument('phases', nargs='*',
+                        help=f"phases to build (default: all). Choices: {', '.join(p.name for p in PHASES)}")
+    parser.add_argument('--force', action='store_true',
+                        help="re-run the selected phases even if they are up to date")
+    parser.add_argument('--config', type=Path,
+                        help="JSON file of per-phase parameter overrides, e.g. {\"clean\": {\"max_buy_mount\": 50}}")
+    parser.add_argument('--raw-dir', type=Path, default=DATA_RAW)
+    parser.add_argument('--processed-dir', type=Path, default=DATA_PROCESSED)
+    parser.add_argument('--output-dir', type=Path, default=DATA_OUTPUT)
+    parser.add_argument('--format', choices=FORMATS, default=None,
+                        help="storage format for processed tables (default: parquet if pyarrow is installed)")
+    parser.add_argument('--streaming', action='store_true',
+                        help="read the trade history in chunks and aggregate incrementally "
+                             "(bounded memory, never materializes merged_data)")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="processes for the groupby-heavy phases (results match the serial path)")
+    parser.add_argument('--chunksize', type=int,
+                        help="rows per chunk in --streaming mode (default: 1,000,000)")
+    parser.add_argument('--no-charts', action='store_true',
+                        help="headless batch run: build the data artifacts but skip every figure")
+    instrument.add_arguments(parser)
+    return parser.parse_args(argv)
+
+
+def phase_overrides(args):
+    """Per-phase parameter overrides from --config, --chunksize and --workers"""
+    overrides = {}
+    if args.config:
+        with open(args.config, encoding='utf-8') as f:
+            overrides = json.load(f)
+    if args.chunksize:
+        overrides.setdefault('stream', {})['chunksize'] = args.chunksize
+    if args.workers > 1:
+        for phase in ('profile', 'product', 'trend', 'rfm'):
+            overrides.setdefault(phase, {})['workers'] = args.workers
+    return overrides
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    overrides = phase_overrides(args)
+
+    print("=" * 70)
+    print("Taobao Maternity Shopping Data Analysis")
+    print("=" * 70)
+
+    pipeline = build_pipeline(args.raw_dir, args.processed_dir, args.output_dir, fmt=args.format,
+                              streaming=args.streaming)
+    force = set(args.phases or pipeline.phases) if args.force else False
+    with instrument.from_args(args, profile_dir=args.processed_dir / "profiles"):
+        executed = pipeline.run(args.phases or None, force=force, overrides=overrides,
+                                charts=not args.no_charts)
+    print(f"\nExecuted phases: {', '.join(executed) if executed else 'none (all up to date)'}")
+
+    if not args.phases:
+        print_summary(pipeline)
+
+
+if __name__ == "__main__":
+    main()
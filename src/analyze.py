@@ -0,0 +1,129 @@
+"""
+Command-line entry point for scheduled and interactive runs
+Every subcommand imports what it needs when it runs: pandas is only loaded by
+the pipeline commands, matplotlib and seaborn only when a figure is drawn,
+python-pptx only by `report`, and pyarrow only when a table is read or written.
+An up-to-date `clean` or `rfm` therefore starts in a fraction of the time of
+`src/analysis.py`, which matters for cron jobs that poll many times a day.
+
+    python src/analyze.py clean    # cleaned tables (Phase 1)
+    python src/analyze.py rfm      # RFM table and boundaries, no figures
+    python src/analyze.py charts   # (re)draw the stale figures
+    python src/analyze.py report   # PowerPoint deck (report --by segment: one per segment)
+    python src/analyze.py bench    # cold-start time of the subcommands
+"""
+import argparse
+import sys
+from pathlib import Path
+
+import instrument
+
+PROJECT_DIR = Path(__file__).parent.parent
+HEAVY_MODULES = ('pandas', 'pyarrow', 'matplotlib', 'seaborn', 'pptx')
+
+
+def build_pipeline(args):
+    from analysis import DATA_OUTPUT, DATA_PROCESSED, DATA_RAW, build_pipeline
+    return build_pipeline(args.raw_dir or DATA_RAW, args.processed_dir or DATA_PROCESSED,
+                          args.output_dir or DATA_OUTPUT, fmt=args.format, streaming=args.streaming)
+
+
+def run_phases(args, targets, charts):
+    from analysis import phase_overrides
+
+    pipeline = build_pipeline(args)
+    targets = targets or [name for name, phase in pipeline.phases.items() if phase.draws_figures]
+    with instrument.from_args(args, profile_dir=pipeline.store.processed_dir / "profiles"):
+        executed = pipeline.run(targets, force=set(targets) if args.force else False,
+                                overrides=phase_overrides(args), charts=charts)
+    print(f"Executed phases: {', '.join(executed) if executed else 'none (all up to date)'}")
+
+
+def clean(args):
+    run_phases(args, ['clean'], charts=False)
+
+
+def rfm(args):
+    run_phases(args, ['rfm'], charts=False)
+
+
+def charts(args):
+    run_phases(args, [], charts=True)
+
+
+def report(args):
+    import importlib.util
+    spec = importlib.util.spec_from_file_location('create_ppt', PROJECT_DIR / 'create_ppt.py')
+    create_ppt = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(create_ppt)
+    create_ppt.main(args.options)
+
+
+def bench(args):
+    """Median wall time of fresh interpreter runs of each subcommand"""
+    import statistics
+    import subprocess
+    import time
+
+    options = []
+    for flag in ('raw_dir', 'processed_dir', 'output_dir', 'format'):
+        if getattr(args, flag):
+            options += [f"--{flag.replace('_', '-')}", str(getattr(args, flag))]
+    commands = [['--help'], ['clean', *options], ['rfm', *options]]
+
+    print(f"{'command':<12}{'median_s':>10}{'min_s':>10}  heavy modules imported")
+    for command in commands:
+        argv = [sys.executable, __file__, *command]
+        # Warm-up run: brings the pipeline up to date and the files into the page cache
+        subprocess.run(argv, capture_output=True, check=True)
+        times = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            subprocess.run(argv, capture_output=True, check=True)
+            times.append(time.perf_counter() - start)
+        traced = subprocess.run([sys.executable, '-X', 'importtime', *argv[1:]],
+                                capture_output=True, text=True, check=True)
+        imported = {line.rsplit('|', 1)[-1].strip().split('.')[0]
+                    for line in traced.stderr.splitlines() if line.startswith('import time:')}
+        heavy = ', '.join(m for m in HEAVY_MODULES if m in imported) or '-'
+        print(f"{command[0]:<12}{statistics.median(times):>10.3f}{min(times):>10.3f}  {heavy}")
+
+
+def parse_args(argv=None):
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--force', action='store_true', help="re-run the phases even if they are up to date")
+    common.add_argument('--config', type=Path, help="JSON file of per-phase parameter overrides")
+    common.add_argument('--raw-dir', type=Path)
+    common.add_argument('--processed-dir', type=Path)
+    common.add_argument('--output-dir', type=Path)
+    common.add_argument('--format', choices=('parquet', 'csv'))
+    common.add_argument('--streaming', action='store_true', help="chunked ingestion (see analysis.py --help)")
+    common.add_argument('--workers', type=int, default=1, help="processes for the groupby-heavy phases")
+    common.add_argument('--chunksize', type=int, help="rows per chunk in --streaming mode")
+    instrument.add_arguments(common)
+
+    parser = argparse.ArgumentParser(description="Taobao maternity analysis")
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('clean', parents=[common], help="load, encode and clean the raw data").set_defaults(func=clean)
+    commands.add_parser('rfm', parents=[common], help="RFM scoring and segments").set_defaults(func=rfm)
+    commands.add_parser('charts', parents=[common], help="draw the stale figures").set_defaults(func=charts)
+    commands.add_parser('report', help="build PowerPoint decks (options as in create_ppt.py)").set_defaults(func=report)
+    bench_parser = commands.add_parser('bench', parents=[common], help="measure subcommand cold-start time")
+    bench_parser.add_argument('--repeat', type=int, default=5)
+    bench_parser.set_defaults(func=bench)
+
+    # `report` forwards its options to create_ppt.py
+    args, options = parser.parse_known_args(argv)
+    if options and args.command != 'report':
+        parser.error(f"unrecognized arguments: {' '.join(options)}")
+    args.options = options
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""
+Co-purchase association rules over categories and products
+Pairs of items (categories or auction_ids) bought by the same user within
+`within_days` days of each other, with support, confidence and lift:
+
+  support(A, B)     users with such a pair / all users
+  confidence(A->B)  users with such a pair / users who bought A
+  lift(A, B)        support(A, B) / (support(A) * support(B))
+
+Everything is sparse matrix algebra (scipy.sparse) on integer codes. With the
+distinct (user, day) purchase events E (events x items) and S linking each
+event to the events of the same user at most `within_days` apart, W = S @ E
+holds the items bought around each event. Rows of (user, item A) times W give
+the items B bought near A by that user; binarized and summed per A, that is
+the item x item matrix of users. Without a day limit it is simply X.T @ X
+over the user x item matrix X.
+
+Items below the minimum support are dropped before any product: a pair is
+never more frequent than its rarer item, so the pair count stays bounded.
+
+  - category_rules  rules between top-level categories
+  - product_rules   rules between auction_ids
+(within_days is -1 in the tables when the phase runs with within_days=None,
+i.e. any two purchases of the same user count.)
+
+    python src/associations.py                               # strongest category rules
+    python src/associations.py --level product --item auction_00014567
+    python src/associations.py --within 7 --min-support 0.005  # re-mine from trade_clean
+"""
+import argparse
+import importlib.util
+
+import numpy as np
+import pandas as pd
+
+ASSOCIATION_PARAMS = {'within_days': 30, 'min_support': 0.001}
+LEVELS = {'category': 'category', 'product': 'auction_id'}
+
+
+def has_scipy():
+    return importlib.util.find_spec('scipy') is not None
+
+
+def _sparse():
+    """scipy.sparse, imported on first use"""
+    if not has_scipy():
+        raise ImportError("Association mining requires scipy: pip install scipy")
+    import scipy.sparse as sp
+    return sp
+
+
+def _binary(matrix):
+    matrix = matrix.tocsr()
+    matrix.sum_duplicates()
+    matrix.data[:] = 1
+    return matrix
+
+
+def _ranges(starts, stops):
+    """Concatenation of the ranges [start, stop) and the row each comes from"""
+    lengths = stops - starts
+    rows = np.repeat(np.arange(len(starts)), lengths)
+    return rows, np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths) + starts[rows]
+
+
+def pair_users(users, days, items, n_items, within_days=None):
+    """Item x item sparse matrix of users who bought both items
+
+    `users`, `days` and `items` are integer codes of the distinct purchases.
+    With within_days the two purchases must be at most that many days
+    apart. The diagonal holds the users of each item.
+    """
+    sp = _sparse()
+    users = pd.factorize(users)[0]
+    n_users = users.max() + 1 if len(users) else 0
+    if within_days is None:
+        x = _binary(sp.csr_matrix((np.ones(len(users)), (users, items)), shape=(n_users, n_items)))
+        return (x.T @ x).tocsr()
+
+    # Purchase events: distinct (user, day), sorted, with a key that keeps
+    # each user's days apart from the next user's
+    low = days.min()
+    span = int(days.max() - low) + 2 * within_days + 1
+    key = users.astype(np.int64) * span + (days - low)
+    events, event_of = np.unique(key, return_inverse=True)
+    e = _binary(sp.csr_matrix((np.ones(len(key)), (event_of, items)), shape=(len(events), n_items)))
+
+    # S links each event to the events of the same user within the window
+    rows, cols = _ranges(np.searchsorted(events, events - within_days, side='left'),
+                         np.searchsorted(events, events + within_days, side='right'))
+    s = sp.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(len(events), len(events)))
+    near = _binary(s @ e)
+
+    # (user, item) rows -> items bought near that item, one count per user
+    user_item, pair_of = np.unique(users.astype(np.int64) * n_items + items, return_inverse=True)
+    ua = sp.csr_matrix((np.ones(len(key)), (pair_of, event_of)), shape=(len(user_item), len(events)))
+    together = _binary(ua @ near)
+    per_item = sp.csr_matrix((np.ones(len(user_item)), (user_item % n_items, np.arange(len(user_item)))),
+                             shape=(n_items, len(user_item)))
+    return (per_item @ together).tocsr()
+
+
+def association_rules(counts, n_users, labels, min_support):
+    """Rules in both directions for the pairs at or above `min_support`"""
+    item_users = counts.diagonal()
+    upper = counts.tocoo()
+    keep = (upper.row < upper.col) & (upper.data >= min_support * n_users)
+    a, b, together = upper.row[keep], upper.col[keep], upper.data[keep].astype(np.int64)
+    antecedent, consequent = np.r_[a, b], np.r_[b, a]
+    together = np.r_[together, together]
+    rules = pd.DataFrame({
+        'antecedent': labels[antecedent],
+        'consequent': labels[consequent],
+        'pair_users': together,
+        'antecedent_users': item_users[antecedent].astype(np.int64),
+        'consequent_users': item_users[consequent].astype(np.int64),
+        'support': together / n_users,
+        'confidence': together / item_users[antecedent],
+        'lift': together * n_users / (item_users[antecedent] * item_users[consequent]),
+    })
+    return rules.sort_values(['pair_users', 'lift', 'antecedent'], ascending=[False, False, True],
+                             ignore_index=True)
+
+
+def mine(trades, column, within_days=None, min_support=0.001):
+    """Association rules between the values of `column`, mined from trades"""
+    values = trades[column]
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        items, labels = values.cat.codes.to_numpy(), values.cat.categories
+    else:
+        items, labels = pd.factorize(values, sort=True)
+    users = trades['user_id'].cat.codes.to_numpy() if isinstance(trades['user_id'].dtype, pd.CategoricalDtype) \
+        else pd.factorize(trades['user_id'])[0]
+    days = trades['day'].to_numpy().astype('datetime64[D]').astype(np.int64)
+    n_users = len(np.unique(users))
+
+    # Prune rare items first (apriori): only items with enough users can pair
+    item_user = np.unique(users.astype(np.int64) * len(labels) + items)
+    item_users = np.bincount(item_user % len(labels), minlength=len(labels))
+    frequent = item_users >= min_support * n_users
+    keep = frequent[items]
+    kept_items = np.flatnonzero(frequent)
+    codes = np.searchsorted(kept_items, items[keep])
+    counts = pair_users(users[keep], days[keep], codes, len(kept_items), within_days)
+    rules = association_rules(counts, n_users, pd.Index(labels)[kept_items], min_support)
+    rules.insert(0, 'within_days', within_days if within_days is not None else -1)
+    return rules
+
+
+# ============================================
+# Pipeline phase
+# ============================================
+def associations_phase(inputs, params):
+    print("\n[Associations] Co-purchase Rules")
+    print("-" * 70)
+    trades = inputs['trade_clean']
+    outputs = {}
+    for level, column in LEVELS.items():
+        rules = mine(trades, column, params['within_days'], params['min_support'])
+        print(f"  {level}: {len(rules) // 2:,} pairs within {params['within_days']} days "
+              f"at support >= {params['min_support']}")
+        outputs[f'{level}_rules'] = rules
+    print(outputs['category_rules'].head(6).round(4).to_string(index=False))
+    return outputs
+
+
+def main(argv=None):
+    from analysis import DATA_OUTPUT, DATA_PROCESSED, DATA_RAW
+    from storage import ArtifactStore, FORMATS
+
+    parser = argparse.ArgumentParser(description="Co-purchase association rules")
+    parser.add_argument('--level', choices=list(LEVELS), default='category')
+    parser.add_argument('--item', help="only rules with this antecedent")
+    parser.add_argument('--by', choices=['pair_users', 'confidence', 'lift'], default='lift')
+    parser.add_argument('--top', type=int, default=20)
+    parser.add_argument('--within', type=int, help="re-mine with this day window (reads trade_clean)")
+    parser.add_argument('--min-support', type=float, help="re-mine with this minimum support")
+    parser.add_argument('--processed-dir', default=DATA_PROCESSED)
+    parser.add_argument('--format', choices=FORMATS)
+    args = parser.parse_args(argv)
+
+    store = ArtifactStore(DATA_RAW, args.processed_dir, DATA_OUTPUT, fmt=args.format)
+    name = f'{args.level}_rules'
+    if args.within is not None or args.min_support is not None:
+        trades = store.load('trade_clean', columns=['user_id', 'day', LEVELS[args.level]])
+        rules = mine(trades, LEVELS[args.level],
+                     args.within if args.within is not None else ASSOCIATION_PARAMS['within_days'],
+                     args.min_support if args.min_support is not None else ASSOCIATION_PARAMS['min_support'])
+    elif store.exists(name):
+        rules = store.load(name)
+    else:
+        raise SystemExit("No rules yet. Build them first: python src/analysis.py associations")
+    if args.item is not None:
+        rules = rules[rules['antecedent'].astype(str) == args.item]
+    rules = rules.sort_values(args.by, ascending=False)
+    print(rules.head(args.top).round(4).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+"""
+Benchmark suite: per-phase wall time, CPU time and peak memory
+Runs the full pipeline against generated datasets of increasing size, each in
+a fresh interpreter so memory peaks do not leak between runs. Every stage the
+pipeline reports (load, clean, merge, profile, product, trend, rfm, save,
+render, ...) is measured with instrument.ResourceMonitor, and the results are
+written as JSON. Comparing against a stored baseline flags the stages that got
+slower or hungrier, for sizing batch machines and catching regressions.
+
+Baseline runs and comparisons take the median of 3 runs per size by default,
+and a stage only counts as a regression when it grows by more than the
+tolerance and by more than a share of its run's total (NOISE_SHARE). Short
+stages jitter by a few percent of the whole run, whatever their own size.
+
+    python src/benchmark.py                                   # 10K, 100K, 1M trades
+    python src/benchmark.py --sizes 10M 100M --no-charts      # machine sizing
+    python src/benchmark.py --raw-format parquet --streaming  # from Parquet shards
+    python src/benchmark.py --save-baseline                   # store the current numbers
+    python src/benchmark.py --baseline data/bench/baseline.json --tolerance 0.2
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+PROJECT_DIR = Path(__file__).parent.parent
+BENCH_DIR = PROJECT_DIR / "data" / "bench"
+DEFAULT_SIZES = ['10K', '100K', '1M']
+METRICS = ['wall_s', 'cpu_s', 'peak_rss_mb']
+# Differences below these are noise, whatever the relative change: an
+# absolute minimum, and a share of the baseline run's total at the same size
+# (two runs of the same tree differ by up to ~2.5% of the run's wall time and
+# ~5% of its peak RSS in a single stage)
+MIN_DELTA = {'wall_s': 0.05, 'cpu_s': 0.05, 'peak_rss_mb': 8.0}
+NOISE_SHARE = {'wall_s': 0.05, 'cpu_s': 0.05, 'peak_rss_mb': 0.1}
+BASELINE_REPEAT = 3  # default runs per size when saving or comparing a baseline
+USERS_PER_TRADE = 1 / 15  # same ratio as the demo data
+
+
+def parse_size(text):
+    """'10K', '2.5M', '100M' or '15000' -> number of trades"""
+    text = text.strip().upper()
+    scale = {'K': 10**3, 'M': 10**6, 'B': 10**9}.get(text[-1:], 1)
+    return int(float(text[:-1] if scale > 1 else text) * scale)
+
+
+# ============================================
+# One measured run (executed in a child interpreter)
+# ============================================
+def measure(raw_dir, work_dir, fmt=None, workers=1, charts=True, streaming=False):
+    """Run the whole pipeline once from scratch; returns the run record"""
+    import resource
+
+    from analysis import build_pipeline, phase_overrides
+    from instrument import monitoring
+
+    shutil.rmtree(work_dir, ignore_errors=True)
+    pipeline = build_pipeline(raw_dir, Path(work_dir) / "processed", Path(work_dir) / "output",
+                              fmt=fmt, streaming=streaming)
+    overrides = phase_overrides(argparse.Namespace(config=None, chunksize=None, workers=workers))
+    with monitoring() as monitor:
+        start, cpu = time.perf_counter(), time.process_time()
+        pipeline.run(force=True, overrides=overrides, charts=charts)
+        wall, cpu = time.perf_counter() - start, time.process_time() - cpu
+
+    stages = monitor.totals()
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    # The run peak is the highest stage peak (VmHWM, reset per span): ru_maxrss
+    # would include the parent's peak, inherited across fork/exec
+    return {
+        'wall_s': wall,
+        'cpu_s': cpu + children.ru_utime + children.ru_stime,
+        'peak_rss_mb': max((s['peak_rss_mb'] for s in stages), default=0.0),
+        'stages': sorted(stages, key=lambda r: r['parent'] is not None),
+    }
+
+
+# ============================================
+# Suite
+# ============================================
+def dataset(trades, seed, data_dir, raw_format='csv'):
+    """Generated raw data for `trades` rows, reused across benchmark runs
+
+    'csv' is one file per table; 'parquet' is a directory of Parquet shards.
+    """
+    from generate_sample_data import generate
+
+    raw_dir = Path(data_dir) / f"raw-{trades}-seed{seed}{'' if raw_format == 'csv' else '-' + raw_format}"
+    marker = raw_dir / ".complete"
+    if not marker.exists():
+        print(f"Generating {trades:,} trades into {raw_dir}")
+        generate(raw_dir, users=max(1000, int(trades * USERS_PER_TRADE)), trades=trades, seed=seed,
+                 fmt=raw_format)
+        marker.touch()
+    return raw_dir
+
+
+def run_suite(sizes, repeat=1, seed=42, data_dir=BENCH_DIR, fmt=None, workers=1, charts=True,
+              streaming=False, raw_format='csv'):
+    runs = []
+    for trades in sizes:
+        raw_dir = dataset(trades, seed, data_dir, raw_format)
+        work_dir = Path(data_dir) / f"work-{trades}"
+        result_file = Path(data_dir) / f"run-{trades}.json"
+        samples = []
+        for i in range(repeat):
+            print(f"Running pipeline on {trades:,} trades ({i + 1}/{repeat})...", flush=True)
+            command = [sys.executable, __file__, '--measure', str(raw_dir), str(work_dir), str(result_file),
+                       '--workers', str(workers)]
+            command += ['--format', fmt] if fmt else []
+            command += [] if charts else ['--no-charts']
+            command += ['--streaming'] if streaming else []
+            done = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+            if done.returncode != 0:
+                raise SystemExit(f"Benchmark run failed on {trades:,} trades:\n{done.stderr}")
+            samples.append(json.loads(result_file.read_text()))
+        result_file.unlink()
+        shutil.rmtree(work_dir, ignore_errors=True)
+        runs.append({'trades': trades, 'users': max(1000, int(trades * USERS_PER_TRADE)),
+                     **median_run(samples)})
+    return runs
+
+
+def median_run(samples):
+    """Per-metric median over repeated runs of the same size"""
+    run = {metric: statistics.median(s[metric] for s in samples) for metric in METRICS}
+    stages = []
+    for record in samples[0]['stages']:
+        same = [r for s in samples for r in s['stages']
+                if (r['stage'], r['parent']) == (record['stage'], record['parent'])]
+        stages.append({'stage': record['stage'], 'parent': record['parent'],
+                       **{metric: round(statistics.median(r[metric] for r in same), 4) for metric in METRICS}})
+    run['stages'] = stages
+    return {k: round(v, 4) if isinstance(v, float) else v for k, v in run.items()}
+
+
+def environment():
+    import numpy as np
+    import pandas as pd
+
+    commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=PROJECT_DIR,
+                            capture_output=True, text=True).stdout.strip()
+    return {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'commit': commit or None,
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+# ============================================
+# Baseline comparison
+# ============================================
+def compare(results, baseline, tolerance=0.2):
+    """Stages whose median metrics grew by more than `tolerance` over the baseline
+
+    Growth below the noise floor of the run's size (MIN_DELTA, NOISE_SHARE)
+    is never flagged.
+    """
+    previous = {}
+    for run in baseline['runs']:
+        previous[(run['trades'], 'total', None)] = run
+        for record in run['stages']:
+            previous[(run['trades'], record['stage'], record['parent'])] = record
+
+    regressions = []
+    for run in results['runs']:
+        current = [(('total', None), run)] + [((r['stage'], r['parent']), r) for r in run['stages']]
+        base_run = previous.get((run['trades'], 'total', None))
+        if base_run is None:
+            continue
+        floor = {metric: max(MIN_DELTA[metric], NOISE_SHARE[metric] * base_run[metric]) for metric in METRICS}
+        for (name, parent), record in current:
+            before = previous.get((run['trades'], name, parent))
+            if before is None:
+                continue
+            for metric in METRICS:
+                old, new = before[metric], record[metric]
+                if new - old > floor[metric] and new > old * (1 + tolerance):
+                    regressions.append({'trades': run['trades'], 'stage': name, 'parent': parent,
+                                        'metric': metric, 'baseline': old, 'current': new,
+                                        'change': round(new / old - 1, 4) if old else None})
+    return regressions
+
+
+def print_run(run):
+    print(f"\n{run['trades']:,} trades / {run['users']:,} users: {run['wall_s']:.2f}s wall, "
+          f"{run['cpu_s']:.2f}s CPU, peak RSS {run['peak_rss_mb']:.0f} MB")
+    print(f"  {'stage':<22}{'wall_s':>10}{'cpu_s':>10}{'peak_mb':>10}")
+    for record in run['stages']:
+        if record['parent'] is not None:
+            continue
+        rows = [record] + [r for r in run['stages'] if r['parent'] == record['stage']]
+        for r in rows:
+            name = r['stage'] if r is record else f"  {r['stage']}"
+            print(f"  {name:<22}{r['wall_s']:>10.3f}{r['cpu_s']:>10.3f}{r['peak_rss_mb']:>10.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline per phase on generated data")
+    parser.add_argument('--sizes', nargs='+', default=DEFAULT_SIZES,
+                        help="trade counts to run, e.g. 10K 100K 1M 10M 100M")
+    parser.add_argument('--repeat', type=int,
+                        help=f"runs per size, the median is reported (default: 1, or {BASELINE_REPEAT} "
+                             "with --baseline / --save-baseline)")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--data-dir', type=Path, default=BENCH_DIR,
+                        help="generated datasets (kept between runs) and scratch space")
+    parser.add_argument('--format', choices=('parquet', 'csv'))
+    parser.add_argument('--raw-format', choices=('csv', 'parquet'), default='csv',
+                        help="generated raw data: one CSV file per table, or Parquet shards")
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--streaming', action='store_true')
+    parser.add_argument('--no-charts', action='store_true')
+    parser.add_argument('--output', type=Path, help="results JSON (default: <data-dir>/results.json)")
+    parser.add_argument('--baseline', type=Path, help="results JSON to compare against")
+    parser.add_argument('--save-baseline', nargs='?', type=Path, const=BENCH_DIR / "baseline.json",
+                        help="also store the results as the baseline (default: data/bench/baseline.json)")
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help="relative growth flagged as a regression (default: 0.2 = +20%%)")
+    parser.add_argument('--measure', nargs=3, metavar=('RAW_DIR', 'WORK_DIR', 'RESULT'), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.measure:
+        raw_dir, work_dir, result_file = args.measure
+        record = measure(raw_dir, work_dir, fmt=args.format, workers=args.workers,
+                         charts=not args.no_charts, streaming=args.streaming)
+        Path(result_file).write_text(json.dumps(record))
+        return
+
+    if args.repeat is None:
+        args.repeat = BASELINE_REPEAT if args.baseline or args.save_baseline else 1
+    sizes = [parse_size(size) for size in args.sizes]
+    runs = run_suite(sizes, repeat=args.repeat, seed=args.seed, data_dir=args.data_dir, fmt=args.format,
+                     workers=args.workers, charts=not args.no_charts, streaming=args.streaming,
+                     raw_format=args.raw_format)
+    results = {
+        'environment': environment(),
+        'config': {'seed': args.seed, 'repeat': args.repeat, 'format': args.format,
+                   'raw_format': args.raw_format, 'workers': args.workers,
+                   'streaming': args.streaming, 'charts': not args.no_charts},
+        'runs': runs,
+    }
+    for run in runs:
+        print_run(run)
+
+    output = args.output or args.data_dir / "results.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2))
+    print(f"\nResults: {output}")
+    if args.save_baseline:
+        args.save_baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.save_baseline.write_text(json.dumps(results, indent=2))
+        print(f"Baseline saved: {args.save_baseline}")
+
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text())
+        regressions = compare(results, baseline, args.tolerance)
+        print(f"\nCompared with {args.baseline} (commit {baseline['environment'].get('commit')}, "
+              f"tolerance +{args.tolerance:.0%}):")
+        if baseline['config'].get('repeat', 1) < BASELINE_REPEAT:
+            print(f"  note: the baseline has {baseline['config'].get('repeat', 1)} run(s) per size; "
+                  f"save it with --repeat {BASELINE_REPEAT} or more for stable medians")
+        if not regressions:
+            print("  no regressions")
+            return
+        for r in regressions:
+            stage = f"{r['parent']}/{r['stage']}" if r['parent'] else r['stage']
+            print(f"  REGRESSION {r['trades']:>12,} trades  {stage:<20}{r['metric']:<13}"
+                  f"{r['baseline']:>10.3f} -> {r['current']:<10.3f}({r['change']:+.0%})")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""
+Chart rendering for the analysis figures
+Every figure is drawn from small aggregates (histogram counts, group stats,
+segment sizes) written by the analysis phases, never from merged_data. Each
+figure is its own pipeline phase, so a chart is only redrawn when its input
+aggregates or its drawing code change; the runner renders the stale ones in a
+process pool (see Pipeline.run) and skips them all in headless mode.
+"""
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import numpy as np
+import seaborn as sns
+
+# Setup matplotlib for Chinese characters
+plt.rcParams['font.sans-serif'] = ['SimHei', 'Microsoft YaHei', 'Arial Unicode MS', 'DejaVu Sans']
+plt.rcParams['axes.unicode_minus'] = False
+
+# Set style
+sns.set_style("whitegrid")
+plt.style.use('seaborn-v0_8-darkgrid')
+
+
+def plot_histogram(ax, hist, **style):
+    """Draw counts from analysis.histogram exactly as ax.hist(values) would"""
+    edges = np.asarray(hist['edges'])
+    ax.hist(edges[:-1], bins=edges, weights=hist['counts'], **style)
+
+
+# ============================================
+# Figures
+# ============================================
+def user_profile_chart(inputs, params):
+    data = inputs['chart_profile.json']
+    fig, axes = plt.subplots(1, 2, figsize=(14, 5))
+
+    # Gender pie chart
+    colors = ['#FF9999', '#66B2FF', '#99FF99']
+    gender = data['gender']
+    axes[0].pie(list(gender.values()), labels=list(gender), autopct='%1.1f%%',
+                colors=colors, startangle=90)
+    axes[0].set_title('Baby Gender Distribution', fontsize=14, fontweight='bold')
+
+    # Baby age distribution at time of purchase
+    plot_histogram(axes[1], data['baby_age'], color='skyblue', edgecolor='black', alpha=0.7)
+    # Purchases before birth, as one bar left of month 0
+    width = np.diff(data['baby_age']['edges'][:2])[0]
+    axes[1].bar(-width, data.get('baby_age_prenatal', 0), width=width, align='edge',
+                color='plum', edgecolor='black', alpha=0.7, label='Prenatal')
+    axes[1].set_xlabel('Baby Age (Months)')
+    axes[1].set_ylabel('Number of Purchases')
+    axes[1].set_title('Purchase Distribution by Baby Age', fontsize=14, fontweight='bold')
+    axes[1].axvline(data['baby_age_median'], color='red', linestyle='--',
+                    label=f"Median: {data['baby_age_median']:.1f} months")
+    axes[1].legend()
+
+    plt.tight_layout()
+    return {'user_profile_analysis.png': fig}
+
+
+def product_chart(inputs, params):
+    category_stats = inputs['category_stats']
+    top_products = inputs['top_products']
+    fig, axes = plt.subplots(2, 2, figsize=(16, 12))
+
+    # Top categories by purchase count
+    top_categories = category_stats.head(params['top_categories'])
+    axes[0, 0].barh(range(len(top_categories)), top_categories['purchase_count'], color='steelblue')
+    axes[0, 0].set_yticks(range(len(top_categories)))
+    axes[0, 0].set_yticklabels(top_categories.index)
+    axes[0, 0].set_xlabel('Purchase Count')
+    axes[0, 0].set_title('Top 10 Categories by Purchase Count', fontsize=12, fontweight='bold')
+    axes[0, 0].invert_yaxis()
+
+    # Category by quantity sold
+    axes[0, 1].barh(range(len(top_categories)), top_categories['total_quantity'], color='coral')
+    axes[0, 1].set_yticks(range(len(top_categories)))
+    axes[0, 1].set_yticklabels(top_categories.index)
+    axes[0, 1].set_xlabel('Total Quantity Sold')
+    axes[0, 1].set_title('Top 10 Categories by Quantity', fontsize=12, fontweight='bold')
+    axes[0, 1].invert_yaxis()
+
+    # Purchase quantity distribution
+    plot_histogram(axes[1, 0], inputs['chart_product.json']['buy_mount'],
+                   color='lightgreen', edgecolor='black', alpha=0.7)
+    axes[1, 0].set_xlabel('Purchase Quantity')
+    axes[1, 0].set_ylabel('Frequency')
+    axes[1, 0].set_title('Distribution of Purchase Quantities', fontsize=12, fontweight='bold')
+
+    # Top products
+    axes[1, 1].barh(range(len(top_products)), top_products['purchase_count'], color='mediumpurple')
+    axes[1, 1].set_yticks(range(len(top_products)))
+    axes[1, 1].set_yticklabels([f"Product {i+1}" for i in range(len(top_products))], fontsize=8)
+    axes[1, 1].set_xlabel('Purchase Count')
+    axes[1, 1].set_title('Top 20 Products', fontsize=12, fontweight='bold')
+    axes[1, 1].invert_yaxis()
+
+    plt.tight_layout()
+    return {'product_analysis.png': fig}
+
+
+def time_trend_chart(inputs, params):
+    monthly_sales = inputs['monthly_sales']
+    fig, axes = plt.subplots(3, 1, figsize=(16, 12))
+
+    # Purchase count trend
+    axes[0].plot(range(len(monthly_sales)), monthly_sales['purchase_count'],
+                 marker='o', linewidth=2, markersize=4, color='steelblue')
+    axes[0].set_ylabel('Purchase Count')
+    axes[0].set_title('Monthly Purchase Count Trend', fontsize=12, fontweight='bold')
+    axes[0].grid(True, alpha=0.3)
+
+    # Quantity trend
+    axes[1].plot(range(len(monthly_sales)), monthly_sales['total_quantity'],
+                 marker='s', linewidth=2, markersize=4, color='coral')
+    axes[1].set_ylabel('Total Quantity')
+    axes[1].set_title('Monthly Total Quantity Trend', fontsize=12, fontweight='bold')
+    axes[1].grid(True, alpha=0.3)
+
+    # Unique users trend
+    axes[2].plot(range(len(monthly_sales)), monthly_sales['unique_users'],
+                 marker='^', linewidth=2, markersize=4, color='green')
+    axes[2].set_ylabel('Unique Users')
+    axes[2].set_xlabel('Time Period')
+    axes[2].set_title('Monthly Unique Users Trend', fontsize=12, fontweight='bold')
+    axes[2].grid(True, alpha=0.3)
+
+    # Set x-axis labels (every 6 months)
+    tick_positions = range(0, len(monthly_sales), 6)
+    tick_labels = [str(monthly_sales.iloc[i]['year_month']) for i in tick_positions]
+    for ax in axes:
+        ax.set_xticks(tick_positions)
+        ax.set_xticklabels(tick_labels, rotation=45, ha='right')
+
+    plt.tight_layout()
+    return {'time_trend_analysis.png': fig}
+
+
+def rfm_chart(inputs, params):
+    data = inputs['chart_rfm.json']
+    fig, axes = plt.subplots(2, 2, figsize=(16, 12))
+
+    # RFM distributions
+    plot_histogram(axes[0, 0], data['recency'], color='skyblue', edgecolor='black', alpha=0.7)
+    axes[0, 0].set_xlabel('Recency (Days)')
+    axes[0, 0].set_ylabel('Count')
+    axes[0, 0].set_title('Recency Distribution', fontweight='bold')
+
+    plot_histogram(axes[0, 1], data['frequency'], color='lightgreen', edgecolor='black', alpha=0.7)
+    axes[0, 1].set_xlabel('Frequency (Purchases)')
+    axes[0, 1].set_ylabel('Count')
+    axes[0, 1].set_title('Frequency Distribution', fontweight='bold')
+
+    plot_histogram(axes[1, 0], data['monetary'], color='coral', edgecolor='black', alpha=0.7)
+    axes[1, 0].set_xlabel('Monetary (Quantity)')
+    axes[1, 0].set_ylabel('Count')
+    axes[1, 0].set_title('Monetary Distribution', fontweight='bold')
+
+    # Segment distribution
+    segments = data['segments']
+    segment_colors = plt.cm.Set3(range(len(segments)))
+    axes[1, 1].pie(list(segments.values()), labels=list(segments), autopct='%1.1f%%',
+                   colors=segment_colors, startangle=90)
+    axes[1, 1].set_title('Customer Segment Distribution', fontweight='bold')
+
+    plt.tight_layout()
+    return {'rfm_analysis.png': fig}
+
@@ -0,0 +1,200 @@
+"""
+Cohort retention and repurchase intervals
+The trades are sorted once by (user, day) on integer keys: the user's
+dictionary code and the day number. Everything else is read off that single
+ordering with vectorized diffs: each user's first purchase (their cohort
+month), the distinct (user, month) activity pairs behind the month-N
+retention matrix, and the gaps between a user's successive purchase days.
+No per-user Python loop is involved, so tens of millions of trades take a
+single argsort plus a few linear passes.
+
+The `cohorts` phase writes, next to the RFM tables:
+  - cohort_retention        one row per (cohort month, month N): active users,
+                            cohort size and retention rate
+  - repurchase_intervals    distribution of days between distinct purchase days
+  - repurchase_summary.json repurchase rate, interval percentiles and the
+                            average month-1/3/6/12 retention
+
+    python src/cohorts.py               # retention matrix and interval summary
+"""
+import argparse
+
+import numpy as np
+import pandas as pd
+
+COHORT_PARAMS = {
+    # Lower edges (days) of the interval bins; the last bin is open-ended
+    'interval_edges': [1, 8, 15, 31, 61, 91, 181, 366],
+    'summary_months': [1, 3, 6, 12],
+}
+
+
+def sort_trades(user_codes, days):
+    """Order of the trades by (user, day), with the sorted keys
+
+    `user_codes` are non-negative integer user ids (dictionary codes) and
+    `days` are day numbers; both are packed into one int64 key so a single
+    argsort does the work of a two-key lexsort.
+    """
+    user_codes = np.asarray(user_codes, dtype=np.int64)
+    days = np.asarray(days, dtype=np.int64)
+    low = days.min() if len(days) else 0
+    span = int(days.max() - low + 1) if len(days) else 1
+    order = np.argsort(user_codes * span + (days - low), kind='stable')
+    return order, user_codes[order], days[order]
+
+
+def user_starts(users):
+    """Positions where a new user begins in the sorted user array"""
+    return np.flatnonzero(np.r_[True, users[1:] != users[:-1]]) if len(users) else np.array([], dtype=np.int64)
+
+
+def retention(users, days):
+    """Long-form month-N retention from (user, day)-sorted arrays"""
+    months = days.astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+    starts = user_starts(users)
+    cohort = np.repeat(months[starts], np.diff(np.r_[starts, len(users)]))
+    offset = months - cohort
+
+    # Sorted by (user, day) means sorted by (user, month): distinct activity
+    # pairs are where either changes
+    active = np.r_[True, (users[1:] != users[:-1]) | (months[1:] != months[:-1])] if len(users) else []
+    first_month = months.min() if len(months) else 0
+    width = int(offset.max()) + 1 if len(offset) else 1
+    cells = np.bincount((cohort[active] - first_month) * width + offset[active])
+    matrix = np.zeros(((int(months.max() - first_month) + 1 if len(months) else 0) * width), dtype=np.int64)
+    matrix[:len(cells)] = cells
+    matrix = matrix.reshape(-1, width)
+
+    cohort_idx, month_n = np.nonzero(matrix)
+    sizes = matrix[:, 0]
+    return pd.DataFrame({
+        'cohort': pd.PeriodIndex.from_ordinals(cohort_idx + first_month, freq='M'),
+        'month_n': month_n.astype(np.int64),
+        'active_users': matrix[cohort_idx, month_n],
+        'cohort_size': sizes[cohort_idx],
+        'retention': matrix[cohort_idx, month_n] / sizes[cohort_idx],
+    })
+
+
+def purchase_gaps(users, days):
+    """Days between successive distinct purchase days of the same user
+
+    Returns (gaps, same_day): the positive gaps, and the number of extra
+    trades on a day the user had already bought something.
+    """
+    same_user = users[1:] == users[:-1]
+    gaps = np.diff(days)[same_user]
+    return gaps[gaps > 0], int((gaps == 0).sum())
+
+
+def interval_distribution(gaps, edges):
+    """Counts of gaps per [edge, next edge) day bin"""
+    bounds = list(edges) + [np.inf]
+    counts, _ = np.histogram(gaps, bins=bounds)
+    labels = [f"{lo}-{int(hi) - 1}d" if np.isfinite(hi) else f"{lo}d+" for lo, hi in zip(bounds[:-1], bounds[1:])]
+    return pd.DataFrame({
+        'interval': labels,
+        'min_days': np.asarray(edges, dtype=np.int64),
+        'intervals': counts.astype(np.int64),
+        'share': counts / max(len(gaps), 1),
+    })
+
+
+def summarize(users, days, gaps, same_day, cohort_retention, months):
+    """Headline repurchase and retention figures for repurchase_summary.json"""
+    starts = user_starts(users)
+    new_day = np.r_[True, (users[1:] != users[:-1]) | (days[1:] != days[:-1])] if len(users) else []
+    purchase_days = np.add.reduceat(np.asarray(new_day, dtype=np.int64), starts) if len(starts) else []
+    repeat_users = int((np.asarray(purchase_days) >= 2).sum())
+
+    summary = {
+        'users': int(len(starts)),
+        'trades': int(len(users)),
+        'repeat_users': repeat_users,
+        'repurchase_rate': repeat_users / len(starts) if len(starts) else 0.0,
+        'same_day_trades': same_day,
+        'intervals': int(len(gaps)),
+    }
+    if len(gaps):
+        p25, p50, p75, p90 = np.percentile(gaps, [25, 50, 75, 90])
+        summary.update(interval_mean_days=float(gaps.mean()), interval_p25_days=float(p25),
+                       interval_median_days=float(p50), interval_p75_days=float(p75),
+                       interval_p90_days=float(p90),
+                       within_30_days=float((gaps <= 30).mean()), within_90_days=float((gaps <= 90).mean()))
+    # Average month-N retention, weighted by cohort size, over the cohorts
+    # observed for at least N months
+    cohort = cohort_retention['cohort'].array.asi8
+    observed = (cohort.max() - cohort) if len(cohort) else cohort
+    first = (cohort_retention['month_n'] == 0).to_numpy()
+    for n in months:
+        size = cohort_retention['cohort_size'].to_numpy()[first & (observed >= n)].sum()
+        active = cohort_retention['active_users'].to_numpy()[
+            (cohort_retention['month_n'] == n).to_numpy() & (observed >= n)].sum()
+        summary[f'month_{n}_retention'] = float(active / size) if size else None
+    return summary
+
+
+# ============================================
+# Pipeline phase
+# ============================================
+def cohorts_phase(inputs, params):
+    print("\n[Cohorts] Retention & Repurchase Intervals")
+    print("-" * 70)
+    trades = inputs['trade_clean']
+    users = trades['user_id']
+    codes = users.cat.codes.to_numpy() if isinstance(users.dtype, pd.CategoricalDtype) \
+        else pd.factorize(users)[0]
+    days = trades['day'].to_numpy().astype('datetime64[D]').astype(np.int64)
+
+    _, users_sorted, days_sorted = sort_trades(codes, days)
+    cohort_retention = retention(users_sorted, days_sorted)
+    gaps, same_day = purchase_gaps(users_sorted, days_sorted)
+    intervals = interval_distribution(gaps, params['interval_edges'])
+    summary = summarize(users_sorted, days_sorted, gaps, same_day, cohort_retention, params['summary_months'])
+
+    print(f"  {summary['repeat_users']:,} of {summary['users']:,} users bought on more than one day "
+          f"({summary['repurchase_rate']:.1%})")
+    if summary['intervals']:
+        print(f"  Median repurchase interval: {summary['interval_median_days']:.0f} days, "
+              f"{summary['within_30_days']:.1%} within 30 days")
+    print("  " + ", ".join(f"month {n}: {summary[f'month_{n}_retention']:.1%}"
+                           for n in params['summary_months'] if summary[f'month_{n}_retention'] is not None))
+    return {
+        'cohort_retention': cohort_retention,
+        'repurchase_intervals': intervals,
+        'repurchase_summary.json': summary,
+    }
+
+
+def retention_matrix(cohort_retention, value='retention', max_months=12):
+    """Cohorts x month N matrix from the long-form table"""
+    table = cohort_retention[cohort_retention['month_n'] <= max_months]
+    return table.pivot(index='cohort', columns='month_n', values=value).fillna(0)
+
+
+def main(argv=None):
+    from analysis import DATA_OUTPUT, DATA_PROCESSED, DATA_RAW
+    from storage import ArtifactStore, FORMATS
+
+    parser = argparse.ArgumentParser(description="Cohort retention matrix and repurchase intervals")
+    parser.add_argument('--months', type=int, default=12, help="month-N columns to show")
+    parser.add_argument('--counts', action='store_true', help="active users instead of retention rates")
+    parser.add_argument('--processed-dir', default=DATA_PROCESSED)
+    parser.add_argument('--format', choices=FORMATS)
+    args = parser.parse_args(argv)
+
+    store = ArtifactStore(DATA_RAW, args.processed_dir, DATA_OUTPUT, fmt=args.format)
+    if not store.exists('cohort_retention'):
+        raise SystemExit("No cohort tables yet. Build them first: python src/analysis.py cohorts")
+    matrix = retention_matrix(store.load('cohort_retention'), 'active_users' if args.counts else 'retention',
+                              args.months)
+    print(matrix.to_string(float_format=lambda v: f"{v:.1%}") if not args.counts else matrix.astype(int).to_string())
+    print()
+    print(store.load('repurchase_intervals').round(4).to_string(index=False))
+    print()
+    print(pd.Series(store.load('repurchase_summary.json')).to_string())
+
+
+if __name__ == "__main__":
+    main()
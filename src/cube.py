@@ -0,0 +1,149 @@
+"""
+Pre-aggregated sales cube for dashboards and reports
+One row per (year_month, category, age_group, gender_label) cell with the
+purchase count, the quantity sum and a HyperLogLog sketch of the cell's users.
+Counts and sums add up and sketches merge, so any roll-up, slice or drill-down
+is answered from the cube alone, without reading trade rows:
+
+    python src/cube.py year                       # yearly totals
+    python src/cube.py category age_group --where year=2014
+    python src/cube.py year_month --where category=50014815 --no-users
+
+Trades whose baby age falls outside the age bins (e.g. bought before birth)
+are kept in a missing age_group cell, so roll-ups match the full totals.
+"""
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from sketches import GroupedHLL
+
+DIMENSIONS = ['year_month', 'category', 'age_group', 'gender_label']
+MEASURES = ['purchase_count', 'total_quantity']
+# Coarser time levels derived from year_month
+TIME_LEVELS = {'quarter': lambda p: p.asfreq('Q'), 'year': lambda p: p.year}
+
+
+def build_cube(merged_df, age_bins, age_labels, precision=10):
+    """Aggregate merged trades into cube cells with per-cell user sketches"""
+    age_group = pd.cut(merged_df['baby_age_months'], bins=age_bins, labels=age_labels, right=False)
+    frame = merged_df[['year_month', 'category', 'gender_label', 'user_id', 'buy_mount']].assign(
+        age_group=age_group)
+    grouped = frame.groupby(DIMENSIONS, observed=True, dropna=False)
+    cube = grouped['buy_mount'].agg(purchase_count='count', total_quantity='sum').reset_index()
+
+    cells = grouped.ngroup()
+    sketch = GroupedHLL(precision).update(cells.to_numpy(), frame['user_id'])
+    registers = sketch.to_frame('cell').set_index('cell').reindex(np.arange(len(cube)))
+    cube['precision'] = precision
+    cube['registers'] = registers['registers'].to_numpy()
+    return cube
+
+
+class SalesCube:
+    """Query API over a materialized cube frame
+
+    Dimensions accept the stored columns plus 'quarter' and 'year', derived
+    from year_month. Unique users come from merged sketches and are only
+    available when the cube was loaded with its registers.
+    """
+
+    def __init__(self, cells, age_labels=None):
+        cells = cells.reset_index(drop=True)
+        if age_labels is not None and not isinstance(cells['age_group'].dtype, pd.CategoricalDtype):
+            cells['age_group'] = pd.Categorical(cells['age_group'], categories=age_labels)
+        self.cells = cells
+
+    @classmethod
+    def load(cls, store, users=True, filters=None, age_labels=None):
+        """Read the cube from an ArtifactStore; users=False skips the sketch columns"""
+        columns = DIMENSIONS + MEASURES + (['precision', 'registers'] if users else [])
+        return cls(store.load('sales_cube', columns=columns, filters=filters), age_labels)
+
+    @property
+    def has_users(self):
+        return 'registers' in self.cells
+
+    def dimension(self, dim):
+        """Values of a dimension per cell; unknown dimensions raise KeyError"""
+        if dim in TIME_LEVELS:
+            return self.cells['year_month'].map(TIME_LEVELS[dim]).rename(dim)
+        if dim not in DIMENSIONS:
+            raise KeyError(f"Unknown dimension '{dim}'. Available: {', '.join(DIMENSIONS + list(TIME_LEVELS))}")
+        return self.cells[dim]
+
+    def slice(self, **where):
+        """Cells matching every condition; a list value matches any of its items"""
+        mask = np.ones(len(self.cells), dtype=bool)
+        for dim, value in where.items():
+            values = self.dimension(dim)
+            if isinstance(value, (list, tuple, set)):
+                mask &= values.isin(list(value)).to_numpy()
+            else:
+                mask &= (values == value).to_numpy()
+        return SalesCube(self.cells[mask])
+
+    def rollup(self, dims=(), users=None):
+        """Aggregate the cells up to `dims` (an empty list gives the grand total)
+
+        Returns purchase_count, total_quantity, avg_quantity and, when the
+        sketches are loaded (or users=True), estimated unique_users.
+        """
+        dims = [dims] if isinstance(dims, str) else list(dims)
+        users = self.has_users if users is None else users
+        if users and not self.has_users:
+            raise ValueError("Unique users need the sketch columns; load the cube with users=True")
+        keys = [self.dimension(dim) for dim in dims] or [pd.Series(0, index=self.cells.index, name='all')]
+
+        grouped = self.cells[MEASURES].groupby(keys, observed=True, dropna=False)
+        result = grouped.sum()
+        result['avg_quantity'] = (result['total_quantity'] / result['purchase_count']).round(2)
+        if users:
+            sketch = GroupedHLL.from_frame(self.cells.assign(cell=np.arange(len(self.cells))), 'cell')
+            groups = grouped.ngroup().to_numpy()
+            counts = sketch.rollup(pd.Series(groups, index=sketch.groups)).counts()
+            result['unique_users'] = counts.reindex(np.arange(len(result))).to_numpy()
+        return result.reset_index(drop=not dims)
+
+    def drilldown(self, dims, **where):
+        """Slice on `where`, then break the selection down by `dims`"""
+        return self.slice(**where).rollup(dims)
+
+
+def parse_where(items):
+    """['year=2014', 'category=28,50014815'] -> {'year': 2014, 'category': [28, 50014815]}
+
+    year_month and quarter values are parsed as periods ('2014-06', '2014Q2').
+    """
+    where = {}
+    for item in items:
+        dim, _, raw = item.partition('=')
+        values = [int(v) if v.lstrip('-').isdigit() else v for v in raw.split(',')]
+        if dim in ('year_month', 'quarter'):
+            values = [pd.Period(v, 'M' if dim == 'year_month' else 'Q') for v in raw.split(',')]
+        where[dim] = values if len(values) > 1 else values[0]
+    return where
+
+
+def main(argv=None):
+    from analysis import DATA_OUTPUT, DATA_PROCESSED, DATA_RAW, PROFILE_PARAMS
+    from storage import ArtifactStore, FORMATS
+
+    parser = argparse.ArgumentParser(description="Query the pre-aggregated sales cube")
+    parser.add_argument('dims', nargs='*', help=f"dimensions to group by: {', '.join(DIMENSIONS + list(TIME_LEVELS))}")
+    parser.add_argument('--where', nargs='*', default=[], metavar='DIM=VALUE',
+                        help="slice conditions, comma-separated values match any")
+    parser.add_argument('--no-users', action='store_true', help="skip unique users (reads only the counts)")
+    parser.add_argument('--processed-dir', default=DATA_PROCESSED)
+    parser.add_argument('--format', choices=FORMATS, default=None)
+    args = parser.parse_args(argv)
+
+    store = ArtifactStore(DATA_RAW, args.processed_dir, DATA_OUTPUT, fmt=args.format)
+    cube = SalesCube.load(store, users=not args.no_users, age_labels=PROFILE_PARAMS['age_labels'])
+    with pd.option_context('display.max_rows', 200, 'display.max_columns', 20, 'display.width', 200):
+        print(cube.drilldown(args.dims, **parse_where(args.where)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Dictionary encoding of the high-cardinality string columns
+Right after loading, user_id, auction_id and property are mapped to pandas
+categoricals whose categories come from one shared, sorted dictionary per
+column, so the merge and the groupbys work on dense integer codes instead of
+Python strings. The dictionary is persisted next to the processed tables; it
+re-applies the same codes on load and decodes the ids back to their original
+values whenever a table is written as output. The dictionary is a directory
+holding one single-column table per encoded column, so a reader loads only
+the columns it decodes and never parses the others.
+
+    python src/encoding.py             # memory and groupby/merge benchmark
+    python src/encoding.py --scale 20  # same, with the trades replicated 20x
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+ENCODED_COLUMNS = ['user_id', 'auction_id', 'property']
+DICTIONARY_FILE = 'id_dictionary.dict'
+
+
+def build_dictionary(frames, columns=ENCODED_COLUMNS):
+    """Sorted distinct values per column, taken across all frames holding it"""
+    dictionary = {}
+    for col in columns:
+        values = [df[col].to_numpy() for df in frames if col in df]
+        if values:
+            dictionary[col] = pd.Index(pd.unique(np.concatenate(values))).sort_values()
+    return dictionary
+
+
+def encode(df, dictionary):
+    """Convert the dictionary columns of `df` to categoricals with shared codes"""
+    for col, categories in dictionary.items():
+        if col in df and not (isinstance(df[col].dtype, pd.CategoricalDtype)
+                              and df[col].cat.categories.equals(categories)):
+            df[col] = pd.Categorical(df[col], categories=categories)
+    return df
+
+
+def decode(df, columns=ENCODED_COLUMNS):
+    """Replace encoded columns (and an encoded index) by their original values"""
+    decoded = {col: df[col].astype(df[col].cat.categories.dtype)
+               for col in columns if col in df and isinstance(df[col].dtype, pd.CategoricalDtype)}
+    if decoded:
+        df = df.assign(**decoded)
+    if df.index.name in columns and isinstance(df.index, pd.CategoricalIndex):
+        df = df.set_axis(df.index.astype(df.index.categories.dtype))
+    return df
+
+
+# ============================================
+# Benchmark
+# ============================================
+def _timed(func, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _memory_mb(df):
+    return df.memory_usage(deep=True).sum() / 2**20
+
+
+def benchmark(baby_df, trade_df, repeat=3):
+    """Memory and groupby/merge timings of the raw vs the encoded frames"""
+    from analysis import merge_baby
+
+    dictionary = build_dictionary([baby_df, trade_df])
+    encoded_baby = encode(baby_df.copy(), dictionary)
+    encoded_trades = encode(trade_df.copy(), dictionary)
+    raw_baby = baby_df.astype({'gender_label': object})
+
+    rows = []
+    for label, babies, trades in [('raw', raw_baby, trade_df), ('encoded', encoded_baby, encoded_trades)]:
+        merged = merge_baby(trades, babies)
+        rows.append({
+            'variant': label,
+            'trades_mb': _memory_mb(trades),
+            'merged_mb': _memory_mb(merged),
+            'merge_s': _timed(lambda: merge_baby(trades, babies), repeat),
+            'groupby_user_s': _timed(lambda: trades.groupby('user_id', observed=True).agg(
+                frequency=('auction_id', 'count'), monetary=('buy_mount', 'sum')), repeat),
+            'groupby_auction_s': _timed(lambda: trades.groupby('auction_id', observed=True)['buy_mount'].sum(),
+                                        repeat),
+            'nunique_users_s': _timed(lambda: trades.groupby('category')['user_id'].nunique(), repeat),
+        })
+    result = pd.DataFrame(rows).set_index('variant')
+    result.loc['raw/encoded'] = result.loc['raw'] / result.loc['encoded']
+    return result
+
+
+def main(argv=None):
+    from analysis import DATA_RAW, clean_baby, clean_trades
+    from storage import raw_path, read_raw
+
+    parser = argparse.ArgumentParser(description="Benchmark dictionary encoding of the id columns")
+    parser.add_argument('--scale', type=int, default=1, help="replicate the trade history N times")
+    parser.add_argument('--repeat', type=int, default=3, help="timing repetitions (best is reported)")
+    args = parser.parse_args(argv)
+
+    baby_df = clean_baby(read_raw(raw_path(DATA_RAW / "tianchi_mum_baby.csv")))
+    trade_df = clean_trades(read_raw(raw_path(DATA_RAW / "tianchi_mum_baby_trade_history.csv")))
+    if args.scale > 1:
+        trade_df = pd.concat([trade_df] * args.scale, ignore_index=True)
+    print(f"Benchmarking {len(trade_df):,} trades, {len(baby_df):,} users\n")
+    print(benchmark(baby_df, trade_df, args.repeat).round(4).to_string())
+
+
+if __name__ == "__main__":
+    main()
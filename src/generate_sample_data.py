@@ -1,129 +1,311 @@
 """
 Generate Sample Data for Taobao Maternity Shopping Analysis
-This creates simulated data matching the structure of the real dataset
+This creates simulated data matching the structure of the real dataset.
+Rows are generated in vectorized chunks and written as they are produced, so
+benchmark datasets of production size (100M+ trades) never sit in memory.
+
+The trades are skewed like real ones: user activity follows a power law,
+users keep re-buying a few favourite auctions, auction popularity is Zipf
+distributed (with a flattened head, so the best seller is a fraction of a
+percent of the trades, and a seeded choice of which auctions are popular),
+and sales grow year on year with peaks around 6.18, Double 11
+and Double 12. Every auction has a fixed category, cat and property; each
+cat belongs to a single category (as in the real hierarchy), and like the
+real data, a property is a 'key:value;key:value' list of attribute ids, with
+attribute keys specific to the category.
+Output is reproducible for the same --seed and --chunk-rows. Sharded output
+('<table>/part-*.csv' or '.parquet') is read by the pipeline like the single
+CSV files (see storage.read_raw).
+
+    python src/generate_sample_data.py                       # demo data (1,000 users, 15,000 trades)
+    python src/generate_sample_data.py --trades 100000000 --users 2000000 \\
+        --format parquet --output-dir /data/bench            # Parquet shards
+    python src/analysis.py --streaming --raw-dir /data/bench
 """
-import pandas as pd
-import numpy as np
-from datetime import datetime, timedelta
+import argparse
+import math
+import time
 from pathlib import Path
-import random
 
-# Set random seed for reproducibility
-np.random.seed(42)
-random.seed(42)
+import numpy as np
+import pandas as pd
 
 # Project paths
 PROJECT_DIR = Path(__file__).parent.parent
 DATA_RAW = PROJECT_DIR / "data" / "raw"
-DATA_RAW.mkdir(parents=True, exist_ok=True)
 
-print("=" * 60)
-print("Generating Sample Data")
-print("=" * 60)
+BABY_FILE = "tianchi_mum_baby"
+TRADE_FILE = "tianchi_mum_baby_trade_history"
+
+MAIN_CATEGORIES = np.array([28, 38, 50008168, 50014815, 50022520])
+SUBCATEGORIES_PER_CATEGORY = 100
+# Attribute pools per category: properties draw 1-4 of the category's keys,
+# each with one of the key's values (popular keys and values more often)
+KEYS_PER_CATEGORY = 8
+VALUES_PER_KEY = 12
+PROPERTIES_PER_CATEGORY = 200
+GENDER_P = [0.45, 0.45, 0.10]  # 0=female, 1=male, 2=unknown
+BUY_MOUNTS = np.array([1, 2, 3, 4, 5, 0])  # 0 marks a large order (6-20 items)
+BUY_MOUNT_P = [0.3, 0.2, 0.2, 0.1, 0.1, 0.1]
+
+BIRTHDAY_RANGE = ('2010-01-01', '2014-12-31')
+TRADE_RANGE = ('2012-01-01', '2015-12-31')
+YEARLY_GROWTH = 0.1
+# (month, day): sales multiplier of the shopping festivals
+PEAK_DAYS = {(6, 18): 2.0, (11, 11): 5.0, (12, 12): 2.5}
+
+DEFAULTS = {
+    'users': 1000,
+    'trades': 15000,
+    'auctions': None,        # trades // 4, capped at 5M
+    'activity_alpha': 2.0,   # Pareto shape of per-user activity (smaller = heavier tail)
+    'popularity_skew': 1.1,  # Zipf exponent of auction popularity
+    'popularity_offset': 30,  # Zipf-Mandelbrot offset (larger = flatter head)
+    'repeat_rate': 0.3,      # share of trades re-buying one of the user's favourite auctions
+    'favourites': 3,
+}
+
 
 # ============================================
-# Table 1: Baby Information
+# Vectorized building blocks
 # ============================================
-print("\n[1/2] Generating baby info table...")
+def _mix(values, salt):
+    """splitmix64 hash: a stable pseudo-random uint64 per value"""
+    x = values.astype(np.uint64) + np.uint64(salt * 0x9E3779B97F4A7C15 % 2**64)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
 
-n_users = 1000
-user_ids = [f"user_{i:05d}" for i in range(1, n_users + 1)]
 
-# Generate birthdays (2010-2014)
-start_date = datetime(2010, 1, 1)
-end_date = datetime(2014, 12, 31)
-date_range = (end_date - start_date).days
+def yyyymmdd(days):
+    """datetime64[D] array -> int array such as 20140119 (the raw file format)"""
+    years = days.astype('datetime64[Y]')
+    months = days.astype('datetime64[M]')
+    return ((years.astype(np.int64) + 1970) * 10000
+            + (months.astype(np.int64) % 12 + 1) * 100
+            + (days - months).astype(np.int64) + 1)
 
-birthdays = []
-for _ in range(n_users):
-    random_days = random.randint(0, date_range)
-    birthday = start_date + timedelta(days=random_days)
-    birthdays.append(birthday.strftime("%Y%m%d"))
 
-# Gender: 0=female, 1=male, 2=unknown
-genders = np.random.choice([0, 1, 2], size=n_users, p=[0.45, 0.45, 0.10])
+def day_weights(start, end):
+    """Calendar days of the trade range and their relative sales volume"""
+    days = np.arange(np.datetime64(start), np.datetime64(end) + 1)
+    index = pd.DatetimeIndex(days)
+    elapsed = (days - days[0]).astype(np.int64) / 365.25
+    weights = (1 + YEARLY_GROWTH) ** elapsed
+    for (month, day), factor in PEAK_DAYS.items():
+        weights[(index.month == month) & (index.day == day)] *= factor
+    return days, weights
 
-baby_df = pd.DataFrame({
-    "user_id": user_ids,
-    "birthday": birthdays,
-    "gender": genders
-})
 
-# Save baby info
-baby_file = DATA_RAW / "tianchi_mum_baby.csv"
-baby_df.to_csv(baby_file, index=False)
-print(f"   Saved: {baby_file.name} ({len(baby_df)} records)")
+def zipf_ranks(rng, n, size, skew, offset=0):
+    """0-based ranks drawn from a continuous power law over [offset + 1, n + offset + 1)
+
+    A positive offset (Zipf-Mandelbrot) flattens the head: the top ranks get
+    a few times the share of the next ones, not most of the traffic.
+    """
+    u = rng.random(size)
+    low, high = offset + 1.0, n + offset + 1.0
+    if math.isclose(skew, 1.0):
+        x = low * np.exp(u * math.log(high / low))
+    else:
+        k = 1 - skew
+        x = ((high ** k - low ** k) * u + low ** k) ** (1 / k)
+    return np.clip(np.floor(x - offset).astype(np.int64) - 1, 0, n - 1)
+
+
+def property_pool(rng):
+    """PROPERTIES_PER_CATEGORY property strings per main category, category by category"""
+    key_p = 1 / np.arange(1, KEYS_PER_CATEGORY + 1)
+    value_p = 1 / np.arange(1, VALUES_PER_KEY + 1)
+    pool = []
+    for _ in MAIN_CATEGORIES:
+        keys = rng.choice(np.arange(1000, 100000), KEYS_PER_CATEGORY, replace=False)
+        values = rng.integers(1, 10**8, (KEYS_PER_CATEGORY, VALUES_PER_KEY))
+        for n_keys in rng.integers(1, 5, PROPERTIES_PER_CATEGORY):
+            picked = np.sort(rng.choice(KEYS_PER_CATEGORY, n_keys, replace=False, p=key_p / key_p.sum()))
+            chosen = rng.choice(VALUES_PER_KEY, n_keys, p=value_p / value_p.sum())
+            pool.append(';'.join(f"{keys[k]}:{values[k, v]}" for k, v in zip(picked, chosen)))
+    return pool
+
+
+def id_strings(prefix, values, width):
+    """Formatted ids as a categorical, formatting each distinct value once"""
+    uniques, codes = np.unique(values, return_inverse=True)
+    labels = [f"{prefix}{v:0{width}d}" for v in uniques.tolist()]
+    return pd.Categorical.from_codes(codes, categories=labels)
+
 
 # ============================================
-# Table 2: Trade History
+# Tables
 # ============================================
-print("\n[2/2] Generating trade history table...")
-
-# Generate transactions
-n_transactions = 15000
-
-# Select random users (with some users having multiple transactions)
-user_samples = np.random.choice(user_ids, size=n_transactions)
-
-# Generate auction IDs
-auction_ids = [f"auction_{i:08d}" for i in range(1, n_transactions + 1)]
-
-# Categories
-main_categories = [28, 38, 50008168, 50014815, 50022520]
-categories = np.random.choice(main_categories, size=n_transactions)
-
-# Sub-categories (500+ unique)
-sub_categories = [random.randint(10000000, 99999999) for _ in range(n_transactions)]
-
-# Properties (simplified)
-properties = [f"property_{random.randint(1, 100)}" for _ in range(n_transactions)]
-
-# Purchase amounts (buy_mount) - mostly 1-5, some larger
-buy_mounts = np.random.choice(
-    [1, 1, 1, 2, 2, 3, 3, 4, 5, random.randint(6, 20)],
-    size=n_transactions
-)
-
-# Day (2012-2015)
-trade_start = datetime(2012, 1, 1)
-trade_end = datetime(2015, 12, 31)
-trade_range = (trade_end - trade_start).days
-
-days = []
-for _ in range(n_transactions):
-    random_days = random.randint(0, trade_range)
-    trade_day = trade_start + timedelta(days=random_days)
-    days.append(int(trade_day.strftime("%Y%m%d")))
-
-trade_df = pd.DataFrame({
-    "user_id": user_samples,
-    "auction_id": auction_ids,
-    "category": categories,
-    "cat": sub_categories,
-    "property": properties,
-    "buy_mount": buy_mounts,
-    "day": days
-})
-
-# Save trade history
-trade_file = DATA_RAW / "tianchi_mum_baby_trade_history.csv"
-trade_df.to_csv(trade_file, index=False)
-print(f"   Saved: {trade_file.name} ({len(trade_df)} records)")
+class Generator:
+    """Chunked generator of the baby info and trade history tables"""
+
+    def __init__(self, users, trades, seed=42, **params):
+        params = {**DEFAULTS, **{k: v for k, v in params.items() if v is not None}}
+        self.users = users
+        self.trades = trades
+        self.auctions = params['auctions'] or max(min(trades // 4, 5_000_000), 1)
+        self.params = params
+        self.seed = seed
+        self.user_width = max(5, len(str(users)))
+        self.auction_width = max(8, len(str(self.auctions)))
+
+        rng = np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(0,)))
+        activity = rng.pareto(params['activity_alpha'], users) + 1
+        self.user_cdf = np.cumsum(activity) / activity.sum()
+        # Which auction has which popularity rank: a seeded permutation, so the
+        # best sellers are spread over the id space and differ between seeds
+        rank_rng = np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(5,)))
+        self.ranked_auctions = rank_rng.permutation(self.auctions).astype(np.int32)
+        self.days, weights = day_weights(*TRADE_RANGE)
+        self.day_cdf = np.cumsum(weights) / weights.sum()
+        cat_rng = np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(4,)))
+        # Sampled by index: choice() over the 90M ids themselves would build them all
+        self.cats = cat_rng.choice(90_000_000, len(MAIN_CATEGORIES) * SUBCATEGORIES_PER_CATEGORY,
+                                   replace=False) + 10_000_000
+        # Two properties may draw the same attributes: share one category for them
+        self.properties = pd.Categorical(
+            property_pool(np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(3,)))))
+
+    def _chunks(self, total, chunk_rows, salt):
+        children = np.random.SeedSequence(self.seed, spawn_key=(salt,))
+        for start in range(0, total, chunk_rows):
+            size = min(chunk_rows, total - start)
+            yield start, size, np.random.default_rng(children.spawn(1)[0])
+
+    def baby_chunks(self, chunk_rows):
+        low, high = (np.datetime64(d) for d in BIRTHDAY_RANGE)
+        for start, size, rng in self._chunks(self.users, chunk_rows, salt=1):
+            users = np.arange(start + 1, start + size + 1)
+            birthdays = low + rng.integers(0, (high - low).astype(np.int64) + 1, size)
+            yield pd.DataFrame({
+                "user_id": id_strings("user_", users, self.user_width),
+                "birthday": yyyymmdd(birthdays),
+                "gender": rng.choice(3, size=size, p=GENDER_P),
+            })
+
+    def trade_chunks(self, chunk_rows):
+        p = self.params
+        for start, size, rng in self._chunks(self.trades, chunk_rows, salt=2):
+            users = np.minimum(np.searchsorted(self.user_cdf, rng.random(size)), self.users - 1)
+
+            # Popular auctions, or one of the user's favourites for repeat purchases
+            ranks = zipf_ranks(rng, self.auctions, size, p['popularity_skew'], p['popularity_offset'])
+            auctions = self.ranked_auctions[ranks].astype(np.int64)
+            repeat = rng.random(size) < p['repeat_rate']
+            favourite = users[repeat] * p['favourites'] + rng.integers(0, p['favourites'], repeat.sum())
+            auctions[repeat] = (_mix(favourite, 3) % np.uint64(self.auctions)).astype(np.int64)
+
+            buy_mount = rng.choice(BUY_MOUNTS, size=size, p=BUY_MOUNT_P)
+            large = buy_mount == 0
+            buy_mount[large] = rng.integers(6, 21, large.sum())
+            days = self.days[np.searchsorted(self.day_cdf, rng.random(size))]
+            category = (_mix(auctions, 4) % np.uint64(len(MAIN_CATEGORIES))).astype(np.int64)
+            # Skewed towards the first sub-categories of each category
+            share = (_mix(auctions, 5) >> np.uint64(11)).astype(np.float64) / 2**53
+            subcategory = (share ** 3 * SUBCATEGORIES_PER_CATEGORY).astype(np.int64)
+            prop = category * PROPERTIES_PER_CATEGORY + (
+                _mix(auctions, 6) % np.uint64(PROPERTIES_PER_CATEGORY)).astype(np.int64)
+
+            yield pd.DataFrame({
+                "user_id": id_strings("user_", users + 1, self.user_width),
+                "auction_id": id_strings("auction_", auctions + 1, self.auction_width),
+                "category": MAIN_CATEGORIES[category],
+                "cat": self.cats[category * SUBCATEGORIES_PER_CATEGORY + subcategory],
+                "property": pd.Categorical.from_codes(self.properties.codes[prop],
+                                                      categories=self.properties.categories),
+                "buy_mount": buy_mount,
+                "day": yyyymmdd(days),
+            })
+
 
 # ============================================
-# Summary
+# Output
 # ============================================
-print("\n" + "=" * 60)
-print("Sample Data Generated Successfully!")
-print("=" * 60)
-print(f"\n[Files Created]:")
-print(f"   1. {baby_file.name}")
-print(f"      - Records: {len(baby_df)}")
-print(f"      - Columns: {list(baby_df.columns)}")
-print(f"\n   2. {trade_file.name}")
-print(f"      - Records: {len(trade_df)}")
-print(f"      - Columns: {list(trade_df.columns)}")
-print(f"\n[Location]: {DATA_RAW}")
-print("\n[!] Note: This is simulated data for demonstration.")
-print("    Replace with real data from Tianchi when available.")
-print("=" * 60)
+def write_chunks(chunks, output_dir, name, fmt='csv', shards=False):
+    """Write chunks as they are generated: one CSV file, or one shard per chunk
+    (read back with storage.read_raw)"""
+    if fmt == 'parquet':
+        from storage import has_pyarrow
+        if not has_pyarrow():
+            raise SystemExit("Parquet output requires pyarrow (pip install pyarrow), or use --format csv")
+        shards = True
+
+    if shards:
+        target = Path(output_dir) / name
+        target.mkdir(parents=True, exist_ok=True)
+        for stale in target.glob(f"part-*.{fmt}"):
+            stale.unlink()
+    else:
+        target = Path(output_dir) / f"{name}.csv"
+
+    rows = 0
+    start = time.perf_counter()
+    for i, df in enumerate(chunks):
+        if fmt == 'parquet':
+            df.to_parquet(target / f"part-{i:05d}.parquet", index=False)
+        elif shards:
+            df.to_csv(target / f"part-{i:05d}.csv", index=False)
+        else:
+            df.to_csv(target, mode='w' if i == 0 else 'a', header=i == 0, index=False)
+        rows += len(df)
+        elapsed = time.perf_counter() - start
+        print(f"   {rows:>12,} rows  ({rows / elapsed:,.0f} rows/s)", end='\r', flush=True)
+    print()
+    return target, rows
+
+
+def generate(output_dir=DATA_RAW, users=DEFAULTS['users'], trades=DEFAULTS['trades'], seed=42,
+             fmt='csv', shards=False, chunk_rows=1_000_000, **params):
+    generator = Generator(users, trades, seed=seed, **params)
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+
+    print("\n[1/2] Generating baby info table...")
+    baby_file, baby_rows = write_chunks(generator.baby_chunks(chunk_rows), output_dir, BABY_FILE, fmt, shards)
+    print(f"   Saved: {baby_file.name} ({baby_rows:,} records)")
+
+    print("\n[2/2] Generating trade history table...")
+    trade_file, trade_rows = write_chunks(generator.trade_chunks(chunk_rows), output_dir, TRADE_FILE, fmt, shards)
+    print(f"   Saved: {trade_file.name} ({trade_rows:,} records, {generator.auctions:,} auctions)")
+    return baby_file, trade_file
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate simulated Taobao maternity data")
+    parser.add_argument('--users', type=int, default=DEFAULTS['users'])
+    parser.add_argument('--trades', type=int, default=DEFAULTS['trades'])
+    parser.add_argument('--auctions', type=int, help="distinct auctions (default: trades / 4, at most 5M)")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--format', choices=('csv', 'parquet'), default='csv')
+    parser.add_argument('--shards', action='store_true',
+                        help="write one file per chunk into a directory (always on for parquet)")
+    parser.add_argument('--chunk-rows', type=int, default=1_000_000, help="rows generated and written at a time")
+    parser.add_argument('--activity-alpha', type=float, help="Pareto shape of user activity (default 2.0)")
+    parser.add_argument('--popularity-skew', type=float, help="Zipf exponent of auction popularity (default 1.1)")
+    parser.add_argument('--popularity-offset', type=float,
+                        help="Zipf-Mandelbrot offset; larger flattens the best sellers (default 30)")
+    parser.add_argument('--repeat-rate', type=float, help="share of repeat purchases (default 0.3)")
+    parser.add_argument('--output-dir', type=Path, default=DATA_RAW)
+    args = parser.parse_args(argv)
+
+    print("=" * 60)
+    print("Generating Sample Data")
+    print("=" * 60)
+    start = time.perf_counter()
+    generate(args.output_dir, args.users, args.trades, seed=args.seed, fmt=args.format,
+             shards=args.shards, chunk_rows=args.chunk_rows, auctions=args.auctions,
+             activity_alpha=args.activity_alpha, popularity_skew=args.popularity_skew,
+             popularity_offset=args.popularity_offset, repeat_rate=args.repeat_rate)
+
+    print("\n" + "=" * 60)
+    print(f"Sample Data Generated Successfully! ({time.perf_counter() - start:.1f}s)")
+    print("=" * 60)
+    print(f"\n[Location]: {args.output_dir}")
+    print("\n[!] Note: This is simulated data for demonstration.")
+    print("    Replace with real data from Tianchi when available.")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Category hierarchy: cat -> category rollups and top sub-categories
+Every sub-category (`cat`) belongs to one top-level `category`. The mapping
+is built once into the `cat_hierarchy` table; afterwards trades only need to
+be grouped by `cat`, and the parent-level figures are rolled up through the
+mapping instead of grouping the trades a second time.
+
+Both levels come out of a single pass over the trades: one groupby on
+(cat, user_id) gives per-pair counts, from which purchase count, quantity and
+distinct users are summed up to cat and to category. Top-K sub-categories per
+category are picked with a bounded heap per parent (O(n log K)) rather than
+sorting every sub-category. The phase publishes both levels:
+`category_rollup` (per category) and `subcategory_stats` (per cat).
+
+    python src/hierarchy.py --top 5                    # top 5 sub-categories per category
+    python src/hierarchy.py --top 10 --category 28 --since 2015-12-01
+"""
+import argparse
+import heapq
+
+import numpy as np
+import pandas as pd
+
+STATS = ['purchase_count', 'total_quantity', 'unique_users']
+
+
+def build_hierarchy(trades):
+    """cat -> category table with each cat's trade count
+
+    A cat seen under several categories (a data error in the real dump) is
+    assigned to the one with the most trades; `conflicts` counts the trades
+    filed under the others.
+    """
+    pairs = trades.groupby(['cat', 'category']).size().rename('trades').reset_index()
+    pairs = pairs.sort_values(['cat', 'trades', 'category'], ascending=[True, False, True])
+    totals = pairs.groupby('cat')['trades'].sum()
+    hierarchy = pairs.drop_duplicates('cat').set_index('cat')
+    hierarchy['conflicts'] = totals - hierarchy['trades']
+    hierarchy['trades'] = totals
+    return hierarchy[['category', 'trades', 'conflicts']]
+
+
+def rollup(trades, hierarchy):
+    """(category_stats, cat_stats) from one groupby over the trades
+
+    Distinct users are exact at both levels: they are counted on the
+    (cat, user) and (category, user) pairs of the reduced pair table.
+    """
+    pairs = trades.groupby(['cat', 'user_id'], observed=True, sort=False)['buy_mount'].agg(['count', 'sum'])
+    pairs = pairs.reset_index()
+    pairs['category'] = hierarchy['category'].reindex(pairs['cat']).to_numpy()
+
+    cat_stats = pairs.groupby('cat').agg(category=('category', 'first'), purchase_count=('count', 'sum'),
+                                        total_quantity=('sum', 'sum'), unique_users=('user_id', 'size'))
+    parent = pairs.groupby(['category', 'user_id'], observed=True)[['count', 'sum']].sum().reset_index()
+    category_stats = parent.groupby('category').agg(purchase_count=('count', 'sum'),
+                                                    total_quantity=('sum', 'sum'),
+                                                    unique_users=('user_id', 'size'))
+    cat_stats['share_of_parent'] = (cat_stats['purchase_count']
+                                    / category_stats['purchase_count'].reindex(cat_stats['category']).to_numpy())
+    return category_stats, cat_stats.reset_index()[['category', 'cat', *STATS, 'share_of_parent']]
+
+
+def top_k_per_parent(stats, k, by='purchase_count', parent='category', child='cat'):
+    """The k largest children per parent, by heap selection
+
+    Keeps a min-heap of at most k entries per parent while scanning the rows
+    once; ties go to the smaller child id. Returns the selected rows ranked
+    within each parent.
+    """
+    heaps = {}
+    values = stats[by].to_numpy()
+    parents = stats[parent].to_numpy()
+    children = stats[child].to_numpy()
+    for row, (value, group, item) in enumerate(zip(values, parents, children)):
+        heap = heaps.setdefault(group, [])
+        entry = (value, -item, row)
+        if len(heap) < k:
+            heapq.heappush(heap, entry)
+        elif entry > heap[0]:
+            heapq.heapreplace(heap, entry)
+
+    rows, ranks = [], []
+    for group in sorted(heaps):
+        ordered = sorted(heaps[group], reverse=True)  # at most k entries
+        rows += [row for _, _, row in ordered]
+        ranks += range(1, len(ordered) + 1)
+    top = stats.iloc[rows].reset_index(drop=True)
+    top.insert(1, 'rank', np.asarray(ranks, dtype=np.int64))
+    return top
+
+
+# ============================================
+# Pipeline phase
+# ============================================
+def hierarchy_phase(inputs, params):
+    print("\n[Hierarchy] Category -> Sub-category Rollups")
+    print("-" * 70)
+    trades = inputs['trade_clean']
+    hierarchy = build_hierarchy(trades)
+    conflicts = int(hierarchy['conflicts'].sum())
+    print(f"  {len(hierarchy):,} sub-categories under {hierarchy['category'].nunique()} categories"
+          + (f" ({conflicts:,} trades under a second parent)" if conflicts else ""))
+    category_stats, cat_stats = rollup(trades, hierarchy)
+    top = top_k_per_parent(cat_stats, params['top_subcategories'])
+    print(top.groupby('category').head(3).to_string(index=False))
+    return {
+        'cat_hierarchy': hierarchy,
+        'category_rollup': category_stats,
+        'subcategory_stats': cat_stats,
+        'top_subcategories': top,
+    }
+
+
+def main(argv=None):
+    from analysis import DATA_OUTPUT, DATA_PROCESSED, DATA_RAW
+    from storage import ArtifactStore, FORMATS
+
+    parser = argparse.ArgumentParser(description="Top sub-categories per category")
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('--by', choices=STATS, default='purchase_count')
+    parser.add_argument('--category', type=int, nargs='*', help="only these parent categories")
+    parser.add_argument('--since', help="only trades on or after this day (re-aggregates trade_clean)")
+    parser.add_argument('--processed-dir', default=DATA_PROCESSED)
+    parser.add_argument('--format', choices=FORMATS)
+    args = parser.parse_args(argv)
+
+    store = ArtifactStore(DATA_RAW, args.processed_dir, DATA_OUTPUT, fmt=args.format)
+    if not store.exists('cat_hierarchy'):
+        raise SystemExit("No hierarchy yet. Build it first: python src/analysis.py hierarchy")
+    if args.since:
+        # Only the trade columns are read; the parent comes from the cached mapping
+        trades = store.load('trade_clean', columns=['cat', 'user_id', 'buy_mount'],
+                            filters=[('day', '>=', pd.Timestamp(args.since))])
+        _, stats = rollup(trades, store.load('cat_hierarchy'))
+    else:
+        stats = store.load('subcategory_stats')
+    if args.category:
+        stats = stats[stats['category'].isin(args.category)]
+    print(top_k_per_parent(stats, args.top, by=args.by).round(4).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Incremental RFM updates from daily trade deltas
+Keeps a persisted per-user state table (last purchase day, purchase count,
+quantity sum, current segment) and folds a delta file of new trades into it,
+instead of recomputing RFM over the full trade history.
+
+    python src/incremental.py init                      # build state from trade_clean
+    python src/incremental.py apply delta_20160101.csv  # fold in one day of trades
+
+Each `apply` re-bases recency to the new reference date, recomputes the score
+cut points over the state table, writes `rfm_latest` (same columns as
+rfm_analysis) and `rfm_segment_changes` with only the users whose segment moved.
+"""
+import argparse
+import json
+from pathlib import Path
+
+import pandas as pd
+
+from analysis import (CLEAN_PARAMS, DATA_PROCESSED, DATA_OUTPUT, DATA_RAW, RFM_PARAMS,
+                      clean_trades, score_rfm)
+from pipeline import file_digest
+from storage import ArtifactStore, FORMATS
+from streaming import RFMAccumulator
+from validation import summarize, validate_trades
+
+STATE_COLUMNS = ['last_day', 'frequency', 'monetary']
+STATE_LOG = 'rfm_state_log.json'
+
+
+def build_state(trade_clean, params):
+    """Initial state (and RFM table) from the full cleaned trade history"""
+    acc = RFMAccumulator()
+    acc.update(trade_clean)
+    rfm = score_rfm(acc.result(), params)
+    state = acc.state.copy()
+    state['segment'] = rfm.set_index('user_id')['segment']
+    return state, rfm
+
+
+def apply_delta(state, delta, params):
+    """Fold cleaned delta trades into the state
+
+    Returns (new state, rescored RFM table, segment changes). Users appearing
+    for the first time are reported with an empty previous segment.
+    """
+    acc = RFMAccumulator()
+    acc.state = state[STATE_COLUMNS]
+    if not delta.empty:
+        acc.update(delta)
+    rfm = score_rfm(acc.result(), params)
+
+    new_segment = rfm.set_index('user_id')['segment']
+    old_segment = state['segment'].reindex(new_segment.index)
+    moved = old_segment.ne(new_segment).to_numpy()
+    changes = rfm[moved].assign(previous_segment=old_segment[moved].to_numpy())
+
+    new_state = acc.state.copy()
+    new_state['segment'] = new_segment
+    return new_state, rfm, changes
+
+
+def load_delta(path, params):
+    delta, quarantine = validate_trades(pd.read_csv(path), params)
+    if len(quarantine):
+        print(f"  Skipped {len(quarantine):,} invalid delta records:")
+        print(summarize(quarantine).to_string(index=False))
+    delta = clean_trades(delta)
+    return delta[delta['buy_mount'] <= params['max_buy_mount']]
+
+
+def _load_log(store):
+    path = store.processed_dir / STATE_LOG
+    if path.exists():
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    return {'applied': []}
+
+
+def _save_log(store, log):
+    with open(store.processed_dir / STATE_LOG, 'w', encoding='utf-8') as f:
+        json.dump(log, f, indent=2)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Incremental RFM updates from trade deltas")
+    parser.add_argument('command', choices=['init', 'apply'])
+    parser.add_argument('delta', nargs='?', type=Path, help="delta CSV of new trades (raw trade format)")
+    parser.add_argument('--force', action='store_true', help="apply a delta even if it was applied before")
+    parser.add_argument('--config', type=Path, help="pipeline parameter overrides (uses the 'rfm' section)")
+    parser.add_argument('--processed-dir', type=Path, default=DATA_PROCESSED)
+    parser.add_argument('--format', choices=FORMATS, default=None)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    overrides = {}
+    if args.config:
+        with open(args.config, encoding='utf-8') as f:
+            overrides = json.load(f)
+    rfm_params = {**RFM_PARAMS, **overrides.get('rfm', {})}
+    clean_params = {**CLEAN_PARAMS, **overrides.get('clean', {})}
+    store = ArtifactStore(DATA_RAW, args.processed_dir, DATA_OUTPUT, fmt=args.format)
+
+    print("=" * 70)
+    print("Incremental RFM Update")
+    print("=" * 70)
+
+    if args.command == 'init':
+        trades = store.load('trade_clean', columns=['user_id', 'auction_id', 'buy_mount', 'day'])
+        print(f"  Building state from {len(trades):,} cleaned trades")
+        state, rfm = build_state(trades, rfm_params)
+        store.save('rfm_state', state)
+        store.save('rfm_latest', rfm)
+        _save_log(store, {'applied': []})
+        print(f"  Saved state for {len(state):,} users to: {store.path('rfm_state')}")
+        return
+
+    if args.delta is None:
+        raise SystemExit("apply needs a delta file")
+    log = _load_log(store)
+    digest = file_digest(args.delta)
+    if digest in (entry['sha256'] for entry in log['applied']) and not args.force:
+        raise SystemExit(f"{args.delta} was already applied (use --force to apply it again)")
+
+    state = store.load('rfm_state')
+    delta = load_delta(args.delta, clean_params)
+    print(f"  State: {len(state):,} users; delta: {len(delta):,} trades")
+    state, rfm, changes = apply_delta(state, delta, rfm_params)
+
+    store.save('rfm_state', state)
+    store.save('rfm_latest', rfm)
+    store.save('rfm_segment_changes', changes)
+    log['applied'].append({'file': str(args.delta), 'sha256': digest, 'trades': int(len(delta))})
+    _save_log(store, log)
+
+    print(f"\nUsers who changed segment: {len(changes):,}")
+    if not changes.empty:
+        moves = changes.fillna({'previous_segment': '(new)'})
+        print(moves.groupby(['previous_segment', 'segment']).size().rename('users').to_string())
+    print(f"\nSaved: {store.path('rfm_latest')}")
+    print(f"Saved: {store.path('rfm_segment_changes')}")
+
+
+if __name__ == "__main__":
+    main()
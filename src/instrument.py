@@ -0,0 +1,337 @@
+"""
+Structured instrumentation of pipeline runs
+Spans time the phases and the steps inside them (load, merge, groupby, save,
+render, ...) and record wall time, CPU time, RSS and peak RSS, together with
+counters such as rows in/out and dropped outliers. Events are written as JSON
+lines while the run progresses, so a run killed in the middle of a step still
+shows which step it was in; the totals can also be written as an OpenMetrics
+text file (e.g. for the node exporter's textfile collector). cProfile and
+tracemalloc captures can be switched on for individual spans by name.
+
+Nothing is recorded unless a monitor is active; a span is then a single
+function call.
+
+    python src/analysis.py --metrics run.jsonl --openmetrics run.prom
+    python src/analysis.py rfm --force --profile rfm --trace-memory merge
+"""
+import cProfile
+import json
+import os
+import resource
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timezone
+from pathlib import Path
+
+METRIC_PREFIX = 'taobao_pipeline'
+
+
+def _maxrss_kb(who=resource.RUSAGE_SELF):
+    """ru_maxrss in KB: getrusage reports it in bytes on macOS, in KB elsewhere"""
+    maxrss = resource.getrusage(who).ru_maxrss
+    return maxrss // 1024 if sys.platform == 'darwin' else maxrss
+
+
+def _peak_rss_kb():
+    """Peak resident set size since the last reset (VmHWM), in KB"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return _maxrss_kb()
+
+
+def _rss_kb():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') // 1024
+    except OSError:
+        return 0
+
+
+def _reset_peak_rss():
+    """Restart VmHWM from the current RSS; False where the kernel does not allow it"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def _children_cpu():
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+class Span:
+    """A running span: add counters and attributes while it is open"""
+
+    def __init__(self, name, parent, phase, attrs):
+        self.name = name
+        self.parent = parent
+        self.phase = phase
+        self.attrs = attrs
+        self.counters = {}
+        self.peak_kb = 0
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + int(value)
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+
+class _NullSpan:
+    def count(self, name, value=1):
+        pass
+
+    def set(self, **attrs):
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+class ResourceMonitor:
+    """Collects spans and counters; optionally streams them and profiles spans
+
+    `events` is a path (or open text file) receiving one JSON object per
+    line: span_start / span_end for every span plus any emit() events.
+    `profile` and `trace_memory` are span names to capture with cProfile and
+    tracemalloc; profiles are saved as '<span>.prof' under `profile_dir`.
+
+    Stages nest (e.g. 'load' inside 'clean'); each record holds its parent.
+    CPU time includes reaped worker processes (chart and groupby pools).
+    peak_rss_mb is this process only; where the peak cannot be reset per span
+    (non-Linux), it is the process peak so far. Workers are reported apart
+    as children_peak_rss_mb: the kernel only keeps the largest peak of any
+    reaped worker, so a span gets it when a worker reaped during the span
+    raised it, and 0 otherwise.
+    """
+
+    def __init__(self, events=None, profile=(), trace_memory=(), profile_dir='.'):
+        self.stages = []
+        self._open = []
+        self._own_events = isinstance(events, (str, Path))
+        if self._own_events:
+            Path(events).parent.mkdir(parents=True, exist_ok=True)
+            events = open(events, 'a', encoding='utf-8')
+        self.events = events
+        self.profile = set(profile)
+        self.trace_memory = set(trace_memory)
+        self.profile_dir = Path(profile_dir)
+        self._profilers = {}
+        self.run_id = f"{datetime.now(timezone.utc):%Y%m%dT%H%M%SZ}-{os.getpid()}"
+        self.started = time.time()
+
+    @property
+    def current(self):
+        return self._open[-1] if self._open else None
+
+    def emit(self, event, **fields):
+        if self.events is None:
+            return
+        line = {'ts': datetime.now(timezone.utc).isoformat(timespec='milliseconds'),
+                'run': self.run_id, 'event': event, **fields}
+        self.events.write(json.dumps(line, default=str) + '\n')
+        self.events.flush()
+
+    def _fold_peak(self):
+        peak = _peak_rss_kb()
+        for span in self._open:
+            span.peak_kb = max(span.peak_kb, peak)
+
+    @contextmanager
+    def measure(self, name, **attrs):
+        parent = self.current
+        phase = attrs.pop('phase', None) or (parent.phase if parent else None)
+        self._fold_peak()
+        span = Span(name, parent.name if parent else None, phase, attrs)
+        self._open.append(span)
+        self.emit('span_start', stage=name, parent=span.parent, phase=phase, **attrs)
+        _reset_peak_rss()
+
+        profiler = self._start_profile(name)
+        tracing = name in self.trace_memory and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start()
+        children_cpu, children_peak = _children_cpu(), _maxrss_kb(resource.RUSAGE_CHILDREN)
+        wall, cpu = time.perf_counter(), time.process_time()
+        error = None
+        try:
+            yield span
+        except BaseException as exc:
+            error = type(exc).__name__
+            raise
+        finally:
+            record = {
+                'stage': name, 'parent': span.parent, 'phase': phase,
+                'wall_s': time.perf_counter() - wall,
+                'cpu_s': time.process_time() - cpu + _children_cpu() - children_cpu,
+            }
+            if profiler is not None:
+                profiler.disable()
+            if tracing:
+                record['tracemalloc'] = self._memory_report()
+                tracemalloc.stop()
+            self._fold_peak()
+            self._open.pop()
+            children_now = _maxrss_kb(resource.RUSAGE_CHILDREN)
+            children_peak = children_now if children_now > children_peak else 0
+            record.update(peak_rss_mb=span.peak_kb / 1024, children_peak_rss_mb=children_peak / 1024,
+                          rss_mb=_rss_kb() / 1024, counters=span.counters, **span.attrs)
+            if error:
+                record['error'] = error
+            self.stages.append(record)
+            self.emit('span_end', **record)
+
+    def _start_profile(self, name):
+        # One cProfile per span name, accumulated over every run of the span;
+        # a span nested in a profiled one is already covered by it
+        if name not in self.profile or any(s.name in self.profile for s in self._open[:-1]):
+            return None
+        profiler = self._profilers.setdefault(name, cProfile.Profile())
+        profiler.enable()
+        return profiler
+
+    @staticmethod
+    def _memory_report(top=10):
+        current, peak = tracemalloc.get_traced_memory()
+        stats = tracemalloc.take_snapshot().statistics('lineno')[:top]
+        return {
+            'current_mb': current / 2**20,
+            'peak_mb': peak / 2**20,
+            'top': [{'where': f"{s.traceback[0].filename}:{s.traceback[0].lineno}",
+                     'size_mb': s.size / 2**20, 'count': s.count} for s in stats],
+        }
+
+    # ---------- output ----------
+
+    def totals(self):
+        """Records summed per (stage, parent): e.g. 'save' runs once per phase"""
+        totals = {}
+        for record in self.stages:
+            key = (record['stage'], record['parent'])
+            if key not in totals:
+                totals[key] = {'stage': record['stage'], 'parent': record['parent'], 'calls': 0,
+                               'wall_s': 0.0, 'cpu_s': 0.0, 'peak_rss_mb': 0.0, 'children_peak_rss_mb': 0.0,
+                               'counters': {}}
+            total = totals[key]
+            total['calls'] += 1
+            total['wall_s'] += record['wall_s']
+            total['cpu_s'] += record['cpu_s']
+            total['peak_rss_mb'] = max(total['peak_rss_mb'], record['peak_rss_mb'])
+            total['children_peak_rss_mb'] = max(total['children_peak_rss_mb'], record['children_peak_rss_mb'])
+            for name, value in record['counters'].items():
+                total['counters'][name] = total['counters'].get(name, 0) + value
+        return list(totals.values())
+
+    def openmetrics(self, success=True):
+        """Totals in the OpenMetrics text format"""
+        def labels(total, **extra):
+            pairs = {'stage': total['stage'], 'parent': total['parent'] or '', **extra}
+            return ','.join(f'{k}="{v}"' for k, v in pairs.items())
+
+        totals = self.totals()
+        families = [
+            ('stage_wall_seconds', 'Wall time per stage', lambda t: [(labels(t), t['wall_s'])]),
+            ('stage_cpu_seconds', 'CPU time per stage, workers included', lambda t: [(labels(t), t['cpu_s'])]),
+            ('stage_peak_rss_bytes', 'Peak resident memory of the pipeline process during the stage',
+             lambda t: [(labels(t), int(t['peak_rss_mb'] * 2**20))]),
+            ('stage_children_peak_rss_bytes', 'Peak resident memory of a worker reaped during the stage',
+             lambda t: [(labels(t), int(t['children_peak_rss_mb'] * 2**20))]),
+            ('stage_calls', 'Times the stage ran', lambda t: [(labels(t), t['calls'])]),
+            ('stage_rows', 'Row counters recorded by the stage',
+             lambda t: [(labels(t, counter=name), value) for name, value in t['counters'].items()]),
+        ]
+        lines = []
+        for name, help_text, samples in families:
+            lines += [f"# TYPE {METRIC_PREFIX}_{name} gauge", f"# HELP {METRIC_PREFIX}_{name} {help_text}."]
+            lines += [f"{METRIC_PREFIX}_{name}{{{label}}} {value}" for t in totals for label, value in samples(t)]
+        lines += [f"# TYPE {METRIC_PREFIX}_last_run_success gauge",
+                  f"{METRIC_PREFIX}_last_run_success {int(success)}",
+                  f"# TYPE {METRIC_PREFIX}_last_run_timestamp_seconds gauge",
+                  f"{METRIC_PREFIX}_last_run_timestamp_seconds {self.started:.3f}",
+                  "# EOF"]
+        return '\n'.join(lines) + '\n'
+
+    def close(self, openmetrics=None, success=True):
+        """Save the profiles and the OpenMetrics file; close the event stream"""
+        for name, profiler in self._profilers.items():
+            self.profile_dir.mkdir(parents=True, exist_ok=True)
+            path = self.profile_dir / f"{name}.prof"
+            profiler.dump_stats(path)
+            self.emit('profile', stage=name, path=str(path))
+        if openmetrics:
+            path = Path(openmetrics)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(path.name + '.tmp')
+            tmp.write_text(self.openmetrics(success), encoding='utf-8')
+            tmp.replace(path)
+        if self._own_events:
+            self.events.close()
+
+
+# ============================================
+# Module-level API used by the pipeline code
+# ============================================
+_monitor = None
+
+
+@contextmanager
+def monitoring(monitor=None, openmetrics=None):
+    """Activate a ResourceMonitor for the spans run inside the block"""
+    global _monitor
+    previous, _monitor = _monitor, monitor or ResourceMonitor()
+    _monitor.emit('run_start', pid=os.getpid())
+    success = False
+    try:
+        yield _monitor
+        success = True
+    finally:
+        _monitor.emit('run_end', success=success, wall_s=time.time() - _monitor.started)
+        _monitor.close(openmetrics, success)
+        _monitor = previous
+
+
+def span(name, **attrs):
+    """Measure a step when monitoring is active; yields a Span (a no-op one otherwise)"""
+    if _monitor is None:
+        return nullcontext(NULL_SPAN)
+    return _monitor.measure(name, **attrs)
+
+
+def count(name, value=1):
+    """Add to a counter of the innermost open span"""
+    if _monitor is not None and _monitor.current is not None:
+        _monitor.current.count(name, value)
+
+
+def emit(event, **fields):
+    if _monitor is not None:
+        _monitor.emit(event, **fields)
+
+
+def add_arguments(parser):
+    """--metrics / --openmetrics / --profile / --trace-memory options of the CLIs"""
+    parser.add_argument('--metrics', type=Path, help="append JSON-lines span events to this file")
+    parser.add_argument('--openmetrics', type=Path, help="write per-stage totals as an OpenMetrics text file")
+    parser.add_argument('--profile', type=lambda s: s.split(','), default=[], metavar='SPANS',
+                        help="cProfile these spans (comma-separated, e.g. rfm,merge)")
+    parser.add_argument('--trace-memory', type=lambda s: s.split(','), default=[], metavar='SPANS',
+                        help="tracemalloc these spans and report the top allocation sites")
+
+
+def from_args(args, profile_dir):
+    """Monitoring context for the parsed CLI options (a no-op when none is set)"""
+    if not (args.metrics or args.openmetrics or args.profile or args.trace_memory):
+        return nullcontext()
+    monitor = ResourceMonitor(events=args.metrics, profile=args.profile,
+                              trace_memory=args.trace_memory, profile_dir=profile_dir)
+    return monitoring(monitor, openmetrics=args.openmetrics)
@@ -0,0 +1,219 @@
+"""
+Baby-age lifecycle index for age-targeted purchase queries
+Every merged trade gets the age of the baby on the purchase day, in days and
+in lifecycle months of `days_per_month` days. Months are floored, so a
+purchase 10 days before birth is month -1 (prenatal) rather than month 0.
+The `lifecycle` phase stores the trades sorted by age once:
+
+  - lifecycle_index   (baby_age_days, age_month, trade_idx, user_id,
+                      category, cat, gender_label, buy_mount), sorted by age
+                      then trade; trades of babies with no birthday are left out
+  - lifecycle_stages  one row per stage (prenatal, the profile age groups and
+                      'later') with its month range, [start, stop) slice of
+                      the index and purchase, quantity and user totals
+  - lifecycle_meta.json
+                      the days_per_month the index was built with, so queries
+                      bucket ages the same way
+
+Any month window is then a contiguous slice of the index, found by binary
+search on the sorted ages (np.searchsorted), and per-category figures are a
+bincount over that slice only: no groupby over the full trade history.
+
+    python src/lifecycle.py --months 0 3                 # categories bought at months 0-3
+    python src/lifecycle.py --stage prenatal --by cat --top 10
+    python src/lifecycle.py --months 6 11 --category 28 --users
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+LIFECYCLE_PARAMS = {'days_per_month': 30}
+PRENATAL = 'prenatal'
+LATER = 'later'
+LIFECYCLE_META = 'lifecycle_meta.json'
+INDEX_COLUMNS = ['baby_age_days', 'age_month', 'trade_idx', 'user_id', 'category', 'cat',
+                 'gender_label', 'buy_mount']
+
+
+def age_months(days, days_per_month=30):
+    """Lifecycle month of baby ages in days, floored: -10 days is month -1, not 0"""
+    return np.floor_divide(days, days_per_month)
+
+
+def build_lifecycle_index(merged_df, days_per_month=30):
+    """Merged trades with a known baby age, sorted by (age, trade)"""
+    known = merged_df[merged_df['birthday'].notna()]
+    days = (known['day'] - known['birthday']).dt.days.to_numpy().astype(np.int32)
+    order = np.lexsort((known['trade_idx'].to_numpy(), days))
+    index = known.iloc[order][INDEX_COLUMNS[2:]].reset_index(drop=True)
+    index.insert(0, 'age_month', age_months(days[order], days_per_month).astype(np.int16))
+    index.insert(0, 'baby_age_days', days[order])
+    return index
+
+
+def stage_bounds(age_bins, age_labels, days_per_month, first_day, last_day):
+    """(stage, min_month, stop_month) for prenatal, the age groups and 'later'
+
+    The open-ended stages are closed at the observed extreme ages.
+    """
+    first_month = min(first_day // days_per_month, 0)
+    last_month = max(last_day // days_per_month + 1, age_bins[-1])
+    bounds = [(PRENATAL, first_month, age_bins[0])]
+    bounds += list(zip(age_labels, age_bins[:-1], age_bins[1:]))
+    bounds.append((LATER, age_bins[-1], last_month))
+    return bounds
+
+
+def lifecycle_stages(index, age_bins, age_labels, days_per_month=30):
+    """Per-stage slices of the age-sorted index with their totals"""
+    days = index['baby_age_days'].to_numpy()
+    first, last = (int(days[0]), int(days[-1])) if len(days) else (0, 0)
+    bounds = stage_bounds(age_bins, age_labels, days_per_month, first, last)
+    lows = np.array([low for _, low, _ in bounds], dtype=np.int64) * days_per_month
+    highs = np.array([high for _, _, high in bounds], dtype=np.int64) * days_per_month
+    starts = np.searchsorted(days, lows, side='left')
+    stops = np.searchsorted(days, highs, side='left')
+
+    quantity = np.concatenate([[0], np.cumsum(index['buy_mount'].to_numpy(dtype=np.int64))])
+    users = index['user_id'].to_numpy()
+    return pd.DataFrame({
+        'stage': [name for name, _, _ in bounds],
+        'min_month': [low for _, low, _ in bounds],
+        'stop_month': [high for _, _, high in bounds],
+        'start': starts.astype(np.int64),
+        'stop': stops.astype(np.int64),
+        'purchase_count': (stops - starts).astype(np.int64),
+        'total_quantity': quantity[stops] - quantity[starts],
+        'unique_users': [len(pd.unique(users[a:b])) for a, b in zip(starts, stops)],
+    })
+
+
+class LifecycleIndex:
+    """Month-window queries over the age-sorted lifecycle index
+
+    Built once per process (e.g. by a CRM service) and queried repeatedly:
+    each query bisects the sorted ages and touches only the window's rows.
+    Months are inclusive at both ends and negative months are prenatal.
+    """
+
+    def __init__(self, index, stages=None, days_per_month=30):
+        self.days = index['baby_age_days'].to_numpy()
+        self.days_per_month = days_per_month
+        self.index = index.reset_index(drop=True)
+        self.stages = stages
+        self._codes = {}
+
+    @classmethod
+    def load(cls, store):
+        """The stored index, with the month length it was built with"""
+        meta = store.load(LIFECYCLE_META) if store.exists(LIFECYCLE_META) else LIFECYCLE_PARAMS
+        return cls(store.load('lifecycle_index'), store.load('lifecycle_stages'), meta['days_per_month'])
+
+    def codes(self, column):
+        """Dense integer codes and their values for a column, computed once"""
+        if column not in self._codes:
+            self._codes[column] = pd.factorize(self.index[column], sort=True)
+        return self._codes[column]
+
+    def window(self, first_month, last_month):
+        """[start, stop) rows of the trades at months first_month..last_month"""
+        low = first_month * self.days_per_month
+        high = (last_month + 1) * self.days_per_month
+        return np.searchsorted(self.days, [low, high], side='left')
+
+    def stage(self, name):
+        """(first_month, last_month) of a stored stage, e.g. 'prenatal' or '0-6m'"""
+        rows = self.stages[self.stages['stage'] == name]
+        if rows.empty:
+            raise KeyError(f"Unknown stage '{name}' (stages: {', '.join(self.stages['stage'])})")
+        return int(rows['min_month'].iloc[0]), int(rows['stop_month'].iloc[0]) - 1
+
+    def purchases(self, first_month, last_month, by='category', top=None):
+        """Purchase count, quantity and distinct users per `by` value in the window"""
+        start, stop = self.window(first_month, last_month)
+        codes, values = self.codes(by)
+        window = codes[start:stop]
+        user_codes, user_values = self.codes('user_id')
+        pairs = np.unique(window.astype(np.int64) * len(user_values) + user_codes[start:stop])
+        result = pd.DataFrame({
+            by: values,
+            'purchase_count': np.bincount(window, minlength=len(values)),
+            'total_quantity': np.bincount(window, weights=self.index['buy_mount'].to_numpy()[start:stop],
+                                          minlength=len(values)).astype(np.int64),
+            'unique_users': np.bincount(pairs // len(user_values), minlength=len(values)),
+        })
+        result = result[result['purchase_count'] > 0]
+        result['share'] = result['purchase_count'] / max(stop - start, 1)
+        result = result.sort_values(['purchase_count', by], ascending=[False, True]).reset_index(drop=True)
+        return result.head(top) if top else result
+
+    def users(self, first_month, last_month, **where):
+        """Distinct users buying in the window, optionally only where column == value"""
+        start, stop = self.window(first_month, last_month)
+        rows = self.index.iloc[start:stop]
+        for column, value in where.items():
+            rows = rows[rows[column] == value]
+        return pd.unique(rows['user_id'].to_numpy())
+
+
+# ============================================
+# Pipeline phase
+# ============================================
+def lifecycle_phase(inputs, params):
+    print("\n[Lifecycle] Baby-Age Index")
+    print("-" * 70)
+    merged_df = inputs['merged_data']
+    index = build_lifecycle_index(merged_df, params['days_per_month'])
+    stages = lifecycle_stages(index, params['age_bins'], params['age_labels'], params['days_per_month'])
+    unknown = len(merged_df) - len(index)
+    print(f"  {len(index):,} trades indexed by baby age"
+          + (f" ({unknown:,} without a birthday left out)" if unknown else ""))
+    print(stages.drop(columns=['start', 'stop']).to_string(index=False))
+    return {'lifecycle_index': index, 'lifecycle_stages': stages,
+            LIFECYCLE_META: {'days_per_month': params['days_per_month']}}
+
+
+def main(argv=None):
+    from analysis import DATA_OUTPUT, DATA_PROCESSED, DATA_RAW
+    from storage import ArtifactStore, FORMATS
+
+    parser = argparse.ArgumentParser(description="Purchases by baby age, from the lifecycle index")
+    window = parser.add_mutually_exclusive_group()
+    window.add_argument('--months', type=int, nargs=2, metavar=('FIRST', 'LAST'), default=[0, 3],
+                        help="inclusive month window; negative months are before birth (default: 0 3)")
+    window.add_argument('--stage', help="a stored stage instead, e.g. prenatal, 0-6m, later")
+    parser.add_argument('--by', choices=['category', 'cat', 'gender_label'], default='category')
+    parser.add_argument('--top', type=int, default=20)
+    parser.add_argument('--category', type=int, help="with --users: only buyers of this category")
+    parser.add_argument('--users', action='store_true', help="list the distinct buyers in the window")
+    parser.add_argument('--processed-dir', default=DATA_PROCESSED)
+    parser.add_argument('--format', choices=FORMATS)
+    args = parser.parse_args(argv)
+
+    store = ArtifactStore(DATA_RAW, args.processed_dir, DATA_OUTPUT, fmt=args.format)
+    if not store.exists('lifecycle_index'):
+        raise SystemExit("No lifecycle index yet. Build it first: python src/analysis.py lifecycle")
+    start = time.perf_counter()
+    index = LifecycleIndex.load(store)
+    loaded = time.perf_counter()
+    try:
+        first, last = index.stage(args.stage) if args.stage else args.months
+    except KeyError as exc:
+        raise SystemExit(exc.args[0])
+
+    if args.users:
+        where = {'category': args.category} if args.category is not None else {}
+        result = index.users(first, last, **where)
+        print(f"{len(result):,} users bought at months {first}..{last}")
+        print('\n'.join(map(str, result[:args.top])))
+    else:
+        result = index.purchases(first, last, by=args.by, top=args.top)
+        print(f"Months {first}..{last}:")
+        print(result.round(4).to_string(index=False))
+    print(f"\n(load {1000 * (loaded - start):.0f} ms, query {1000 * (time.perf_counter() - loaded):.1f} ms)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+"""
+Point lookups of one customer's full profile
+The `lookup` phase writes `user_index.cols`, a directory of plain .npy arrays:
+the trades sorted by (user, day, trade) with one file per column, an offsets
+array giving each user's [start, stop) slice, and per-user arrays for the
+baby info and the RFM scores. The sorted user ids are the key.
+
+At query time the arrays are memory-mapped, never loaded: finding a user is a
+binary search over the sorted ids (touching a handful of pages) and their
+trades are one contiguous slice of each column, so a lookup costs
+milliseconds whatever the size of the trade history.
+
+String columns (auction_id, property, gender, rfm_score, segment) are stored as
+integer codes into a sorted array of their distinct values; ids and values
+are kept as UTF-8 bytes so every array maps without unpickling.
+
+    python src/lookup.py user_00815            # baby info, RFM segment and trades
+    python src/lookup.py user_00815 --json
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+import pandas as pd
+
+USER_INDEX = 'user_index.cols'
+TRADE_COLUMNS = ['day', 'auction_id', 'category', 'cat', 'property', 'buy_mount', 'trade_idx']
+STRING_COLUMNS = ['auction_id', 'property']
+RFM_COLUMNS = ['recency', 'frequency', 'monetary', 'r_score', 'f_score', 'm_score']
+# Stored as scored by the rfm phase, never re-derived from the scores
+RFM_LABELS = ['rfm_score', 'segment']
+
+
+def _keys(values):
+    """Ids as a mappable array: integers stay integers, anything else UTF-8 bytes"""
+    values = pd.Index(values)
+    if pd.api.types.is_integer_dtype(values.dtype):
+        return values.to_numpy(dtype=np.int64)
+    return np.char.encode(values.astype(str).to_numpy(dtype=str), 'utf-8')
+
+
+def _dictionary(values):
+    """(codes, sorted distinct values) of a string or categorical column"""
+    values = pd.Series(values)
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        codes, categories = values.cat.codes.to_numpy(), values.cat.categories
+    else:
+        codes, categories = pd.factorize(values, sort=True)
+    return codes.astype(np.int32), _keys(categories)
+
+
+def build_user_index(merged_df, baby_df, rfm):
+    """Arrays of the user index (see the module docstring)"""
+    users = merged_df['user_id']
+    if isinstance(users.dtype, pd.CategoricalDtype):
+        user_codes, universe = users.cat.codes.to_numpy(), users.cat.categories
+    else:
+        universe = pd.Index(pd.unique(np.concatenate([users.to_numpy(), baby_df['user_id'].to_numpy()])))
+        universe = universe.sort_values()
+        user_codes = universe.get_indexer(users)
+
+    order = np.lexsort((merged_df['trade_idx'].to_numpy(), merged_df['day'].to_numpy(), user_codes))
+    columns = {
+        'users': _keys(universe),
+        'offsets': np.concatenate([[0], np.cumsum(np.bincount(user_codes, minlength=len(universe)))]),
+    }
+    for col in TRADE_COLUMNS:
+        values = merged_df[col].iloc[order]
+        if col in STRING_COLUMNS:
+            columns[col], columns[f'{col}.values'] = _dictionary(values)
+        elif col == 'day':
+            columns[col] = values.to_numpy().astype('datetime64[D]')
+        else:
+            columns[col] = values.to_numpy(dtype=np.int64)
+
+    # Per-user attributes, aligned with `users`; -1 / NaT where a user has none
+    baby = universe.get_indexer(baby_df['user_id'].astype(universe.dtype))
+    columns['birthday'] = np.full(len(universe), np.datetime64('NaT'), dtype='datetime64[D]')
+    columns['birthday'][baby] = baby_df['birthday'].to_numpy().astype('datetime64[D]')
+    gender_codes, columns['gender.values'] = _dictionary(baby_df['gender_label'])
+    columns['gender'] = np.full(len(universe), -1, dtype=np.int32)
+    columns['gender'][baby] = gender_codes
+
+    scored = universe.get_indexer(pd.Index(rfm['user_id']).astype(universe.dtype))
+    for col in RFM_COLUMNS:
+        columns[col] = np.full(len(universe), -1, dtype=np.int64)
+        columns[col][scored] = rfm[col].to_numpy()
+    for col in RFM_LABELS:
+        codes, columns[f'{col}.values'] = _dictionary(rfm[col])
+        columns[col] = np.full(len(universe), -1, dtype=np.int32)
+        columns[col][scored] = codes
+    return columns
+
+
+class UserIndex:
+    """Lookups over the memory-mapped user index"""
+
+    def __init__(self, columns):
+        self.columns = columns
+        self.users = columns['users']
+
+    @classmethod
+    def load(cls, store):
+        return cls(store.load(USER_INDEX))
+
+    def position(self, user_id):
+        """Row of `user_id` in the per-user arrays, or None"""
+        key = int(user_id) if self.users.dtype.kind in 'iu' else str(user_id).encode('utf-8')
+        pos = int(np.searchsorted(self.users, key))
+        return pos if pos < len(self.users) and self.users[pos] == key else None
+
+    def _decode(self, col, codes):
+        """Values of dictionary codes; a missing value (code -1) decodes to ''"""
+        values = self.columns[f'{col}.values']
+        decoded = np.asarray(values[np.maximum(codes, 0)])
+        decoded = np.char.decode(decoded, 'utf-8') if decoded.dtype.kind == 'S' else decoded.astype(str)
+        return np.where(np.asarray(codes) >= 0, decoded, '')
+
+    def trades(self, user_id):
+        """The user's trades, oldest first (an empty frame for an unknown user)"""
+        pos = self.position(user_id)
+        start, stop = (int(self.columns['offsets'][pos]), int(self.columns['offsets'][pos + 1])) \
+            if pos is not None else (0, 0)
+        frame = {}
+        for col in TRADE_COLUMNS:
+            values = np.asarray(self.columns[col][start:stop])
+            frame[col] = self._decode(col, values) if col in STRING_COLUMNS else values
+        return pd.DataFrame(frame)
+
+    def profile(self, user_id):
+        """Baby info, RFM scores and trade totals of one user; None if unknown"""
+        pos = self.position(user_id)
+        if pos is None:
+            return None
+        c = self.columns
+        birthday = c['birthday'][pos]
+        profile = {
+            'user_id': str(user_id),
+            'birthday': None if np.isnat(birthday) else str(birthday),
+            'gender': str(self._decode('gender', c['gender'][pos])) if c['gender'][pos] >= 0 else None,
+            'trades': int(c['offsets'][pos + 1] - c['offsets'][pos]),
+        }
+        if c['segment'][pos] >= 0:
+            profile.update({col: int(c[col][pos]) for col in RFM_COLUMNS})
+            profile.update({col: str(self._decode(col, c[col][pos])) for col in RFM_LABELS})
+        return profile
+
+
+# ============================================
+# Pipeline phase
+# ============================================
+def lookup_phase(inputs, params):
+    print("\n[Lookup] Per-User Index")
+    print("-" * 70)
+    columns = build_user_index(inputs['merged_data'], inputs['baby_clean'], inputs['rfm_analysis'])
+    size = sum(values.nbytes for values in columns.values())
+    print(f"  {len(columns['users']):,} users, {len(columns['trade_idx']):,} trades, "
+          f"{len(columns)} arrays ({size / 2**20:.1f} MB)")
+    return {USER_INDEX: columns}
+
+
+def main(argv=None):
+    from analysis import DATA_OUTPUT, DATA_PROCESSED, DATA_RAW
+    from storage import ArtifactStore, FORMATS
+
+    parser = argparse.ArgumentParser(description="Show one user's baby info, RFM segment and trades")
+    parser.add_argument('user_id')
+    parser.add_argument('--json', action='store_true', help="print the profile and trades as JSON")
+    parser.add_argument('--processed-dir', default=DATA_PROCESSED)
+    parser.add_argument('--format', choices=FORMATS)
+    args = parser.parse_args(argv)
+
+    store = ArtifactStore(DATA_RAW, args.processed_dir, DATA_OUTPUT, fmt=args.format)
+    if not store.exists(USER_INDEX):
+        raise SystemExit("No user index yet. Build it first: python src/analysis.py lookup")
+    start = time.perf_counter()
+    index = UserIndex.load(store)
+    profile = index.profile(args.user_id)
+    if profile is None:
+        raise SystemExit(f"Unknown user: {args.user_id}")
+    trades = index.trades(args.user_id)
+    elapsed = time.perf_counter() - start
+
+    if args.json:
+        trades['day'] = trades['day'].astype(str)
+        print(json.dumps({**profile, 'history': trades.to_dict(orient='records')}, indent=2, default=int))
+        return
+    for key, value in profile.items():
+        print(f"{key:<12}{value}")
+    print()
+    print(trades.to_string(index=False))
+    print(f"\n(lookup {1000 * elapsed:.1f} ms)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Parallel aggregation engine for the groupby-heavy phases
+Hash-partitions the merged trades across a process pool, computes partial
+aggregates per partition and reduces them. Partitioning by `user_id` keeps
+every user in exactly one partition, so per-group distinct users can be summed
+across partitions; product stats are partitioned by `auction_id` instead, so
+each product's partial is already complete. Distinct users can also be
+estimated with mergeable HyperLogLog sketches, which merge under any split.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from functools import reduce
+
+import numpy as np
+import pandas as pd
+
+from instrument import span
+from sketches import GroupedHLL
+
+
+def hash_partition(df, key, n):
+    """Split `df` into `n` frames by a stable hash of the `key` column"""
+    if n <= 1:
+        return [df]
+    codes = pd.util.hash_pandas_object(df[key], index=False).to_numpy() % n
+    order = np.argsort(codes, kind='stable')
+    bounds = np.cumsum(np.bincount(codes, minlength=n))[:-1]
+    return [df.iloc[idx] for idx in np.split(order, bounds)]
+
+
+def map_partitions(func, parts, workers):
+    """Apply `func` to each partition, in a process pool when workers > 1"""
+    if workers <= 1 or len(parts) <= 1:
+        return [func(part) for part in parts]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(func, parts))
+
+
+def _partial_group_stats(args):
+    part, keys, exact, precision, observed = args
+    partials, sketches = {}, {}
+    for key in keys:
+        grouped = part.groupby(key, observed=observed)
+        stats = pd.DataFrame({
+            'purchase_count': grouped['buy_mount'].count(),
+            'total_quantity': grouped['buy_mount'].sum(),
+        })
+        if exact:
+            stats['unique_users'] = grouped['user_id'].nunique()
+        if precision is not None:
+            sketches[key] = GroupedHLL(precision).update(part[key], part['user_id'])
+        partials[key] = stats
+    return partials, sketches
+
+
+def group_stats(df, keys, workers=1, partition_key='user_id', distinct='exact', precision=14,
+                with_sketches=False, observed=False):
+    """purchase_count, total_quantity and unique_users per value of each key
+
+    Returns {key: stats frame indexed (and sorted) by key}, identical to the
+    serial `groupby(key).agg(...)`. With distinct='exact', partial nunique
+    values are only additive when groups cannot share a user across
+    partitions, i.e. when partitioning by user_id or by the group key itself.
+    With distinct='hll', unique_users is estimated from per-partition
+    HyperLogLog sketches of the given precision, merged in the reduce step.
+    `with_sketches=True` also returns the merged sketches: (stats, sketches).
+    Empty categories of a categorical key (e.g. an age group without trades)
+    are kept unless `observed=True`, which encoded id keys should use.
+    """
+    exact = distinct == 'exact'
+    if exact and partition_key != 'user_id' and any(key != partition_key for key in keys):
+        raise ValueError("Distinct users only add up across partitions split by user_id "
+                         f"or by the group key; got partition_key={partition_key!r}, keys={keys}")
+    with span('groupby', by=list(keys), workers=workers) as s:
+        s.count('rows_in', len(df))
+        sketch_precision = precision if (not exact or with_sketches) else None
+        columns = list(dict.fromkeys(['user_id', 'buy_mount', *keys]))
+        parts = hash_partition(df[columns], partition_key, workers)
+        results = map_partitions(_partial_group_stats,
+                                 [(part, keys, exact, sketch_precision, observed) for part in parts], workers)
+
+        stats, sketches = results[0]
+        if len(results) > 1:
+            stats = {key: pd.concat([r[0][key] for r in results]).groupby(level=0, observed=observed).sum()
+                     for key in keys}
+            sketches = {key: reduce(lambda a, b: a.merge(b), [r[1][key] for r in results])
+                        for key in sketches}
+        if not exact:
+            for key in keys:
+                counts = sketches[key].counts()
+                stats[key]['unique_users'] = counts.reindex(stats[key].index).fillna(0).astype('int64').to_numpy()
+        s.count('groups_out', sum(len(frame) for frame in stats.values()))
+    return (stats, sketches) if with_sketches else stats
+
+
+def _partial_rfm(part):
+    return part.groupby('user_id', observed=True).agg(
+        last_day=('day', 'max'),
+        frequency=('auction_id', 'count'),
+        monetary=('buy_mount', 'sum'),
+    )
+
+
+def user_rfm(df, workers=1):
+    """Per-user last purchase day, frequency and monetary, sorted by user_id"""
+    with span('groupby', by=['user_id'], workers=workers) as s:
+        s.count('rows_in', len(df))
+        parts = hash_partition(df[['user_id', 'auction_id', 'buy_mount', 'day']], 'user_id', workers)
+        partials = map_partitions(_partial_rfm, parts, workers)
+        rfm = partials[0] if len(partials) == 1 else pd.concat(partials).sort_index()
+        s.count('groups_out', len(rfm))
+    return rfm
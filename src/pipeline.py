@@ -0,0 +1,278 @@
+"""
+Cached DAG runner for the analysis pipeline
+A phase only re-runs when its code, its parameters or the content of one of
+its upstream artifacts has changed since the last recorded run.
+"""
+import hashlib
+import importlib
+import inspect
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from instrument import emit, span
+
+
+# Parameters that change how a phase runs but not what it produces; they are
+# left out of the cache key so e.g. switching --workers does not force a re-run.
+EXECUTION_PARAMS = ('workers', 'chunksize')
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """SHA-256 of a file's contents"""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(chunk_size), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _hash_text(*parts):
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(part.encode('utf-8'))
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+class Phase:
+    """A unit of work with declared inputs, outputs and parameters
+
+    `func(inputs, params)` receives a dict of loaded input artifacts and must
+    return a dict with one entry per declared output. Extra callables listed in
+    `code` are hashed together with `func` so edits to helpers invalidate it.
+    `func` may also be given as 'module:function', imported on first use, so
+    phases with heavy dependencies (e.g. matplotlib) cost nothing until run.
+    """
+
+    def __init__(self, name, func, inputs=(), outputs=(), params=None, code=()):
+        self.name = name
+        self._func = func
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.params = dict(params or {})
+        self.code = list(code)
+
+    @property
+    def func(self):
+        if isinstance(self._func, str):
+            module, _, attr = self._func.partition(':')
+            self._func = getattr(importlib.import_module(module), attr)
+        return self._func
+
+    def code_hash(self):
+        sources = [inspect.getsource(fn) for fn in [self.func] + self.code]
+        return _hash_text(*sources)
+
+    @property
+    def draws_figures(self):
+        """True for phases that only produce images (rendered after the data phases)"""
+        return bool(self.outputs) and all(name.endswith('.png') for name in self.outputs)
+
+
+def _rows(value):
+    """Row count of a table artifact, None for anything else"""
+    shape = getattr(value, 'shape', None)
+    return int(shape[0]) if shape else None
+
+
+def _render(func, inputs, params, store):
+    """Run a figure phase and save its images; executed in a pool worker"""
+    start = time.perf_counter()
+    for name, fig in func(inputs, params).items():
+        store.save(name, fig)
+    return time.perf_counter() - start
+
+
+class Pipeline:
+    """Runs phases in dependency order, skipping the ones that are up to date
+
+    Run records (phase keys and output digests) are kept in a JSON manifest.
+    File digests are cached by (size, mtime) so unchanged artifacts are not
+    re-hashed on every run.
+    """
+
+    def __init__(self, phases, store, manifest_path):
+        self.phases = {phase.name: phase for phase in phases}
+        self.store = store
+        self.manifest_path = Path(manifest_path)
+        self.producers = {}
+        for phase in phases:
+            for name in phase.outputs:
+                if name in self.producers:
+                    raise ValueError(f"Artifact '{name}' is produced by both "
+                                     f"'{self.producers[name]}' and '{phase.name}'")
+                self.producers[name] = phase.name
+        self.manifest = self._load_manifest()
+        self._values = {}
+
+    # ---------- manifest ----------
+
+    def _load_manifest(self):
+        if self.manifest_path.exists():
+            with open(self.manifest_path, encoding='utf-8') as f:
+                return json.load(f)
+        return {'phases': {}, 'files': {}}
+
+    def _save_manifest(self):
+        self.manifest_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.manifest_path, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f, indent=2, sort_keys=True)
+
+    def digest(self, name):
+        """Content digest of an artifact (a file or a directory of files)"""
+        path = self.store.path(name)
+        if not path.exists():
+            return None
+        files = sorted(p for p in path.rglob('*') if p.is_file()) if path.is_dir() else [path]
+        parts = []
+        for f in files:
+            stat = f.stat()
+            cached = self.manifest['files'].get(str(f))
+            if cached and cached['size'] == stat.st_size and cached['mtime_ns'] == stat.st_mtime_ns:
+                sha = cached['sha256']
+            else:
+                sha = file_digest(f)
+                self.manifest['files'][str(f)] = {
+                    'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': sha}
+            parts.append(f"{f.relative_to(path) if path.is_dir() else f.name}:{sha}")
+        return _hash_text(*parts)
+
+    # ---------- scheduling ----------
+
+    def with_figures(self, targets):
+        """`targets` plus the figure phases drawn from what they build"""
+        built = {artifact for name in self.order(targets) for artifact in self.phases[name].outputs}
+        figures = [name for name, phase in self.phases.items()
+                   if phase.draws_figures and name not in targets and set(phase.inputs) <= built]
+        return list(targets) + figures
+
+    def order(self, targets=None):
+        """Topologically sorted phase names needed to build `targets`"""
+        targets = list(targets or self.phases)
+        for name in targets:
+            if name not in self.phases:
+                raise KeyError(f"Unknown phase '{name}'. Available: {', '.join(self.phases)}")
+        ordered, visiting, done = [], set(), set()
+
+        def visit(name):
+            if name in done:
+                return
+            if name in visiting:
+                raise ValueError(f"Cycle detected at phase '{name}'")
+            visiting.add(name)
+            for artifact in self.phases[name].inputs:
+                upstream = self.producers.get(artifact)
+                if upstream is not None:
+                    visit(upstream)
+            visiting.discard(name)
+            done.add(name)
+            ordered.append(name)
+
+        for name in targets:
+            visit(name)
+        return ordered
+
+    def phase_params(self, phase, overrides=None):
+        params = dict(phase.params)
+        params.update((overrides or {}).get(phase.name, {}))
+        return params
+
+    def phase_key(self, phase, params):
+        input_digests = [f"{name}={self.digest(name)}" for name in phase.inputs]
+        tracked = {k: v for k, v in params.items() if k not in EXECUTION_PARAMS}
+        return _hash_text(phase.code_hash(),
+                          json.dumps(tracked, sort_keys=True, default=str),
+                          *input_digests)
+
+    def is_fresh(self, phase, key):
+        record = self.manifest['phases'].get(phase.name)
+        if not record or record.get('key') != key:
+            return False
+        return all(self.digest(name) == record['outputs'].get(name)
+                   for name in phase.outputs)
+
+    def load(self, name):
+        """Artifact value, from memory if produced in this run, else from disk"""
+        if name not in self._values:
+            with span('load', artifact=name) as s:
+                self._values[name] = self.store.load(name)
+                s.set(rows=_rows(self._values[name]))
+        return self._values[name]
+
+    def _record(self, phase, key, seconds):
+        self.manifest['phases'][phase.name] = {
+            'key': key,
+            'outputs': {artifact: self.digest(artifact) for artifact in phase.outputs},
+            'seconds': round(seconds, 3),
+        }
+        self._save_manifest()
+
+    def run(self, targets=None, force=False, overrides=None, charts=True, chart_workers=None):
+        """Build `targets` (default: every phase); returns the executed phase names
+
+        Stale figure phases are deferred and rendered together at the end, in a
+        process pool of `chart_workers` (default: one per stale figure, up to
+        the CPU count). With charts=False they are skipped entirely.
+        """
+        if targets and charts:
+            targets = self.with_figures(targets)
+        executed, figures = [], []
+        for name in self.order(targets):
+            phase = self.phases[name]
+            if phase.draws_figures and not charts:
+                print(f"  [skipped] {name} (no charts)")
+                emit('phase', phase=name, status='skipped')
+                continue
+            params = self.phase_params(phase, overrides)
+            key = self.phase_key(phase, params)
+            forced = force is True or (force and name in force)
+            if not forced and self.is_fresh(phase, key):
+                print(f"  [cached] {name}")
+                emit('phase', phase=name, status='cached')
+                continue
+
+            missing = [a for a in phase.inputs if a not in self._values and not self.store.exists(a)]
+            if missing:
+                raise FileNotFoundError(f"Phase '{name}' is missing inputs: {', '.join(missing)}")
+
+            inputs = {artifact: self.load(artifact) for artifact in phase.inputs}
+            if phase.draws_figures:
+                figures.append((phase, key, inputs, params))
+                continue
+            start = time.perf_counter()
+            with span(name, phase=name) as s:
+                rows_in = [_rows(value) for value in inputs.values() if _rows(value) is not None]
+                if rows_in:
+                    s.count('rows_in', sum(rows_in))
+                outputs = phase.func(inputs, params)
+                s.count('rows_out', sum(_rows(value) or 0 for value in outputs.values()))
+            undeclared = set(outputs) - set(phase.outputs)
+            if undeclared or len(outputs) != len(phase.outputs):
+                raise ValueError(f"Phase '{name}' returned {sorted(outputs)}, "
+                                 f"declared {sorted(phase.outputs)}")
+            for artifact, value in outputs.items():
+                with span('save', phase=name, artifact=artifact, rows=_rows(value)):
+                    self.store.save(artifact, value)
+                if not artifact.endswith('.png'):
+                    self._values[artifact] = value
+            self._record(phase, key, time.perf_counter() - start)
+            executed.append(name)
+
+        if figures:
+            workers = chart_workers or min(len(figures), os.cpu_count() or 1)
+            jobs = [(phase.func, inputs, params, self.store) for phase, _, inputs, params in figures]
+            with span('render', figures=[phase.name for phase, *_ in figures]):
+                if workers > 1 and len(jobs) > 1:
+                    print(f"  Rendering {len(jobs)} figures in {workers} processes")
+                    with ProcessPoolExecutor(max_workers=workers) as pool:
+                        seconds = list(pool.map(_render, *zip(*jobs)))
+                else:
+                    seconds = [_render(*job) for job in jobs]
+            for (phase, key, _, _), elapsed in zip(figures, seconds):
+                self._record(phase, key, elapsed)
+                executed.append(phase.name)
+        self._save_manifest()
+        return executed
@@ -0,0 +1,200 @@
+"""
+Property attributes: parser and inverted index
+In the Tianchi data the `property` column holds 'key:value;key:value' lists of
+attribute ids. Because `property` is dictionary-encoded (see encoding.py),
+only the distinct property strings are parsed; every trade then picks up the
+parsed pairs of its property code, so exploding to trade level is a pair of
+numpy gathers with no string work per trade.
+
+The `properties` phase writes two tables:
+  - trade_properties     (trade_idx, key_id, value_id), sorted by attribute
+                         then trade, so each attribute's trades are one slice
+  - property_attributes  one row per (key, value) attribute with its ids,
+                         strings and the [start, stop) slice into
+                         trade_properties: the inverted index
+
+`trade_idx` is the row number of the trade in the raw trade history (the
+`trade_idx` column of trade_clean / merged_data), so queries can join back to
+any trade column.
+
+    python src/properties.py --category 50014815             # purchases per attribute value
+    python src/properties.py --key 4683 --where year=2014     # one attribute key
+"""
+import argparse
+
+import numpy as np
+import pandas as pd
+
+PAIR_SEPARATOR = ';'
+KEY_SEPARATOR = ':'
+
+
+def parse_properties(values):
+    """Parse property strings into (position, key, value) rows
+
+    `values` are the distinct property strings; returns a frame with the
+    position of the source string and the stripped key and value of each
+    pair. Empty pairs are dropped, a pair without ':' is a key with an empty
+    value, and a pair repeated within one string is kept once.
+    """
+    pairs = pd.Series(np.asarray(values, dtype=object)).str.split(PAIR_SEPARATOR).explode()
+    pairs = pairs[pairs.notna()].str.strip()
+    pairs = pairs[pairs != '']
+    parts = pairs.str.partition(KEY_SEPARATOR)
+    parsed = pd.DataFrame({'position': pairs.index.to_numpy(dtype=np.int64),
+                           'key': parts[0].str.strip().to_numpy(),
+                           'value': parts[2].str.strip().to_numpy()})
+    return parsed.drop_duplicates(ignore_index=True)
+
+
+def build_index(properties, trade_idx):
+    """Inverted index of the attributes of a (categorical) property column
+
+    `properties` is the property column of the trades and `trade_idx` their
+    ids. Returns (trade_properties, property_attributes) as described in the
+    module docstring.
+    """
+    properties = pd.Categorical(properties)
+    parsed = parse_properties(properties.categories)
+    keys = pd.Index(parsed['key'].unique()).sort_values()
+    values = pd.Index(parsed['value'].unique()).sort_values()
+    pair_key = keys.get_indexer(parsed['key']).astype(np.int32)
+    pair_value = values.get_indexer(parsed['value']).astype(np.int32)
+
+    # Pairs of each distinct property as CSR arrays (parsed is ordered by position)
+    per_property = np.bincount(parsed['position'], minlength=len(properties.categories))
+    offsets = np.concatenate([[0], np.cumsum(per_property)])
+
+    # Trade level: repeat each trade once per pair of its property
+    codes = properties.codes.astype(np.int64)
+    lengths = np.where(codes >= 0, per_property[np.maximum(codes, 0)], 0)
+    total = int(lengths.sum())
+    first = np.repeat(np.cumsum(lengths) - lengths, lengths)
+    pair = np.repeat(offsets[np.maximum(codes, 0)], lengths) + np.arange(total) - first
+    trade_properties = pd.DataFrame({
+        'trade_idx': np.repeat(np.asarray(trade_idx, dtype=np.int64), lengths),
+        'key_id': pair_key[pair],
+        'value_id': pair_value[pair],
+    })
+    order = np.lexsort((trade_properties['trade_idx'], trade_properties['value_id'],
+                        trade_properties['key_id']))
+    trade_properties = trade_properties.iloc[order].reset_index(drop=True)
+
+    # One row per attribute with its slice of trade_properties
+    attribute = trade_properties[['key_id', 'value_id']].to_numpy()
+    change = np.flatnonzero(np.any(np.diff(attribute, axis=0) != 0, axis=1)) + 1 if total else []
+    starts = np.concatenate([[0], change]).astype(np.int64) if total else np.array([], dtype=np.int64)
+    stops = np.append(starts[1:], total).astype(np.int64)
+    key_id = trade_properties['key_id'].to_numpy()[starts]
+    value_id = trade_properties['value_id'].to_numpy()[starts]
+    property_attributes = pd.DataFrame({
+        'key_id': key_id, 'value_id': value_id,
+        'key': keys[key_id], 'value': values[value_id],
+        'start': starts, 'stop': stops,
+    })
+    return trade_properties, property_attributes
+
+
+class PropertyIndex:
+    """Queries over trade_properties / property_attributes without re-parsing"""
+
+    def __init__(self, trade_properties, property_attributes):
+        self.trade_idx = trade_properties['trade_idx'].to_numpy()
+        # Numeric-looking ids come back as numbers from CSV storage
+        attributes = property_attributes.reset_index(drop=True).fillna({'value': ''})
+        self.attributes = attributes.astype({'key': str, 'value': str})
+
+    @classmethod
+    def load(cls, store):
+        return cls(store.load('trade_properties', columns=['trade_idx']), store.load('property_attributes'))
+
+    def _rows(self, key=None, value=None):
+        mask = np.ones(len(self.attributes), dtype=bool)
+        if key is not None:
+            mask &= (self.attributes['key'] == str(key)).to_numpy()
+        if value is not None:
+            mask &= (self.attributes['value'] == str(value)).to_numpy()
+        return self.attributes[mask]
+
+    def trades(self, key, value=None):
+        """trade_idx of the trades carrying attribute key (and value), sorted"""
+        rows = self._rows(key, value)
+        slices = [self.trade_idx[start:stop] for start, stop in zip(rows['start'], rows['stop'])]
+        return np.unique(np.concatenate(slices)) if slices else np.array([], dtype=np.int64)
+
+    def counts(self, key=None, trades=None):
+        """Purchase count per attribute value, optionally among `trades` only
+
+        `trades` is an array of trade_idx (e.g. the trades of one category);
+        each attribute's slice is matched against it with one vectorized isin.
+        """
+        rows = self._rows(key)
+        if trades is None:
+            counts = (rows['stop'] - rows['start']).to_numpy()
+        else:
+            lengths = (rows['stop'] - rows['start']).to_numpy()
+            positions = np.repeat(rows['start'].to_numpy(), lengths) + np.arange(lengths.sum()) \
+                - np.repeat(np.cumsum(lengths) - lengths, lengths)
+            hit = np.isin(self.trade_idx[positions], np.asarray(trades)).astype(np.int64)
+            counts = np.add.reduceat(hit, np.cumsum(lengths) - lengths) if len(hit) else np.zeros(0, np.int64)
+            counts = np.where(lengths > 0, counts, 0)
+        result = rows[['key', 'value']].assign(purchase_count=counts)
+        return (result[result['purchase_count'] > 0]
+                .sort_values(['purchase_count', 'key', 'value'], ascending=[False, True, True])
+                .reset_index(drop=True))
+
+
+def purchase_counts(store, key=None, index=None, **where):
+    """Purchase count per attribute value among the trades matching `where`
+
+    `where` filters trade_clean columns (e.g. category=50014815, year=2014);
+    for Parquet only the matching partitions and row groups are read.
+    """
+    index = index or PropertyIndex.load(store)
+    trades = None
+    if where:
+        filters = [(col, 'in' if isinstance(value, list) else '==', value) for col, value in where.items()]
+        trades = store.load('trade_clean', columns=['trade_idx'], filters=filters)['trade_idx'].to_numpy()
+    return index.counts(key, trades)
+
+
+# ============================================
+# Pipeline phase
+# ============================================
+def properties_phase(inputs, params):
+    print("\n[Properties] Attribute Index")
+    print("-" * 70)
+    trades = inputs['trade_clean']
+    trade_properties, property_attributes = build_index(trades['property'], trades['trade_idx'])
+    print(f"  {len(property_attributes):,} attributes over "
+          f"{property_attributes['key'].nunique():,} keys, {len(trade_properties):,} trade-attribute rows")
+    return {'trade_properties': trade_properties, 'property_attributes': property_attributes}
+
+
+def main(argv=None):
+    from analysis import DATA_OUTPUT, DATA_PROCESSED, DATA_RAW
+    from cube import parse_where
+    from storage import ArtifactStore
+
+    parser = argparse.ArgumentParser(description="Purchases per property attribute value")
+    parser.add_argument('--key', help="only this attribute key")
+    parser.add_argument('--category', type=int, help="only trades of this category")
+    parser.add_argument('--where', nargs='*', default=[], metavar='COL=VALUE',
+                        help="other trade_clean filters, e.g. year=2014")
+    parser.add_argument('--top', type=int, default=20)
+    parser.add_argument('--processed-dir', default=DATA_PROCESSED)
+    parser.add_argument('--format', choices=('parquet', 'csv'))
+    args = parser.parse_args(argv)
+
+    store = ArtifactStore(DATA_RAW, args.processed_dir, DATA_OUTPUT, fmt=args.format)
+    if not store.exists('property_attributes'):
+        raise SystemExit("No property index yet. Build it first: python src/analysis.py properties")
+    where = parse_where(args.where)
+    if args.category is not None:
+        where['category'] = args.category
+    counts = purchase_counts(store, key=args.key, **where)
+    print(counts.head(args.top).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,337 @@
+"""
+Local query service over the pipeline outputs
+Serves the processed tables over HTTP so analysts can ask for variations of
+the standard analyses without re-reading files in a notebook. Each artifact
+is loaded once and shared by every request; parameterized queries are
+answered from the sales cube (see cube.py) and their results kept in an LRU
+cache.
+
+Cache entries are keyed on the content digests the pipeline records in its
+manifest, so when a run republishes an artifact the next request reloads it
+(once, however many requests arrive together) and the results computed from
+the old version are no longer hit. Unfiltered queries return the stored
+tables unchanged; filtered ones estimate unique users from the cube's
+sketches.
+
+    python src/service.py                                  # http://127.0.0.1:8765
+    curl 'localhost:8765/monthly_sales?category=28&year=2014'
+    curl 'localhost:8765/category_stats?year=2015&gender_label=Male&top=5'
+    curl 'localhost:8765/age_group_stats?category=28,38'
+    curl 'localhost:8765/rfm_segments'
+    curl 'localhost:8765/user/user_00815'
+"""
+import argparse
+import json
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, unquote, urlsplit
+
+import pandas as pd
+
+from cube import DIMENSIONS, TIME_LEVELS, SalesCube, parse_where
+
+MANIFEST_FILE = 'pipeline_manifest.json'
+
+
+class ResultCache:
+    """Thread-safe LRU cache of query results"""
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'maxsize': self.maxsize,
+                    'hits': self.hits, 'misses': self.misses}
+
+
+class ArtifactCache:
+    """Loaded artifacts, reloaded when the pipeline republishes them
+
+    An artifact's version is the output digest recorded in the pipeline
+    manifest (re-read only when the manifest file changes), or the file's
+    modification time for artifacts the manifest does not list. Concurrent
+    requests for a stale artifact wait for a single reload.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.manifest_path = store.processed_dir / MANIFEST_FILE
+        self._manifest = (None, {})
+        self._values = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def _digests(self):
+        try:
+            mtime = self.manifest_path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return {}
+        if self._manifest[0] != mtime:
+            with open(self.manifest_path, encoding='utf-8') as f:
+                phases = json.load(f).get('phases', {})
+            digests = {name: digest for record in phases.values()
+                       for name, digest in record.get('outputs', {}).items()}
+            self._manifest = (mtime, digests)
+        return self._manifest[1]
+
+    def version(self, name):
+        digest = self._digests().get(name)
+        if digest:
+            return digest
+        path = self.store.path(name)
+        return path.stat().st_mtime_ns if path.exists() else None
+
+    def get(self, name, loader=None):
+        """(value, version) of an artifact; `loader(store)` replaces store.load"""
+        version = self.version(name)
+        if version is None:
+            raise FileNotFoundError(f"Artifact '{name}' has not been built: python src/analysis.py")
+        cached = self._values.get(name)
+        if cached and cached[1] == version:
+            return cached
+        with self._lock:
+            lock = self._locks.setdefault(name, threading.Lock())
+        with lock:
+            cached = self._values.get(name)
+            if not cached or cached[1] != version:
+                value = loader(self.store) if loader else self.store.load(name)
+                cached = self._values[name] = (value, version)
+            return cached
+
+
+# ============================================
+# Endpoints
+# ============================================
+def _records(df):
+    df = df.reset_index() if df.index.name or isinstance(df.index, pd.MultiIndex) else df
+    return json.loads(df.to_json(orient='records', date_format='iso', default_handler=str))
+
+
+def check_where(where, columns, column):
+    """`where` with its values checked against the columns they filter
+
+    `column(name)` gives the values of a column in `columns`. Unknown columns
+    and values that cannot occur in the column (a non-number for a numeric
+    column, an unknown label for a categorical one, a non-period for a
+    period) are client errors: ValueError, answered with 400.
+    """
+    checked = {}
+    for name, value in where.items():
+        if name not in columns:
+            raise ValueError(f"Unknown filter '{name}'. Available: {', '.join(columns)}")
+        values = value if isinstance(value, list) else [value]
+        dtype = column(name).dtype
+        if isinstance(dtype, pd.CategoricalDtype):
+            bad = [v for v in values if v not in dtype.categories]
+        elif isinstance(dtype, pd.PeriodDtype):
+            bad = [v for v in values if not isinstance(v, pd.Period)]
+        elif pd.api.types.is_numeric_dtype(dtype):
+            bad = [v for v in values if not _is_number(v)]
+        else:
+            bad = []
+        if bad:
+            raise ValueError(f"Invalid value(s) for '{name}': {', '.join(map(str, bad))}")
+        if pd.api.types.is_numeric_dtype(dtype):
+            values = [v if isinstance(v, int) else float(v) for v in values]
+        elif pd.api.types.is_string_dtype(dtype):
+            values = [str(v) for v in values]  # e.g. rfm_score=555, parsed as a number
+        checked[name] = values if len(values) > 1 else values[0]
+    return checked
+
+
+def _is_number(value):
+    if isinstance(value, int):
+        return True
+    try:
+        float(value)
+    except ValueError:
+        return False
+    return True
+
+
+def _cube(service):
+    from analysis import PROFILE_PARAMS
+    return service.artifact('sales_cube', lambda store: SalesCube.load(
+        store, age_labels=PROFILE_PARAMS['age_labels']))
+
+
+def _drilldown(service, dims, where):
+    cube = _cube(service)
+    return cube.drilldown(dims, **check_where(where, DIMENSIONS + list(TIME_LEVELS), cube.dimension))
+
+
+def category_stats(service, **where):
+    if not where:
+        return service.artifact('category_stats')
+    return _drilldown(service, ['category'], where).sort_values('purchase_count', ascending=False)
+
+
+def monthly_sales(service, **where):
+    if not where:
+        return service.artifact('monthly_sales')
+    return _drilldown(service, ['year_month'], where)
+
+
+def age_group_stats(service, **where):
+    if not where:
+        return service.artifact('age_group_stats')
+    return _drilldown(service, ['age_group'], where)
+
+
+def rfm_segments(service, **where):
+    rfm = service.artifact('rfm_analysis')
+    for column, value in check_where(where, list(rfm.columns), rfm.get).items():
+        rfm = rfm[rfm[column].isin(value if isinstance(value, list) else [value])]
+    stats = rfm.groupby('segment').agg(users=('user_id', 'size'), recency=('recency', 'mean'),
+                                       frequency=('frequency', 'mean'), monetary=('monetary', 'mean'))
+    stats['share'] = stats['users'] / max(len(rfm), 1)
+    return stats.sort_values('users', ascending=False).round(2)
+
+
+def user(service, user_id):
+    from lookup import USER_INDEX, UserIndex
+
+    index = service.artifact(USER_INDEX, UserIndex.load)
+    profile = index.profile(user_id)
+    if profile is None:
+        raise LookupError(f"Unknown user: {user_id}")
+    return {**profile, 'history': _records(index.trades(user_id))}
+
+
+# endpoint -> (function, artifacts its results depend on)
+ENDPOINTS = {
+    'category_stats': (category_stats, ['category_stats', 'sales_cube']),
+    'monthly_sales': (monthly_sales, ['monthly_sales', 'sales_cube']),
+    'age_group_stats': (age_group_stats, ['age_group_stats', 'sales_cube']),
+    'rfm_segments': (rfm_segments, ['rfm_analysis']),
+    'user': (user, ['user_index.cols']),
+}
+
+
+class QueryService:
+    """Endpoint dispatch with shared artifacts and an LRU result cache"""
+
+    def __init__(self, store, cache_size=256):
+        self.artifacts = ArtifactCache(store)
+        self.results = ResultCache(cache_size)
+
+    def artifact(self, name, loader=None):
+        return self.artifacts.get(name, loader)[0]
+
+    def query(self, endpoint, top=None, **params):
+        """JSON-ready result of an endpoint; cached per (params, artifact versions)
+
+        `top` keeps the first rows of a table result.
+        """
+        if endpoint not in ENDPOINTS:
+            raise KeyError(f"Unknown endpoint '{endpoint}'")
+        func, depends = ENDPOINTS[endpoint]
+        versions = tuple(self.artifacts.version(name) for name in depends)
+        key = (endpoint, top, tuple(sorted((k, str(v)) for k, v in params.items())), versions)
+        result = self.results.get(key)
+        if result is None:
+            result = func(self, **params)
+            if isinstance(result, pd.DataFrame):
+                result = _records(result.head(int(top)) if top is not None else result)
+            self.results.put(key, result)
+        return result
+
+
+class Handler(BaseHTTPRequestHandler):
+    service = None
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        parts = [unquote(p) for p in url.path.strip('/').split('/') if p]
+        if not parts:
+            return self._send(200, {'endpoints': sorted(ENDPOINTS), 'cache': self.service.results.stats()})
+        endpoint, args = parts[0], parts[1:]
+        if endpoint not in ENDPOINTS:
+            return self._send(404, {'error': f"Unknown endpoint '{endpoint}'", 'endpoints': sorted(ENDPOINTS)})
+        items = parse_qsl(url.query)
+        top = [value for key, value in items if key == 'top']
+        try:
+            # Malformed values (e.g. year_month=abc) fail here: a ValueError, answered with 400
+            params = parse_where([f"{key}={value}" for key, value in items if key != 'top'])
+            if top:
+                params['top'] = top[-1]
+            if args:
+                params['user_id'] = args[0]
+            self._send(200, self.service.query(endpoint, **params))
+        except KeyError as exc:
+            # Not a bad request: a column the code expected is missing
+            self._send(500, {'error': f"Missing column or key: {exc.args[0]}"})
+        except LookupError as exc:
+            self._send(404, {'error': str(exc)})
+        except FileNotFoundError as exc:
+            self._send(503, {'error': str(exc)})
+        except (TypeError, ValueError) as exc:
+            self._send(400, {'error': str(exc)})
+
+    def _send(self, status, body):
+        data = json.dumps(body, ensure_ascii=False, default=str).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def serve(store, host='127.0.0.1', port=8765, cache_size=256, verbose=False):
+    handler = type('ServiceHandler', (Handler,), {'service': QueryService(store, cache_size)})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.verbose = verbose
+    print(f"Serving {store.processed_dir} on http://{host}:{server.server_port} "
+          f"(endpoints: {', '.join(sorted(ENDPOINTS))})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main(argv=None):
+    from analysis import DATA_OUTPUT, DATA_PROCESSED, DATA_RAW
+    from storage import ArtifactStore, FORMATS
+
+    parser = argparse.ArgumentParser(description="HTTP query service over the processed tables")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--cache-size', type=int, default=256, help="query results kept in the LRU cache")
+    parser.add_argument('--processed-dir', default=DATA_PROCESSED)
+    parser.add_argument('--format', choices=FORMATS)
+    parser.add_argument('--verbose', action='store_true', help="log every request")
+    args = parser.parse_args(argv)
+
+    store = ArtifactStore(DATA_RAW, args.processed_dir, DATA_OUTPUT, fmt=args.format)
+    serve(store, args.host, args.port, args.cache_size, args.verbose)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+"""
+Mergeable approximate quantile sketches
+A numpy KLL sketch that can be built per chunk or per worker and merged, so
+quantile cut points (RFM score boundaries, the buy_mount outlier percentile)
+no longer need a global sort of the full column.
+"""
+import numpy as np
+import pandas as pd
+
+# Empirical constant relating k to the normalized rank error of a KLL sketch
+# with compactor shrink factor 2/3 (eps ~ 1.7 / k at high probability).
+_KLL_ERROR_CONSTANT = 1.7
+
+
+class KLLSketch:
+    """KLL quantile sketch over float values
+
+    `epsilon` is the target normalized rank error: a returned q-quantile has
+    rank within about epsilon * n of q * n. Sketches with the same epsilon can
+    be merged in any order.
+    """
+
+    def __init__(self, epsilon=0.01, seed=0):
+        self.epsilon = epsilon
+        self.k = max(8, int(np.ceil(_KLL_ERROR_CONSTANT / epsilon)))
+        self.levels = [np.empty(0)]
+        self.n = 0
+        self._rng = np.random.default_rng(seed)
+
+    def __len__(self):
+        return self.n
+
+    def _capacity(self, level):
+        depth = len(self.levels) - level - 1
+        return max(int(np.ceil(self.k * (2 / 3) ** depth)), 2)
+
+    def _compress(self):
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) > self._capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                items = np.sort(items)
+                # An odd item out stays behind; the rest are halved with a
+                # random offset and promoted with double weight
+                keep = len(items) % 2
+                promoted = items[keep + self._rng.integers(2)::2]
+                self.levels[level] = items[:keep]
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+            level += 1
+
+    def update(self, values):
+        values = np.asarray(values, dtype=float).ravel()
+        values = values[~np.isnan(values)]
+        self.n += len(values)
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+        return self
+
+    def merge(self, other):
+        if other.k != self.k:
+            raise ValueError(f"Cannot merge sketches with k={self.k} and k={other.k}")
+        for level, items in enumerate(other.levels):
+            if level == len(self.levels):
+                self.levels.append(np.empty(0))
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self.n += other.n
+        self._compress()
+        return self
+
+    def quantiles(self, qs):
+        """Approximate values at the given quantiles (0 <= q <= 1)"""
+        if self.n == 0:
+            return np.full(len(np.atleast_1d(qs)), np.nan)
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(items_h), 2.0 ** h) for h, items_h in enumerate(self.levels)])
+        order = np.argsort(items, kind='stable')
+        items, cum = items[order], np.cumsum(weights[order])
+        idx = np.searchsorted(cum, np.atleast_1d(qs) * cum[-1], side='left')
+        return items[np.clip(idx, 0, len(items) - 1)]
+
+    def size(self):
+        """Number of retained items (memory footprint)"""
+        return sum(len(items) for items in self.levels)
+
+
+def sketch_quantiles(values, qs, epsilon=0.01, chunk_size=1_000_000):
+    """Quantiles of `values` from per-chunk sketches merged together"""
+    values = np.asarray(values)
+    merged = KLLSketch(epsilon)
+    for start in range(0, len(values), chunk_size):
+        merged.merge(KLLSketch(epsilon, seed=start).update(values[start:start + chunk_size]))
+    return merged.quantiles(qs)
+
+
+def boundary_drift(values, qs, approx, sample_size=100_000, seed=0):
+    """Compare approximate cut points with exact ones on a random sample
+
+    Returns one row per quantile with the approximate boundary, the exact
+    boundary on the sample, and the rank error of the approximate boundary
+    (how far q lies outside the sample rank interval the boundary covers).
+    """
+    values = np.asarray(values, dtype=float)
+    if len(values) > sample_size:
+        values = np.random.default_rng(seed).choice(values, sample_size, replace=False)
+    values = np.sort(values)
+    qs = np.atleast_1d(qs)
+    approx = np.asarray(approx, dtype=float)
+    # With ties the boundary covers a rank interval; only a q outside it is an error
+    lo = np.searchsorted(values, approx, side='left') / len(values)
+    hi = np.searchsorted(values, approx, side='right') / len(values)
+    return pd.DataFrame({
+        'quantile': qs,
+        'approx': approx,
+        'exact_on_sample': np.quantile(values, qs),
+        'rank_error': np.where(qs < lo, lo - qs, np.where(qs > hi, hi - qs, 0.0)),
+    })
+
+
+# ============================================
+# HyperLogLog distinct counting
+# ============================================
+def hash_values(values):
+    """Stable 64-bit hashes of a column of values (ids, strings, ints)"""
+    return pd.util.hash_pandas_object(pd.Series(values), index=False).to_numpy()
+
+
+def _bit_length(x):
+    """Exact bit length of each uint64 value"""
+    x = x.copy()
+    n = np.zeros(x.shape, dtype=np.int64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        big = x >= (np.uint64(1) << np.uint64(shift))
+        n += big * shift
+        x[big] >>= np.uint64(shift)
+    return n + (x > 0)
+
+
+def _register_updates(hashes, p):
+    """Register index and rank (leading zeros + 1) of each hash"""
+    idx = (hashes >> np.uint64(64 - p)).astype(np.int64)
+    rest = hashes & np.uint64((1 << (64 - p)) - 1)
+    rank = (64 - p) - _bit_length(rest) + 1
+    return idx, rank.astype(np.uint8)
+
+
+def _estimate(registers):
+    """HLL cardinality estimates for a (groups, m) register matrix"""
+    m = registers.shape[-1]
+    alpha = {16: 0.673, 32: 0.697, 64: 0.709}.get(m, 0.7213 / (1 + 1.079 / m))
+    raw = alpha * m * m / np.power(2.0, -registers.astype(float)).sum(axis=-1)
+    zeros = (registers == 0).sum(axis=-1)
+    # Linear counting for the small range
+    small = (raw <= 2.5 * m) & (zeros > 0)
+    with np.errstate(divide='ignore'):
+        linear = m * np.log(m / np.maximum(zeros, 1))
+    return np.where(small, linear, raw)
+
+
+class GroupedHLL:
+    """One HyperLogLog sketch per group, mergeable across chunks and workers
+
+    Precision `p` gives 2**p one-byte registers per group and a relative
+    standard error of about 1.04 / sqrt(2**p) (p=14: ~0.8%, 16 KB per group).
+    Sketches of the same precision merge by register-wise max, which also
+    gives rollups such as quarterly uniques from monthly sketches.
+    """
+
+    def __init__(self, p=14):
+        if not 4 <= p <= 18:
+            raise ValueError(f"HLL precision must be between 4 and 18, got {p}")
+        self.p = p
+        self.m = 1 << p
+        self.groups = pd.Index([])
+        self.registers = np.zeros((0, self.m), dtype=np.uint8)
+
+    def _ensure_groups(self, groups):
+        new = pd.Index(groups).unique().difference(self.groups, sort=False)
+        if len(new):
+            self.groups = self.groups.append(new)
+            self.registers = np.vstack([self.registers, np.zeros((len(new), self.m), dtype=np.uint8)])
+
+    def update(self, keys, values):
+        """Add `values` (e.g. user ids) to the sketch of their group in `keys`"""
+        keys = pd.Series(np.asarray(keys))
+        # Encoded (categorical) values are hashed once per category, not per row
+        values = pd.Series(values).reset_index(drop=True)
+        valid = keys.notna().to_numpy() & values.notna().to_numpy()
+        keys, values = keys[valid], values[valid]
+        if not len(keys):
+            return self
+        self._ensure_groups(keys)
+        idx, rank = _register_updates(hash_values(values), self.p)
+        flat = self.groups.get_indexer(keys) * self.m + idx
+        best = pd.Series(rank).groupby(flat).max()
+        registers = self.registers.reshape(-1)
+        positions = best.index.to_numpy()
+        registers[positions] = np.maximum(registers[positions], best.to_numpy())
+        return self
+
+    def merge(self, other):
+        if other.p != self.p:
+            raise ValueError(f"Cannot merge HLL sketches with p={self.p} and p={other.p}")
+        self._ensure_groups(other.groups)
+        rows = self.groups.get_indexer(other.groups)
+        self.registers[rows] = np.maximum(self.registers[rows], other.registers)
+        return self
+
+    def counts(self):
+        """Estimated distinct values per group, sorted by group"""
+        counts = pd.Series(np.round(_estimate(self.registers)).astype('int64'), index=self.groups)
+        return counts.sort_index()
+
+    def rollup(self, mapping):
+        """Union of groups into coarser groups; `mapping` maps group -> new group
+
+        `mapping` may be a dict, a Series or a function (e.g. month -> quarter).
+        """
+        target = self.groups.map(mapping)
+        rolled = GroupedHLL(self.p)
+        rolled.groups = pd.Index(target.unique())
+        codes = rolled.groups.get_indexer(target)
+        rolled.registers = np.zeros((len(rolled.groups), self.m), dtype=np.uint8)
+        np.maximum.at(rolled.registers, codes, self.registers)
+        return rolled
+
+    def rolling(self, window):
+        """Distinct values over a sliding window of `window` consecutive groups"""
+        order = np.argsort(self.groups)
+        groups, registers = self.groups[order], self.registers[order]
+        estimates = [_estimate(registers[max(0, i - window + 1):i + 1].max(axis=0))
+                     for i in range(len(groups))]
+        return pd.Series(np.round(estimates).astype('int64'), index=groups)
+
+    def to_frame(self, name='group'):
+        """Serialize as one row per group with base64-encoded registers"""
+        import base64
+        return pd.DataFrame({
+            name: self.groups,
+            'precision': self.p,
+            'registers': [base64.b64encode(row.tobytes()).decode('ascii') for row in self.registers],
+        })
+
+    @classmethod
+    def from_frame(cls, frame, name='group'):
+        import base64
+        frame = frame.reset_index() if name not in frame else frame
+        sketch = cls(int(frame['precision'].iloc[0]) if len(frame) else 14)
+        sketch.groups = pd.Index(frame[name])
+        sketch.registers = np.array(
+            [np.frombuffer(base64.b64decode(row), dtype=np.uint8) for row in frame['registers']],
+            dtype=np.uint8).reshape(len(frame), sketch.m)
+        return sketch
+
+
+def hll_count(values, p=14):
+    """Estimated number of distinct values in a single column"""
+    return int(GroupedHLL(p).update(np.zeros(len(values), dtype=np.int64), values).counts().iloc[0])
@@ -0,0 +1,395 @@
+"""
+Artifact storage for the analysis pipeline
+Reads and writes processed tables, JSON summaries and figures with typed schemas
+
+Tables are stored as Parquet (partitioned by `year` for the trade-level
+tables) so dtypes survive the round-trip and readers can project columns and
+push filters down to the files. CSV remains available as a fallback format
+when pyarrow is not installed. Column sets ('<name>.cols') are directories of
+plain .npy arrays, memory-mapped on load for point lookups. Dictionaries
+('<name>.dict') are directories of one single-column table per column.
+"""
+import importlib.util
+import json
+import shutil
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from encoding import DICTIONARY_FILE, ENCODED_COLUMNS, decode, encode
+
+# Typed schemas for the processed tables.
+#   dates        datetime64 columns
+#   periods      monthly Period columns (stored as month-start dates)
+#   index        column that becomes the frame index on load
+#   partition_by Parquet partition column and its dtype
+#   categories   id columns kept dictionary-encoded (see encoding.py); ids in
+#                any other table are decoded to their original values on write
+TABLES = {
+    'baby_clean': {'dates': ['birthday'], 'categories': ['user_id']},
+    'trade_clean': {'dates': ['day'], 'periods': ['year_month'],
+                    'partition_by': ('year', 'int32'),
+                    'categories': ['user_id', 'auction_id', 'property']},
+    'merged_data': {'dates': ['day', 'birthday'], 'periods': ['year_month'],
+                    'partition_by': ('year', 'int32'),
+                    'categories': ['user_id', 'auction_id', 'property']},
+    'rfm_analysis': {},
+    'rfm_metrics': {},
+    'rfm_boundaries': {},
+    'rfm_state': {'dates': ['last_day'], 'index': 'user_id'},
+    'rfm_latest': {},
+    'rfm_segment_changes': {},
+    'age_group_stats': {'index': 'age_group'},
+    'category_stats': {'index': 'category'},
+    'top_products': {'index': 'auction_id'},
+    'monthly_sales': {'periods': ['year_month']},
+    'yearly_stats': {'index': 'year'},
+    'monthly_user_sketches': {'periods': ['year_month']},
+    'daily_sales': {'dates': ['day']},
+    'daily_user_state': {'dates': ['last_day'], 'index': 'user_id'},
+    'daily_sales_latest': {'dates': ['day']},
+    'daily_user_state_latest': {'dates': ['last_day'], 'index': 'user_id'},
+    'sales_cube': {'periods': ['year_month']},
+    'lifecycle_index': {'categories': ['user_id']},
+    'lifecycle_stages': {},
+    'cohort_retention': {'periods': ['cohort']},
+    'repurchase_intervals': {},
+    'quarantine': {},
+    'category_rules': {},
+    'product_rules': {},
+    'cat_hierarchy': {'index': 'cat'},
+    'category_rollup': {'index': 'category'},
+    'subcategory_stats': {},
+    'top_subcategories': {},
+    'trade_properties': {},
+    'property_attributes': {},
+}
+
+RAW_PREFIX = 'raw:'
+FORMATS = ('parquet', 'csv')
+_OPS = {
+    '==': lambda s, v: s == v, '=': lambda s, v: s == v, '!=': lambda s, v: s != v,
+    '<': lambda s, v: s < v, '<=': lambda s, v: s <= v,
+    '>': lambda s, v: s > v, '>=': lambda s, v: s >= v,
+    'in': lambda s, v: s.isin(v), 'not in': lambda s, v: ~s.isin(v),
+}
+
+
+def has_pyarrow():
+    return importlib.util.find_spec('pyarrow') is not None
+
+
+def default_format():
+    return 'parquet' if has_pyarrow() else 'csv'
+
+
+def _arrow():
+    """pyarrow and pyarrow.parquet, imported on the first Parquet read or write"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    return pa, pq
+
+
+def _restore(df, schema):
+    """Apply the schema's dtypes to a freshly read frame"""
+    for col in schema.get('dates', []):
+        if col in df:
+            df[col] = pd.to_datetime(df[col])
+    for col in schema.get('periods', []):
+        if col in df:
+            df[col] = pd.to_datetime(df[col]).dt.to_period('M')
+    if 'partition_by' in schema:
+        col, dtype = schema['partition_by']
+        if col in df:
+            df[col] = df[col].astype(dtype)
+    return df
+
+
+def _filter_frame(df, filters):
+    """Evaluate DNF-style filters ([(col, op, value), ...]) on an in-memory frame"""
+    if not filters:
+        return df
+    groups = filters if isinstance(filters[0], list) else [filters]
+    mask = pd.Series(False, index=df.index)
+    for group in groups:
+        group_mask = pd.Series(True, index=df.index)
+        for col, op, value in group:
+            group_mask &= _OPS[op](df[col], value)
+        mask |= group_mask
+    return df[mask]
+
+
+def _filter_values(filters, schema):
+    """Convert Period filter values to the month-start dates stored on disk"""
+    periods = set(schema.get('periods', []))
+
+    def convert(value):
+        if isinstance(value, pd.Period):
+            return value.to_timestamp()
+        if isinstance(value, (list, tuple, set)):
+            return [convert(v) for v in value]
+        return value
+
+    groups = filters if isinstance(filters[0], list) else [filters]
+    return [[(col, op, convert(value) if col in periods else value) for col, op, value in group]
+            for group in groups]
+
+
+def read_table(path, schema=None, columns=None, filters=None):
+    """Read a processed table and restore the dtypes declared in its schema
+
+    `columns` projects a subset of columns and `filters` (pyarrow DNF syntax,
+    e.g. [('year', '>=', 2014), ('category', '==', 28)]) selects rows. For
+    Parquet both are pushed down to the files, so whole partitions and row
+    groups are skipped; for CSV they are applied after parsing.
+    """
+    schema = schema or {}
+    path = Path(path)
+    read_columns = None
+    if columns is not None:
+        read_columns = list(columns)
+        if schema.get('index') and schema['index'] not in read_columns:
+            read_columns.append(schema['index'])
+        groups = (filters if isinstance(filters[0], list) else [filters]) if filters else []
+        for col in dict.fromkeys(col for group in groups for col, _, _ in group):
+            if col not in read_columns:
+                read_columns.append(col)
+
+    if path.suffix == '.csv':
+        df = _filter_frame(_restore(pd.read_csv(path, usecols=read_columns), schema), filters)
+        df = df.reset_index(drop=True)
+    else:
+        _, pq = _arrow()
+        table = pq.read_table(path, columns=read_columns,
+                              filters=_filter_values(filters, schema) if filters else None,
+                              partitioning='hive')
+        df = _restore(table.to_pandas(), schema)
+        # Partition columns come back last; restore the written column order
+        order = [c['name'] for c in (table.schema.pandas_metadata or {}).get('columns', [])]
+        df = df[[c for c in order if c in df] + [c for c in df if c not in order]]
+
+    if columns is not None:
+        df = df[[c for c in read_columns if c in columns or c == schema.get('index')]]
+    if schema.get('index'):
+        df = df.set_index(schema['index'])
+    return df
+
+
+def raw_path(path):
+    """A raw input file, or the directory of its shards ('<stem>/part-*') when
+    only the sharded form exists (see generate_sample_data.py)"""
+    path = Path(path)
+    shards = path.with_suffix('')
+    return shards if not path.exists() and shards.is_dir() else path
+
+
+def _raw_frames(path, chunksize=None):
+    """Frames of one raw file; Parquet categoricals come back as plain values, as from CSV"""
+    if path.suffix != '.parquet':
+        yield from (pd.read_csv(path, chunksize=chunksize) if chunksize else [pd.read_csv(path)])
+        return
+    _, pq = _arrow()
+    batches = pq.ParquetFile(path).iter_batches(batch_size=chunksize) if chunksize else [pq.read_table(path)]
+    for batch in batches:
+        df = batch.to_pandas()
+        for col in df.select_dtypes('category'):
+            df[col] = df[col].astype(df[col].cat.categories.dtype)
+        yield df
+
+
+def read_raw(path, chunksize=None):
+    """Read a raw input table: one CSV file, or a directory of CSV or Parquet shards
+
+    With `chunksize`, returns an iterator of frames of at most that many rows.
+    Row labels count from the start of the table across shards, as they do
+    for a single file.
+    """
+    path = Path(path)
+    files = sorted(p for p in path.glob('part-*') if p.suffix in ('.csv', '.parquet')) if path.is_dir() else [path]
+    if not files:
+        raise FileNotFoundError(f"No part-*.csv or part-*.parquet shards in {path}")
+
+    def frames():
+        offset = 0
+        for f in files:
+            for df in _raw_frames(f, chunksize):
+                df.index = pd.RangeIndex(offset, offset + len(df))
+                offset += len(df)
+                yield df
+
+    if chunksize:
+        return frames()
+    return pd.concat(frames()) if len(files) > 1 else next(frames())
+
+
+def write_table(df, path, schema=None):
+    """Write a table as CSV or Parquet (chosen by the path suffix)"""
+    schema = schema or {}
+    path = Path(path)
+    if 'index' in schema:
+        df = df.reset_index()
+    encoded = set(schema.get('categories', []))
+    df = decode(df, [col for col in ENCODED_COLUMNS if col not in encoded])
+    if path.suffix == '.csv':
+        df.to_csv(path, index=False)
+        return
+
+    pa, pq = _arrow()
+    df = df.copy()
+    for col in schema.get('periods', []):
+        df[col] = df[col].dt.to_timestamp()
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    if path.exists():
+        shutil.rmtree(path) if path.is_dir() else path.unlink()
+    if 'partition_by' in schema:
+        # Deterministic file names keep the content digest stable across runs
+        pq.write_to_dataset(table, path, partition_cols=[schema['partition_by'][0]],
+                            basename_template='part-{i}.parquet')
+    else:
+        pq.write_table(table, path)
+
+
+def write_columns(columns, path):
+    """Write a dict of numpy arrays as '<column>.npy' files in the directory `path`
+
+    The arrays go to a sibling directory first, which then replaces `path`,
+    so readers never see a half-written set. Readers that still map the old
+    files keep their (unlinked) copies until they close them.
+    """
+    with _replacing(path) as tmp:
+        for name, values in columns.items():
+            np.save(tmp / f"{name}.npy", np.asarray(values), allow_pickle=False)
+
+
+def write_dictionary(dictionary, path, fmt):
+    """Write a dictionary (column -> categories) as one '<column>.<fmt>' table per
+    column in the directory `path`, swapped in like write_columns"""
+    with _replacing(path) as tmp:
+        for col, categories in dictionary.items():
+            write_table(categories.to_frame(index=False, name=col), tmp / f"{col}.{fmt}")
+
+
+@contextmanager
+def _replacing(path):
+    """A fresh sibling directory to fill, which then replaces the directory `path`"""
+    path = Path(path)
+    tmp = path.with_name(path.name + '.tmp')
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    yield tmp
+    if path.exists():
+        old = path.with_name(path.name + '.old')
+        shutil.rmtree(old, ignore_errors=True)
+        path.rename(old)
+        tmp.rename(path)
+        shutil.rmtree(old)
+    else:
+        tmp.rename(path)
+
+
+def read_columns(path, columns=None):
+    """Memory-map the arrays of a column set; nothing is read until it is indexed"""
+    path = Path(path)
+    names = columns or sorted(f.stem for f in path.glob('*.npy'))
+    return {name: np.load(path / f"{name}.npy", mmap_mode='r') for name in names}
+
+
+class ArtifactStore:
+    """Maps artifact names to files and handles their (de)serialization
+
+    Naming conventions:
+      - 'raw:<file>'  raw input file under raw_dir, or its '<stem>/' shard
+                      directory (loaded as a Path; read it with read_raw)
+      - '<name>.png'  figure under output_dir
+      - '<name>.json' JSON document under processed_dir
+      - '<name>.cols' dict of numpy arrays, a directory of .npy files under
+                      processed_dir, memory-mapped on load
+      - '<name>.dict' id dictionary (column -> categories), a directory of
+                      one '<column>.<fmt>' table per column under
+                      processed_dir, read per column on first use
+      - '<name>'      table declared in TABLES, stored under processed_dir
+                      as '<name>.parquet' (or '<name>.csv' with fmt='csv')
+    """
+
+    def __init__(self, raw_dir, processed_dir, output_dir, fmt=None):
+        self.raw_dir = Path(raw_dir)
+        self.processed_dir = Path(processed_dir)
+        self.output_dir = Path(output_dir)
+        self.fmt = fmt or default_format()
+        if self.fmt not in FORMATS:
+            raise ValueError(f"Unknown table format '{self.fmt}'. Choose from: {', '.join(FORMATS)}")
+        if self.fmt == 'parquet' and not has_pyarrow():
+            raise ImportError("Parquet storage requires pyarrow: pip install pyarrow")
+        self._dictionary = {}
+
+    def path(self, name):
+        if name.startswith(RAW_PREFIX):
+            return raw_path(self.raw_dir / name[len(RAW_PREFIX):])
+        if name.endswith('.png'):
+            return self.output_dir / name
+        if name.endswith(('.json', '.cols', '.dict')):
+            return self.processed_dir / name
+        return self.processed_dir / f"{name}.{self.fmt}"
+
+    def exists(self, name):
+        return self.path(name).exists()
+
+    def load(self, name, columns=None, filters=None):
+        """Load an artifact; tables accept column projection and row filters"""
+        path = self.path(name)
+        if name.startswith(RAW_PREFIX) or name.endswith('.png'):
+            return path
+        if name.endswith('.json'):
+            with open(path, encoding='utf-8') as f:
+                return json.load(f)
+        if name.endswith('.cols'):
+            return read_columns(path, columns)
+        if name.endswith('.dict'):
+            return self.dictionary(columns, name)
+        schema = TABLES.get(name) or {}
+        df = read_table(path, schema, columns=columns, filters=filters)
+        if schema.get('categories'):
+            df = encode(df, self.dictionary([col for col in schema['categories'] if col in df]))
+        return df
+
+    def dictionary(self, columns=None, name=DICTIONARY_FILE):
+        """Persisted id dictionary (column -> categories) of `columns` (default: all)
+
+        Each column is read on first use and re-read when its file changes;
+        columns that are not asked for are never read.
+        """
+        path = self.path(name)
+        if columns is None:
+            columns = sorted(f.stem for f in path.glob(f"*.{self.fmt}"))
+        dictionary = {}
+        for col in columns:
+            file = path / f"{col}.{self.fmt}"
+            try:
+                mtime = file.stat().st_mtime_ns
+            except FileNotFoundError:
+                continue
+            cached = self._dictionary.get((name, col))
+            if cached is None or cached[0] != mtime:
+                cached = self._dictionary[(name, col)] = (mtime, pd.Index(read_table(file)[col], name=None))
+            dictionary[col] = cached[1]
+        return dictionary
+
+    def save(self, name, value):
+        path = self.path(name)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if name.endswith('.png'):
+            import matplotlib.pyplot as plt
+            value.savefig(path, dpi=150, bbox_inches='tight')
+            plt.close(value)
+        elif name.endswith('.json'):
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(value, f, indent=2, ensure_ascii=False, default=str)
+        elif name.endswith('.cols'):
+            write_columns(value, path)
+        elif name.endswith('.dict'):
+            write_dictionary(value, path, self.fmt)
+        else:
+            write_table(value, path, TABLES.get(name))
+        return path
@@ -0,0 +1,206 @@
+"""
+Streaming ingestion for the trade history
+Reads the trade history (a CSV file or a directory of shards) in chunks, joins each chunk against the (small, resident)
+baby table and feeds incremental aggregators, so peak memory is bounded by the
+chunk size and the number of distinct groups rather than by the file size.
+"""
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+from analysis import BABY_RAW, TRADE_RAW, clean_baby, clean_trades, merge_baby
+from instrument import span
+from sketches import GroupedHLL, KLLSketch
+from storage import read_raw
+from validation import validate_baby, validate_trades
+
+
+def iter_trade_chunks(trade_path, baby_df, params):
+    """Yield (raw buy_mount values, cleaned and merged chunk, quarantined rows)
+
+    Row numbers in the quarantine count from the start of the table.
+    """
+    for chunk in read_raw(trade_path, chunksize=params['chunksize']):
+        chunk, quarantine = validate_trades(chunk, params, users=baby_df['user_id'])
+        chunk = clean_trades(chunk)
+        raw_mount = chunk['buy_mount'].to_numpy()
+        chunk = chunk[chunk['buy_mount'] <= params['max_buy_mount']]
+        yield raw_mount, merge_baby(chunk, baby_df), quarantine
+
+
+def histogram_quantile(counts, q):
+    """Exact quantile (linear interpolation, as Series.quantile) from value counts"""
+    counts = counts.sort_index()
+    n = counts.sum()
+    cum = counts.cumsum().to_numpy()
+    values = counts.index.to_numpy()
+    pos = q * (n - 1)
+    lo, hi = int(np.floor(pos)), int(np.ceil(pos))
+    v_lo = values[np.searchsorted(cum, lo, side='right')]
+    v_hi = values[np.searchsorted(cum, hi, side='right')]
+    return v_lo + (v_hi - v_lo) * (pos - lo)
+
+
+class GroupAccumulator:
+    """Incremental count / sum of buy_mount and distinct users per key
+
+    Exact distinct users are tracked as the set of unique (key, user_id)
+    pairs, so memory grows with the number of pairs, not with the number of
+    trades. With a HyperLogLog `precision`, a fixed-size sketch per key is
+    kept instead.
+    """
+
+    def __init__(self, key, precision=None):
+        self.key = key
+        self.totals = None
+        self.pairs = None
+        self.sketch = GroupedHLL(precision) if precision is not None else None
+
+    def update(self, chunk, keys=None):
+        keys = chunk[self.key] if keys is None else keys
+        grouped = chunk.groupby(keys, observed=False)['buy_mount']
+        part = pd.DataFrame({'purchase_count': grouped.count(), 'total_quantity': grouped.sum()})
+        self.totals = part if self.totals is None else self.totals.add(part, fill_value=0)
+
+        if self.sketch is not None:
+            self.sketch.update(keys.to_numpy(), chunk['user_id'].to_numpy())
+            return
+        pairs = pd.DataFrame({self.key: keys.to_numpy(), 'user_id': chunk['user_id'].to_numpy()})
+        pairs = pairs.drop_duplicates()
+        if self.pairs is not None:
+            pairs = pd.concat([self.pairs, pairs], ignore_index=True).drop_duplicates()
+        self.pairs = pairs
+
+    def result(self):
+        stats = self.totals.astype('int64')
+        if self.sketch is not None:
+            stats['unique_users'] = self.sketch.counts()
+        else:
+            stats['unique_users'] = self.pairs.dropna().groupby(self.key, observed=False)['user_id'].nunique()
+        stats['unique_users'] = stats['unique_users'].fillna(0).astype('int64')
+        stats.index.name = self.key
+        return stats.sort_index()
+
+
+class RFMAccumulator:
+    """Per-user last purchase day, purchase count and quantity sum"""
+
+    def __init__(self):
+        self.state = None
+
+    def update(self, chunk):
+        part = chunk.groupby('user_id', observed=True).agg(last_day=('day', 'max'),
+                                                           frequency=('auction_id', 'count'),
+                                                           monetary=('buy_mount', 'sum'))
+        if self.state is not None:
+            part = pd.concat([self.state, part]).groupby(level=0, observed=True).agg(
+                {'last_day': 'max', 'frequency': 'sum', 'monetary': 'sum'})
+        self.state = part
+
+    def result(self):
+        reference_date = self.state['last_day'].max() + timedelta(days=1)
+        print(f"\nReference date: {reference_date.date()}")
+        rfm = pd.DataFrame({
+            'user_id': self.state.index,
+            'recency': (reference_date - self.state['last_day']).dt.days.to_numpy(),
+            'frequency': self.state['frequency'].to_numpy(),
+            'monetary': self.state['monetary'].to_numpy(),
+        })
+        return rfm.sort_values('user_id', ignore_index=True)
+
+
+def stream_aggregate(inputs, params):
+    print("\n[Streaming] Chunked Loading, Cleaning & Aggregation")
+    print("-" * 70)
+
+    baby_df, baby_bad = validate_baby(read_raw(inputs[BABY_RAW]), params)
+    baby_df = clean_baby(baby_df)
+    quarantine = [baby_bad]
+    print(f"  Baby info: {len(baby_df):,} records (resident)")
+
+    precision = params['hll_precision'] if params['distinct'] == 'hll' else None
+    age_groups = GroupAccumulator('age_group', precision)
+    categories = GroupAccumulator('category', precision)
+    months = GroupAccumulator('year_month', precision)
+    years = GroupAccumulator('year', precision)
+    rfm = RFMAccumulator()
+    mount_counts = pd.Series(dtype='int64')
+    use_sketch = params['quantiles'] == 'sketch'
+    mount_sketch = KLLSketch(params['sketch_epsilon'])
+    n_chunks = total_quantity = total_transactions = 0
+    date_min = date_max = None
+
+    for raw_mount, chunk, bad in iter_trade_chunks(inputs[TRADE_RAW], baby_df, params):
+        n_chunks += 1
+        quarantine.append(bad)
+        with span('chunk', index=n_chunks) as s:
+            s.count('rows_in', len(raw_mount))
+            s.count('quarantined', len(bad))
+            s.count('rows_out', len(chunk))
+            s.count('dropped_outliers', len(raw_mount) - len(chunk))
+            values, counts = np.unique(raw_mount, return_counts=True)
+            mount_counts = mount_counts.add(pd.Series(counts, index=values), fill_value=0)
+            if use_sketch:
+                mount_sketch.merge(KLLSketch(params['sketch_epsilon'], seed=n_chunks).update(raw_mount))
+            if chunk.empty:
+                continue
+
+            age_group = pd.cut(chunk['baby_age_months'], bins=params['age_bins'],
+                               labels=params['age_labels'], right=False)
+            age_groups.update(chunk, keys=age_group.rename('age_group'))
+            categories.update(chunk)
+            months.update(chunk)
+            years.update(chunk)
+            rfm.update(chunk)
+
+            total_transactions += len(chunk)
+            total_quantity += int(chunk['buy_mount'].sum())
+            lo, hi = chunk['day'].min(), chunk['day'].max()
+            date_min = lo if date_min is None else min(date_min, lo)
+            date_max = hi if date_max is None else max(date_max, hi)
+            print(f"  Chunk {n_chunks}: {len(raw_mount):,} rows read, {total_transactions:,} kept so far")
+
+    quarantined = sum(len(bad) for bad in quarantine)
+    if quarantined:
+        print(f"  Quarantined: {quarantined:,} invalid records")
+
+    # Outliers, from the exact value histogram of the raw buy_mount column,
+    # or from the merged per-chunk sketches
+    q99 = histogram_quantile(mount_counts, params['outlier_quantile'])
+    if use_sketch:
+        exact = q99
+        q99 = mount_sketch.quantiles([params['outlier_quantile']])[0]
+        print(f"  Sketch drift at q={params['outlier_quantile']}: approx {q99} vs exact {exact}")
+    outlier_count = int(mount_counts[mount_counts.index > q99].sum())
+    print(f"  99th percentile: {q99}")
+    print(f"  Outliers (>99th percentile): {outlier_count} records")
+
+    age_group_stats = age_groups.result()
+    age_group_stats.insert(2, 'avg_quantity',
+                           age_group_stats['total_quantity'] / age_group_stats['purchase_count'])
+    age_group_stats = age_group_stats.round(2)
+
+    category_stats = categories.result().sort_values('purchase_count', ascending=False)
+    monthly_sales = months.result().reset_index()
+    yearly_stats = years.result()
+
+    overview = {
+        'total_users': int(baby_df['user_id'].nunique()),
+        'total_transactions': int(total_transactions),
+        'total_quantity': int(total_quantity),
+        'avg_quantity': total_quantity / total_transactions,
+        'date_min': str(date_min.date()),
+        'date_max': str(date_max.date()),
+        'outlier_threshold': float(q99),
+        'outlier_count': outlier_count,
+    }
+    return {
+        'overview.json': overview,
+        'age_group_stats': age_group_stats,
+        'category_stats': category_stats,
+        'monthly_sales': monthly_sales,
+        'yearly_stats': yearly_stats,
+        'rfm_metrics': rfm.result(),
+        'quarantine': pd.concat(quarantine, ignore_index=True),
+    }
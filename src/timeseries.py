@@ -0,0 +1,259 @@
+"""
+Daily time series with rolling 7/30/90-day metrics
+The `timeseries` phase lays the trades out on a dense daily axis: day offsets
+from the first trade index plain arrays, so daily purchase counts and
+quantities are two bincounts, and every trailing window is the difference of
+one cumulative sum at two offsets.
+
+Active users over a trailing window are exact, not estimated. With the trades
+sorted by (user, day) (see cohorts.sort_trades), a user is active in the
+window ending on day d when their last purchase up to d is less than `window`
+days old. Each distinct purchase day p therefore counts on the days
+[p, min(next purchase day, p + window)), which is a +1/-1 pair in a difference
+array; its cumulative sum is the active-user series.
+
+  - daily_sales       one row per calendar day: purchase_count,
+                      total_quantity, active_users and their trailing
+                      7/30/90-day versions (e.g. active_users_30d)
+  - daily_user_state  each user's last purchase day, so new days can be
+                      appended without rescanning the history
+
+`append` never rewrites those two pipeline outputs (the next pipeline run
+would see a foreign digest and rebuild them, dropping the appended days). It
+writes daily_sales_latest / daily_user_state_latest and logs the applied
+delta files against the daily_sales they extend; once the pipeline rebuilds
+daily_sales, appends start again from the new table.
+
+    python src/timeseries.py                        # last 30 days with the rolling metrics
+    python src/timeseries.py --rollup month         # monthly view derived from the daily arrays
+    python src/timeseries.py append delta.csv       # append the days of a delta file
+"""
+import argparse
+import json
+
+import numpy as np
+import pandas as pd
+
+from cohorts import sort_trades, user_starts
+
+TIMESERIES_PARAMS = {'windows': [7, 30, 90]}
+APPEND_LOG = 'daily_append_log.json'
+ROLLUPS = {'week': 'W', 'month': 'M', 'quarter': 'Q', 'year': 'Y'}
+
+
+def rolling_sum(values, window):
+    """Trailing sums over `window` entries, from one cumulative sum"""
+    cumsum = np.concatenate([[0], np.cumsum(values)])
+    ends = np.arange(1, len(values) + 1)
+    return cumsum[ends] - cumsum[np.maximum(ends - window, 0)]
+
+
+def active_users(users, days, n_days, window):
+    """Distinct users with a purchase in the trailing `window` days, per day
+
+    `users` and `days` (day offsets) must be sorted by (user, day); window=1
+    gives the daily active users.
+    """
+    distinct = np.r_[True, (users[1:] != users[:-1]) | (days[1:] != days[:-1])] if len(users) else []
+    users, days = users[distinct], days[distinct]
+    next_day = np.r_[days[1:], n_days].astype(np.int64)
+    next_day[user_starts(users)[1:] - 1] = n_days  # a user's last purchase day has no successor
+    ends = np.minimum(np.minimum(next_day, days + window), n_days)
+    delta = np.bincount(days, minlength=n_days + 1) - np.bincount(ends, minlength=n_days + 1)
+    return np.cumsum(delta)[:n_days]
+
+
+def add_rolling(daily, windows, active=None):
+    """Trailing-window columns for the daily counts; `active` maps window -> active users"""
+    for window in windows:
+        for col in ['purchase_count', 'total_quantity']:
+            daily[f'{col}_{window}d'] = rolling_sum(daily[col].to_numpy(), window)
+        if active is not None:
+            daily[f'active_users_{window}d'] = active[window]
+    return daily
+
+
+def build_daily(trades, windows):
+    """(daily_sales, daily_user_state) from cleaned trades"""
+    users = trades['user_id']
+    codes = users.cat.codes.to_numpy() if isinstance(users.dtype, pd.CategoricalDtype) \
+        else pd.factorize(users)[0]
+    day_numbers = trades['day'].to_numpy().astype('datetime64[D]').astype(np.int64)
+    first = day_numbers.min()
+    offsets = day_numbers - first
+    n_days = int(offsets.max()) + 1
+
+    daily = pd.DataFrame({
+        'day': (np.arange(n_days) + first).astype('datetime64[D]').astype('datetime64[ns]'),
+        'purchase_count': np.bincount(offsets, minlength=n_days),
+        'total_quantity': np.bincount(offsets, weights=trades['buy_mount'].to_numpy(),
+                                      minlength=n_days).astype(np.int64),
+    })
+    order, users_sorted, days_sorted = sort_trades(codes, offsets)
+    active = {window: active_users(users_sorted, days_sorted, n_days, window) for window in [1, *windows]}
+    daily['active_users'] = active[1]
+    daily = add_rolling(daily, windows, active)
+
+    # Last purchase day per user: the last entry of each user in the sorted order
+    last = np.r_[user_starts(users_sorted)[1:], len(users_sorted)] - 1
+    state = pd.DataFrame({
+        'user_id': users.iloc[order[last]].to_numpy(),
+        'last_day': (days_sorted[last] + first).astype('datetime64[D]').astype('datetime64[ns]'),
+    }).set_index('user_id')
+    return daily, state
+
+
+def append_days(daily, state, trades, windows):
+    """Extend the daily series with trades on days after its last day
+
+    Only the new rows are computed: the rolling sums from the last
+    max(windows) days plus the new ones, and the active users from each
+    user's last purchase day in `state`. Days without trades in between are
+    filled with zeros. Returns (daily, state).
+    """
+    last_day = daily['day'].iloc[-1]
+    if (trades['day'] <= last_day).any():
+        raise ValueError(f"Trades on or before {last_day.date()}, the last day already in the series")
+    start = daily['day'].iloc[0].to_datetime64().astype('datetime64[D]').astype(np.int64)
+    offsets = trades['day'].to_numpy().astype('datetime64[D]').astype(np.int64) - start
+    first_new, n_days = len(daily), int(offsets.max()) + 1
+
+    new = pd.DataFrame({
+        'day': (np.arange(first_new, n_days) + start).astype('datetime64[D]').astype('datetime64[ns]'),
+        'purchase_count': np.bincount(offsets - first_new, minlength=n_days - first_new),
+        'total_quantity': np.bincount(offsets - first_new, weights=trades['buy_mount'].to_numpy(),
+                                      minlength=n_days - first_new).astype(np.int64),
+    })
+
+    # Active users: move each buyer's last purchase day forward, day by day
+    last = state['last_day'].to_numpy().astype('datetime64[D]').astype(np.int64) - start
+    users = pd.Index(state.index)
+    buyers = trades.assign(offset=offsets).groupby('offset')['user_id'].unique()
+    active = {window: np.zeros(len(new), dtype=np.int64) for window in [1, *windows]}
+    for i, day in enumerate(range(first_new, n_days)):
+        if day in buyers.index:
+            known = users.get_indexer(buyers[day])
+            fresh = pd.Index(buyers[day][known < 0])
+            if len(fresh):
+                users = users.append(fresh)
+                last = np.concatenate([last, np.full(len(fresh), day, dtype=np.int64)])
+            last[users.get_indexer(buyers[day])] = day
+        for window in active:
+            active[window][i] = np.count_nonzero(last > day - window)
+
+    # Rolling sums: the windows ending on the new days reach back at most
+    # max(windows) - 1 existing days
+    counts = ['purchase_count', 'total_quantity']
+    history = daily[counts].iloc[max(len(daily) - max(windows) + 1, 0):]
+    combined = add_rolling(pd.concat([history, new[counts]], ignore_index=True), windows)
+    new['active_users'] = active[1]
+    for window in windows:
+        for col in counts:
+            new[f'{col}_{window}d'] = combined[f'{col}_{window}d'].to_numpy()[-len(new):]
+        new[f'active_users_{window}d'] = active[window]
+    new = new[daily.columns]
+
+    state = pd.DataFrame({'last_day': (last + start).astype('datetime64[D]').astype('datetime64[ns]')},
+                         index=users.rename('user_id'))
+    return pd.concat([daily, new], ignore_index=True), state
+
+
+def rollup(daily, freq='M'):
+    """Purchase counts and quantities per calendar period, from the daily rows
+
+    Distinct users do not add up across days; monthly and yearly uniques
+    stay in monthly_sales / yearly_stats.
+    """
+    periods = daily['day'].dt.to_period(freq)
+    starts = np.flatnonzero(np.r_[True, periods.to_numpy()[1:] != periods.to_numpy()[:-1]])
+    return pd.DataFrame({
+        'period': periods.iloc[starts].to_numpy(),
+        'days': np.diff(np.r_[starts, len(daily)]),
+        'purchase_count': np.add.reduceat(daily['purchase_count'].to_numpy(), starts),
+        'total_quantity': np.add.reduceat(daily['total_quantity'].to_numpy(), starts),
+    })
+
+
+# ============================================
+# Pipeline phase
+# ============================================
+def timeseries_phase(inputs, params):
+    print("\n[Time Series] Daily Rolling Metrics")
+    print("-" * 70)
+    daily, state = build_daily(inputs['trade_clean'], params['windows'])
+    print(f"  {len(daily):,} days from {daily['day'].iloc[0].date()} to {daily['day'].iloc[-1].date()}, "
+          f"windows: {', '.join(f'{w}d' for w in params['windows'])}")
+    print(daily.tail(3).to_string(index=False))
+    return {'daily_sales': daily, 'daily_user_state': state}
+
+
+def _latest(store):
+    """(daily, state, log): the appended series if it extends the current daily_sales"""
+    from pipeline import file_digest
+
+    base = file_digest(store.path('daily_sales'))
+    log = {'base': base, 'applied': []}
+    path = store.processed_dir / APPEND_LOG
+    if path.exists():
+        with open(path, encoding='utf-8') as f:
+            previous = json.load(f)
+        if previous['base'] == base and store.exists('daily_sales_latest'):
+            return store.load('daily_sales_latest'), store.load('daily_user_state_latest'), previous
+        if previous['applied']:
+            print(f"daily_sales was rebuilt since the last append; {len(previous['applied'])} "
+                  f"delta file(s) appended before must be applied again")
+    return store.load('daily_sales'), None, log
+
+
+def main(argv=None):
+    from analysis import CLEAN_PARAMS, DATA_OUTPUT, DATA_PROCESSED, DATA_RAW
+    from incremental import load_delta
+    from pipeline import file_digest
+    from storage import ArtifactStore, FORMATS
+
+    parser = argparse.ArgumentParser(description="Daily sales with rolling windows")
+    parser.add_argument('command', nargs='?', choices=['show', 'append'], default='show')
+    parser.add_argument('delta', nargs='?', help="append: delta CSV of new trades (raw trade format)")
+    parser.add_argument('--days', type=int, default=30, help="show: trailing days to print")
+    parser.add_argument('--rollup', choices=list(ROLLUPS), help="show: calendar totals instead of days")
+    parser.add_argument('--force', action='store_true', help="append: apply a delta even if it was applied before")
+    parser.add_argument('--processed-dir', default=DATA_PROCESSED)
+    parser.add_argument('--format', choices=FORMATS)
+    args = parser.parse_args(argv)
+
+    store = ArtifactStore(DATA_RAW, args.processed_dir, DATA_OUTPUT, fmt=args.format)
+    if not store.exists('daily_sales'):
+        raise SystemExit("No daily series yet. Build it first: python src/analysis.py timeseries")
+    daily, state, log = _latest(store)
+
+    if args.command == 'append':
+        if args.delta is None:
+            raise SystemExit("append needs a delta file")
+        digest = file_digest(args.delta)
+        if digest in (entry['sha256'] for entry in log['applied']) and not args.force:
+            raise SystemExit(f"{args.delta} was already appended (use --force to append it again)")
+        windows = sorted(int(col.split('_')[-1][:-1]) for col in daily if col.startswith('purchase_count_'))
+        delta = load_delta(args.delta, CLEAN_PARAMS)
+        try:
+            daily, state = append_days(daily, state if state is not None else store.load('daily_user_state'),
+                                       delta, windows)
+        except ValueError as exc:
+            raise SystemExit(str(exc))
+        store.save('daily_sales_latest', daily)
+        store.save('daily_user_state_latest', state)
+        log['applied'].append({'file': str(args.delta), 'sha256': digest, 'trades': int(len(delta))})
+        with open(store.processed_dir / APPEND_LOG, 'w', encoding='utf-8') as f:
+            json.dump(log, f, indent=2)
+        print(f"Appended {len(delta):,} trades; series now ends on {daily['day'].iloc[-1].date()} "
+              f"({store.path('daily_sales_latest')})")
+        return
+
+    with pd.option_context('display.width', 200, 'display.max_columns', 20):
+        if args.rollup:
+            print(rollup(daily, ROLLUPS[args.rollup]).to_string(index=False))
+        else:
+            print(daily.tail(args.days).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
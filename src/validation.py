@@ -0,0 +1,237 @@
+"""
+Validation of the raw baby and trade tables
+Runs right after loading, before anything is encoded or merged. Every check
+is a boolean mask over the whole column, computed once:
+
+  - schema      the expected columns are present (a missing column is an
+                error for the whole file, not for a row)
+  - ids         user_id / auction_id present and matching `id_patterns`;
+                tested once per distinct value (pd.factorize), not per row
+  - dates       day / birthday parse as yyyymmdd and fall within
+                [min_date, max_date]
+  - values      category, cat, buy_mount and gender are integers in range
+  - integrity   one baby record per user, and every trade's user has one
+                (an orphan trade has no baby age, which the merge cannot
+                represent)
+
+Rows failing any check are not kept and do not abort the load: they go to the
+`quarantine` table with their raw values, the source table, their row number
+in the raw file and every failed check as ';'-joined reason codes (e.g.
+'day_invalid;buy_mount_out_of_range').
+
+    python src/validation.py              # validation overhead vs reading the CSVs
+    python src/validation.py --scale 20   # same, with the trade history replicated 20x
+"""
+import argparse
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from storage import raw_path, read_raw
+
+VALIDATION_PARAMS = {
+    'id_patterns': {'user_id': r'(user_)?\d+', 'auction_id': r'(auction_)?\d+'},
+    'min_date': '2000-01-01',
+    'max_date': '2030-12-31',
+    'genders': [0, 1, 2],
+}
+BABY_COLUMNS = ['user_id', 'birthday', 'gender']
+TRADE_COLUMNS = ['user_id', 'auction_id', 'category', 'cat', 'property', 'buy_mount', 'day']
+QUARANTINE = 'quarantine'
+
+
+def check_schema(df, columns, source):
+    missing = [col for col in columns if col not in df]
+    if missing:
+        raise ValueError(f"{source}: missing column(s) {', '.join(missing)} "
+                         f"(expected {', '.join(columns)})")
+
+
+def per_row(codes, value_mask):
+    """Row mask from a mask over the distinct values; missing values (code -1) are True"""
+    return np.r_[np.asarray(value_mask, dtype=bool), True][codes]
+
+
+def check_ids(values, pattern=None):
+    """(codes, distinct ids, invalid row mask) of an id column
+
+    The pattern is matched once per distinct id, not once per row.
+    """
+    codes, uniques = pd.factorize(values)
+    valid = pd.Index(uniques).astype(str).str.fullmatch(pattern) if pattern else np.ones(len(uniques))
+    return codes, uniques, per_row(codes, ~np.asarray(valid, dtype=bool))
+
+
+def parse_integers(values):
+    """(int64 values, invalid mask): missing, non-numeric and fractional values are invalid"""
+    if pd.api.types.is_integer_dtype(values.dtype):
+        return values.to_numpy(dtype=np.int64), np.zeros(len(values), dtype=bool)
+    numbers = pd.to_numeric(values, errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+    invalid = ~np.isfinite(numbers) | (numbers != np.round(numbers))
+    return np.where(invalid, 0, numbers).astype(np.int64), invalid
+
+
+def parse_dates(values, min_date, max_date):
+    """(dates, invalid mask, out-of-range mask) of yyyymmdd values
+
+    Parsed once per distinct value: years of trades hold a few thousand days.
+    """
+    codes, uniques = pd.factorize(values)
+    uniques = pd.Series(uniques)
+    if pd.api.types.is_float_dtype(uniques.dtype):
+        # A column with missing days is read as float: 20120508.0
+        ints, invalid = parse_integers(uniques)
+        uniques = pd.Series(np.where(invalid, -1, ints))
+    dates = pd.to_datetime(uniques, format='%Y%m%d', errors='coerce')
+    invalid = dates.isna().to_numpy()
+    out_of_range = ~invalid & ((dates < pd.Timestamp(min_date)) | (dates > pd.Timestamp(max_date))).to_numpy()
+    dates = dates.to_numpy()
+    dates = np.concatenate([dates, np.array(['NaT'], dtype=dates.dtype)])[codes]
+    return dates, per_row(codes, invalid), np.r_[out_of_range, False][codes]
+
+
+def split(df, checks, source, columns, parsed=None):
+    """(valid rows, quarantine records) of `df` from named row masks
+
+    `parsed` maps column -> cleaned values (arrays aligned with df), written
+    over the kept rows.
+    """
+    reasons = list(checks)
+    bits = np.zeros(len(df), dtype=np.int64)
+    for i, mask in enumerate(checks.values()):
+        bits |= mask.astype(np.int64) << i
+    bad = np.flatnonzero(bits)
+
+    # One label per distinct combination of failed checks, not per row
+    combos, combo_of = np.unique(bits[bad], return_inverse=True)
+    labels = np.array([';'.join(r for i, r in enumerate(reasons) if combo >> i & 1) for combo in combos],
+                      dtype=object)
+    quarantine = pd.concat([
+        pd.DataFrame({'source': source, 'row': df.index[bad].to_numpy(dtype=np.int64),
+                      'reasons': labels[combo_of]}),
+        df[columns].iloc[bad].astype('string').reset_index(drop=True),
+    ], axis=1)
+
+    keep = np.flatnonzero(bits == 0)
+    valid = df.iloc[keep].copy()
+    for col, values in (parsed or {}).items():
+        valid[col] = values[keep]
+    return valid, quarantine
+
+
+def validate_baby(baby_df, params):
+    """(valid baby rows, quarantine records); birthday comes back parsed"""
+    check_schema(baby_df, BABY_COLUMNS, 'baby')
+    codes, _, user_invalid = check_ids(baby_df['user_id'], params['id_patterns'].get('user_id'))
+    birthday, birthday_invalid, birthday_range = parse_dates(baby_df['birthday'],
+                                                             params['min_date'], params['max_date'])
+    gender, gender_invalid = parse_integers(baby_df['gender'])
+
+    gender_invalid |= ~np.isin(gender, params['genders'])
+
+    # Every occurrence of a user after the first, among the otherwise valid rows
+    ok = np.flatnonzero(~(user_invalid | birthday_invalid | birthday_range | gender_invalid))
+    duplicate = np.zeros(len(codes), dtype=bool)
+    duplicate[ok] = True
+    duplicate[ok[np.unique(codes[ok], return_index=True)[1]]] = False
+
+    checks = {
+        'user_id_invalid': user_invalid,
+        'user_id_duplicate': duplicate,
+        'birthday_invalid': birthday_invalid,
+        'birthday_out_of_range': birthday_range,
+        'gender_invalid': gender_invalid,
+    }
+    return split(baby_df, checks, 'baby', BABY_COLUMNS, parsed={'birthday': birthday, 'gender': gender})
+
+
+def validate_trades(trade_df, params, users=None):
+    """(valid trades, quarantine records); day comes back parsed
+
+    `users` are the valid baby user ids; without them (e.g. for a delta
+    file) the referential check is skipped.
+    """
+    check_schema(trade_df, TRADE_COLUMNS, 'trade')
+    patterns = params['id_patterns']
+    user_codes, user_ids, user_invalid = check_ids(trade_df['user_id'], patterns.get('user_id'))
+    _, _, auction_invalid = check_ids(trade_df['auction_id'], patterns.get('auction_id'))
+    day, day_invalid, day_range = parse_dates(trade_df['day'], params['min_date'], params['max_date'])
+    checks = {
+        'user_id_invalid': user_invalid,
+        'auction_id_invalid': auction_invalid,
+        'day_invalid': day_invalid,
+        'day_out_of_range': day_range,
+    }
+    parsed = {'day': day}
+    for col, low in [('category', 0), ('cat', 0), ('buy_mount', 1)]:
+        parsed[col], invalid = parse_integers(trade_df[col])
+        checks[f'{col}_invalid'] = invalid
+        checks[f'{col}_out_of_range'] = ~invalid & (parsed[col] < low)
+    if users is not None:
+        checks['user_id_unknown'] = ~user_invalid & per_row(user_codes, ~pd.Index(user_ids).isin(users))
+    return split(trade_df, checks, 'trade', TRADE_COLUMNS, parsed=parsed)
+
+
+def summarize(quarantine):
+    """Quarantined rows per source and reason code (a row can count for several reasons)"""
+    reasons = quarantine.assign(reason=quarantine['reasons'].str.split(';')).explode('reason')
+    return reasons.groupby(['source', 'reason']).size().rename('rows').reset_index()
+
+
+# ============================================
+# Benchmark
+# ============================================
+def _timed(func, repeat=3):
+    best, result = float('inf'), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def benchmark(baby_path, trade_path, params, scale=1, repeat=3):
+    """Seconds to read the raw tables vs to validate them, and the overhead"""
+    read_s, (baby_df, trade_df) = _timed(lambda: (read_raw(baby_path), read_raw(trade_path)), repeat)
+    if scale > 1:
+        trade_df = pd.concat([trade_df] * scale, ignore_index=True)
+        read_s *= scale
+
+    def validate():
+        babies, _ = validate_baby(baby_df, params)
+        return validate_trades(trade_df, params, users=babies['user_id'])
+
+    validate_s, (_, quarantine) = _timed(validate, repeat)
+    # What loading cost before: the date parsing validation now does itself
+    parse_s, _ = _timed(lambda: (pd.to_datetime(baby_df['birthday'], format='%Y%m%d'),
+                                 pd.to_datetime(trade_df['day'], format='%Y%m%d')), repeat)
+    return pd.DataFrame([{
+        'trades': len(trade_df),
+        'read_s': read_s,
+        'validate_s': validate_s,
+        'replaces_parse_s': parse_s,
+        'net_overhead': (validate_s - parse_s) / read_s,
+        'quarantined': len(quarantine),
+    }])
+
+
+def main(argv=None):
+    from analysis import CLEAN_PARAMS, DATA_RAW
+
+    parser = argparse.ArgumentParser(description="Benchmark the validation of the raw tables")
+    parser.add_argument('--raw-dir', default=DATA_RAW)
+    parser.add_argument('--scale', type=int, default=1, help="replicate the trade history N times")
+    parser.add_argument('--repeat', type=int, default=3, help="timing repetitions (best is reported)")
+    args = parser.parse_args(argv)
+
+    raw_dir = Path(args.raw_dir)
+    result = benchmark(raw_path(raw_dir / "tianchi_mum_baby.csv"),
+                       raw_path(raw_dir / "tianchi_mum_baby_trade_history.csv"),
+                       CLEAN_PARAMS, args.scale, args.repeat)
+    print(result.round(4).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()